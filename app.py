@@ -1,14 +1,38 @@
 from flask import (
     Flask, render_template, request, redirect, url_for, flash, session, 
-    jsonify)
+    jsonify, Response, g, make_response, message_flashed)
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from psycopg2.extras import RealDictCursor
 from functools import wraps
 from flask_wtf.csrf import CSRFProtect
+from werkzeug.http import is_resource_modified
+import gzip
+import hashlib
+import os
+import click
+from cache import FileGeneration, TTLCache
+from notification_stream import NotificationBroker, TooManySubscribers, sse_stream
+from batch_drainer import BatchDrainer
+from dashboard_metrics import MetricsSnapshot
+from sql_instrumentation import current_request_stats
+import io
+import time
+from datetime import date, timedelta
+from product_import import IMPORT_FIELDS, detect_format, import_products
 from database import (
     get_products, get_orders, create_order, process_order, user_login, 
-    get_db_connection, get_suppliers, add_supplier_to_db, 
-    get_user_notifications, get_unread_notification_count, mark_notification_as_read,create_notification
+    connect, get_db_connection, get_suppliers, add_supplier_to_db, release_db_connection, get_pool,
+    get_user_notifications, get_unread_notification_count, mark_notification_as_read, create_notification,
+    create_notifications, get_user_ids_by_role, mark_all_notifications_as_read,
+    get_transactions_page, get_audit_log_page, run_audit_log_maintenance,
+    search_products, product_typeahead, PRODUCT_COLUMNS, PRODUCT_SORT_COLUMNS,
+    create_orders_batch, process_orders_batch,
+    get_sales_report, refresh_sales_rollup, sales_report_cache,
+    AUDIT_MODE, flush_audit_queue, get_audit_queue_depth, get_dashboard_metrics,
+    sql_instrumentation, metrics_registry, ORDERS_CREATED, ORDER_FAILURES,
+    get_order_details, get_supplier_products, get_notification_summary,
+    get_table_versions, CACHE_DIR, apply_notification_counter_deltas, compact_table_changes,
+    apply_supplier_stat_deltas, get_background_queue_depths
 )
 
 app = Flask(__name__)
@@ -18,6 +42,183 @@ csrf = CSRFProtect(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
+# Return each request's pooled DB connection when the app context ends
+app.teardown_appcontext(release_db_connection)
+# Relays pg_notify events from the notifications table to SSE clients. Each
+# open stream holds a request thread, so streams are capped per process (by
+# default at half of IMS_THREADS) and browsers over the cap fall back to polling.
+notification_broker = NotificationBroker(
+    connect, max_subscribers=int(os.environ.get(
+        'IMS_SSE_MAX_STREAMS', max(1, int(os.environ.get('IMS_THREADS', 8)) // 2))) or None)
+SSE_HEARTBEAT_SECONDS = float(os.environ.get('IMS_SSE_HEARTBEAT', 20))
+
+# Background drainers. Importing this module starts none of them, so CLI
+# commands, tests and the gunicorn master do not run them; see
+# start_background_jobs().
+# Moves audit_log_queue into audit_log (IMS_AUDIT_MODE=async only)
+audit_flusher = BatchDrainer(
+    flush_audit_queue, 'audit-flusher',
+    interval=float(os.environ.get('IMS_AUDIT_FLUSH_INTERVAL', 1)),
+    batch_size=int(os.environ.get('IMS_AUDIT_FLUSH_BATCH', 5000)),
+)
+# Folds pending unread-count deltas into notification_counters (see ims_sql.sql)
+notification_counter_flusher = BatchDrainer(
+    apply_notification_counter_deltas, 'notification-counter-flusher',
+    interval=float(os.environ.get('IMS_NOTIFICATION_COUNTER_INTERVAL', 2)),
+)
+# Folds pending supplier_stat_deltas into supplier_stats (see ims_sql.sql)
+supplier_stats_flusher = BatchDrainer(
+    apply_supplier_stat_deltas, 'supplier-stats-flusher',
+    interval=float(os.environ.get('IMS_SUPPLIER_STATS_INTERVAL', 5)),
+)
+# Folds the table_changes log behind the HTTP validators into table_versions
+table_changes_compactor = BatchDrainer(
+    compact_table_changes, 'table-changes-compactor',
+    interval=float(os.environ.get('IMS_TABLE_CHANGES_INTERVAL', 5)),
+)
+
+def background_jobs():
+    """The drainers a serving process runs; the audit flusher only in async mode."""
+    jobs = [notification_counter_flusher, supplier_stats_flusher, table_changes_compactor]
+    if AUDIT_MODE == 'async':
+        jobs.insert(0, audit_flusher)
+    return jobs
+
+def start_background_jobs():
+    """Start this process's background drainers.
+
+    Called by wsgi.init_worker() in each gunicorn worker and by the
+    development server below.
+    """
+    for job in background_jobs():
+        job.start()
+
+def stop_background_jobs(drain=False):
+    """Stop this process's background drainers; ``drain`` empties their queues first."""
+    for job in background_jobs():
+        job.stop(drain=drain)
+
+# Alert when a job stops draining: its last success falls behind, or it is
+# absent because no process runs it (see README, "Background jobs")
+BACKGROUND_JOB_ROWS = metrics_registry.counter(
+    'ims_background_job_rows_total', 'Queue rows drained by background jobs', ('job',))
+BACKGROUND_JOB_FAILURES = metrics_registry.counter(
+    'ims_background_job_failures_total', 'Background job batches that failed', ('job',))
+BACKGROUND_JOB_LAST_SUCCESS = metrics_registry.gauge(
+    'ims_background_job_last_success_timestamp_seconds',
+    'Unix time of the last batch a background job drained without error', ('job',),
+    aggregate='max')
+
+def _collect_background_job_metrics():
+    for job in background_jobs():
+        stats = job.stats()
+        if not (stats['running'] or stats['batches']):
+            continue
+        BACKGROUND_JOB_ROWS.set(stats['rows_drained'], job=job.name)
+        BACKGROUND_JOB_FAILURES.set(stats['failures'], job=job.name)
+        if stats['last_drain_at'] is not None:
+            BACKGROUND_JOB_LAST_SUCCESS.set(stats['last_drain_at'], job=job.name)
+
+metrics_registry.add_collector(_collect_background_job_metrics)
+
+# Dashboard KPIs, refreshed in the background and never older than
+# IMS_DASHBOARD_MAX_AGE seconds when served
+dashboard_metrics = MetricsSnapshot(
+    get_dashboard_metrics,
+    max_age=float(os.environ.get('IMS_DASHBOARD_MAX_AGE', 30)),
+    refresh_interval=float(os.environ.get('IMS_DASHBOARD_REFRESH', 0)) or None,
+)
+
+# Request metrics for /metrics
+REQUEST_LATENCY = metrics_registry.histogram(
+    'ims_http_request_duration_seconds', 'Time to produce a response, by endpoint',
+    ('endpoint', 'method'))
+REQUESTS = metrics_registry.counter(
+    'ims_http_requests_total', 'Responses by endpoint and status', ('endpoint', 'method', 'status'))
+REQUESTS_IN_FLIGHT = metrics_registry.gauge(
+    'ims_http_requests_in_flight', 'Requests currently being handled')
+METRICS_TOKEN = os.environ.get('IMS_METRICS_TOKEN')
+
+def _record_request(status):
+    if g.pop('_metrics_recorded', True):
+        return
+    endpoint = request.endpoint or '<unmatched>'
+    REQUEST_LATENCY.observe(time.perf_counter() - g._request_started,
+                            endpoint=endpoint, method=request.method)
+    REQUESTS.inc(endpoint=endpoint, method=request.method, status=status)
+
+# Per-request SQL statistics: a Server-Timing header on every response, route
+# and statement histograms at /api/admin/sql-stats
+def begin_request_stats():
+    g._request_started = time.perf_counter()
+    g._metrics_recorded = False
+    REQUESTS_IN_FLIGHT.inc()
+    if sql_instrumentation is not None:
+        rule = request.url_rule.rule if request.url_rule else '<unmatched>'
+        g._sql_stats_token = sql_instrumentation.begin_request(f'{request.method} {rule}')
+
+# Run ahead of CSRFProtect's hook so that rejected requests are counted too
+app.before_request_funcs.setdefault(None, []).insert(0, begin_request_stats)
+
+@app.after_request
+def add_server_timing(response):
+    timings = []
+    stats = current_request_stats()
+    if stats is not None:
+        timings.append(f'db;dur={stats.db_time:.1f};desc="{stats.queries} queries"')
+        if stats.queries:
+            timings.append(f'db-slowest;dur={stats.slowest_ms:.1f}')
+    conn = g.get('_db_conn')
+    if conn is not None and not conn.closed:
+        timings.append(f'db-conn;dur={conn.held_for * 1000:.1f}')
+    if '_request_started' in g:
+        timings.append(f'app;dur={(time.perf_counter() - g._request_started) * 1000:.1f}')
+    if timings:
+        response.headers['Server-Timing'] = ', '.join(timings)
+    _record_request(response.status_code)
+    return response
+
+@app.teardown_request
+def end_request_stats(exc=None):
+    if '_request_started' in g:
+        REQUESTS_IN_FLIGHT.dec()
+        # after_request does not run when the view raised
+        _record_request(500)
+    token = g.pop('_sql_stats_token', None)
+    if token is not None:
+        sql_instrumentation.end_request(token)
+
+# gzip for text responses of at least IMS_GZIP_MIN_SIZE bytes. Set IMS_GZIP=0
+# when a proxy in front of the app compresses instead.
+GZIP_ENABLED = os.environ.get('IMS_GZIP', '1') != '0'
+GZIP_MIN_SIZE = int(os.environ.get('IMS_GZIP_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.environ.get('IMS_GZIP_LEVEL', 6))
+COMPRESSIBLE_MIMETYPES = {'text/html', 'text/plain', 'text/css', 'text/csv',
+                          'text/javascript', 'application/javascript', 'application/json'}
+
+@app.after_request
+def compress_response(response):
+    # Streamed responses (the SSE stream) and files served as-is are left alone
+    if (not GZIP_ENABLED or response.status_code != 200 or response.direct_passthrough
+            or response.is_streamed or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    if 'gzip' not in request.accept_encodings:
+        return response
+    data = response.get_data()
+    if len(data) < GZIP_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=GZIP_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def _dashboard_metrics_or_none():
+    try:
+        return dashboard_metrics.get()
+    except Exception as e:
+        flash(f'Error loading dashboard metrics: {str(e)}', 'danger')
+        return None
 
 # Role requirements
 def role_required(*roles):
@@ -33,6 +234,64 @@ def role_required(*roles):
         return decorated_view
     return decorator
 
+# HTTP validators for read-only views, from the table_versions counters
+def _validator_parts(tables, page):
+    versions = get_table_versions(tables)
+    parts = [request.full_path, date.today().isoformat(), current_user.get_id(),
+             getattr(current_user, 'role', None)]
+    parts += [(t, *versions.get(t, (None, None))) for t in sorted(tables)]
+    if page:
+        # Pages extending base.html embed the user's notifications and a CSRF
+        # token; the token's time limit bounds how long a page can be reused
+        csrf_limit = app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+        parts += [notification_summary(), session.get('csrf_token'),
+                  int(time.time() // (csrf_limit / 2)) if csrf_limit else None]
+    last_modified = max((v[1] for v in versions.values()), default=None)
+    return parts, last_modified
+
+@message_flashed.connect_via(app)
+def _note_flash(sender, **extra):
+    # A page that shows a one-off message must not be answered with 304 later
+    g._flashed = True
+
+def conditional_get(*tables, page=True):
+    """Answer a repeated GET with 304 Not Modified while ``tables`` are unchanged.
+
+    The ETag covers the versions of ``tables`` (see table_versions in
+    ims_sql.sql) and the URL, date and user; with ``page`` also the navbar
+    notifications and CSRF token. JSON views (``page=False``) get a
+    Last-Modified header too. Requests with pending flash messages, and
+    responses that are not a 200 or that flashed a message, get no validator.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_view(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return f(*args, **kwargs)
+            try:
+                parts, last_modified = _validator_parts(tables, page)
+            except Exception:
+                app.logger.exception('Could not compute the ETag for %s', request.path)
+                return f(*args, **kwargs)
+            etag = hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+            if page:
+                last_modified = None
+            if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200 or g.get('_flashed'):
+                    return response
+            else:
+                response = app.response_class(status=304)
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            # Browsers may keep the page but must revalidate it; proxies must not keep it
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return decorated_view
+    return decorator
+
 # User model
 class User(UserMixin):
     def __init__(self, user_id, username, role):
@@ -40,11 +299,22 @@ class User(UserMixin):
         self.username = username
         self.role = role
 
-@login_manager.user_loader
-def load_user(user_id):
+# Authenticated requests resolve the session's user from this cache instead
+# of querying the users table every time. Call invalidate_user() after any
+# write that changes a user's username, role or is_active flag; with
+# IMS_CACHE_DIR set, that reaches every worker process (see supplier_cache).
+user_cache = TTLCache(maxsize=int(os.environ.get('IMS_USER_CACHE_SIZE', 1024)),
+                      ttl=float(os.environ.get('IMS_USER_CACHE_TTL', 300)),
+                      generation=FileGeneration(os.path.join(CACHE_DIR, 'users.gen')) if CACHE_DIR else None)
+
+def invalidate_user(user_id):
+    user_cache.invalidate(int(user_id))
+
+def _fetch_user(user_id):
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("SELECT user_id, username, role FROM users WHERE user_id = %s", (user_id,))
+    # Deactivated users resolve to None, which logs them out
+    cur.execute("SELECT user_id, username, role FROM users WHERE user_id = %s AND is_active = TRUE", (user_id,))
     user_data = cur.fetchone()
     cur.close()
     conn.close()
@@ -52,6 +322,14 @@ def load_user(user_id):
         return User(user_data[0], user_data[1], user_data[2])
     return None
 
+@login_manager.user_loader
+def load_user(user_id):
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    return user_cache.get_or_load(user_id, lambda: _fetch_user(user_id))
+
 # Routes
 @app.route('/')
 @login_required
@@ -66,38 +344,63 @@ def index():
 @login_required
 @role_required('Admin')
 def admin_dashboard():
-    user_count = 0
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM users")
-        user_count = cur.fetchone()[0]
-        cur.close()
-        conn.close()
-    except Exception as e:
-        flash(f'Error loading user count: {str(e)}', 'danger')
-    return render_template('admin_dashboard.html', user_count=user_count)
+    return render_template('admin_dashboard.html', metrics=_dashboard_metrics_or_none())
 
 @app.route('/inventory/dashboard')
 @login_required
 @role_required('InventoryManager')
 def inventory_dashboard():
-    return render_template('inventory_dashboard.html')
+    return render_template('inventory_dashboard.html', metrics=_dashboard_metrics_or_none())
+
+@app.route('/api/dashboard/metrics')
+@login_required
+@role_required('Admin', 'InventoryManager')
+def dashboard_metrics_api():
+    try:
+        return jsonify(dashboard_metrics.get())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+PRODUCTS_PER_PAGE = 50
 
 @app.route('/products')
 @login_required
+@conditional_get('products')
 def products():
+    search = request.args.get('q', '').strip()
+    sort = request.args.get('sort', 'name')
+    if sort not in PRODUCT_SORT_COLUMNS:
+        sort = 'name'
+    descending = request.args.get('dir') == 'desc'
+    page = max(request.args.get('page', default=1, type=int), 1)
     try:
-        products = get_products()
-        if not products:
+        products, has_more = search_products(search or None, sort, descending,
+                                             limit=PRODUCTS_PER_PAGE,
+                                             offset=(page - 1) * PRODUCTS_PER_PAGE)
+        if not products and not search and page == 1:
             flash('No products found in the database.', 'warning')
         return render_template('products.html', 
                              products=products,
+                             search=search, sort=sort, descending=descending,
+                             page=page, has_more=has_more,
                              can_edit=current_user.role in ['Admin', 'InventoryManager'])  # Explicit role check
     except Exception as e:
         flash(f'Error loading products: {str(e)}', 'danger')
         return redirect(url_for('admin_dashboard' if current_user.role == 'Admin' else 'inventory_dashboard'))
 
+@app.route('/api/products/search')
+@login_required
+@conditional_get('products', 'product_reservations', page=False)
+def product_search_api():
+    prefix = request.args.get('q', '').strip()
+    if not prefix:
+        return jsonify([])
+    try:
+        limit = max(1, min(request.args.get('limit', default=10, type=int), 50))
+        return jsonify(product_typeahead(prefix, limit=limit))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -143,13 +446,14 @@ def edit_product(product_id):
             conn.commit()
             flash('Product updated successfully!', 'success')
             return redirect(url_for('products'))
-        cur.execute("SELECT * FROM products WHERE product_id = %s AND is_deleted = FALSE", (product_id,))
+        # edit_product.html reads the row by position
+        cur.execute(f"SELECT {PRODUCT_COLUMNS} FROM products WHERE product_id = %s AND is_deleted = FALSE",
+                    (product_id,))
         product = cur.fetchone()
         if not product:
             flash('Product not found!', 'danger')
             return redirect(url_for('products'))
-        cur.execute("SELECT supplier_id, supplier_name FROM suppliers")
-        suppliers = cur.fetchall()
+        suppliers = get_suppliers()
     except Exception as e:
         conn.rollback()
         flash(f'Error updating product: {str(e)}', 'danger')
@@ -176,7 +480,10 @@ from database import get_db_connection
 @role_required('Sales', 'Admin')
 def create_new_order():
     if request.method == 'POST':
-        product_id = request.form['product_id']
+        product_id = request.form.get('product_id')
+        if not product_id:
+            flash('Please choose a product from the list.', 'danger')
+            return redirect(url_for('create_new_order'))
         try:
             quantity = int(request.form['quantity'])
             if quantity <= 0:
@@ -198,34 +505,30 @@ def create_new_order():
             
             product_name = product[0]
             
-            # Create the order
+            # Create the order; the CALL returns its INOUT (order_id, status)
             cur.execute("CALL create_order(%s, %s, %s, %s, %s, %s)", 
                        (product_id, quantity, added_by, notes, None, None))
-            conn.commit()
-            
-            # Get the created order ID
-            cur.execute("SELECT lastval()")  # More reliable way to get the last inserted ID
             order_id = cur.fetchone()[0]
             
-            # Notify inventory managers
-            cur.execute("SELECT user_id FROM users WHERE role = 'InventoryManager'")
-            managers = cur.fetchall()
-            for (manager_id,) in managers:
-                create_notification(
-                    user_id=manager_id,
-                    message=f"New order #{order_id} for {product_name} (Qty: {quantity})",
-                    notification_type="OrderCreated",
-                    related_entity_type="order",
-                    related_entity_id=order_id
-                )
+            # Notify inventory managers in the same transaction, one INSERT for all of them
+            create_notifications(
+                get_user_ids_by_role('InventoryManager', conn=conn),
+                message=f"New order #{order_id} for {product_name} (Qty: {quantity})",
+                notification_type="OrderCreated",
+                related_entity_type="order",
+                related_entity_id=order_id,
+                conn=conn
+            )
             
-            conn.commit()  # Commit the notifications
+            conn.commit()
+            ORDERS_CREATED.inc(channel='form')
             flash('Order created and notifications sent!', 'success')
             return redirect(url_for('orders'))
             
         except Exception as e:
             if 'conn' in locals():
                 conn.rollback()
+            ORDER_FAILURES.inc(operation='create')
             flash(f'Error creating order: {str(e)}', 'danger')
             return redirect(url_for('create_new_order'))
         finally:
@@ -234,31 +537,184 @@ def create_new_order():
             if 'conn' in locals():
                 conn.close()
     
-    products = get_products()
-    return render_template('create_order.html', products=products)
+    # Products are looked up through /api/products/search as the user types
+    return render_template('create_order.html')
+
+ORDER_BATCH_MAX = int(os.environ.get('IMS_ORDER_BATCH_MAX', 1000))
+
+def _batch_payload():
+    """The "orders" list of a batch API request, or raise ValueError."""
+    payload = request.get_json(silent=True) or {}
+    items = payload.get('orders')
+    if not isinstance(items, list) or not items:
+        raise ValueError('Request body must be {"orders": [...]} with at least one item')
+    if len(items) > ORDER_BATCH_MAX:
+        raise ValueError(f'At most {ORDER_BATCH_MAX} orders per batch')
+    return items
+
+def _batch_summary(results):
+    failed = sum(1 for r in results if r['error'])
+    return {'results': results, 'succeeded': len(results) - failed, 'failed': failed}
+
+@app.route('/api/orders/batch', methods=['POST'])
+@login_required
+@role_required('Sales', 'Admin')
+def create_orders_batch_api():
+    try:
+        results = create_orders_batch(_batch_payload(), current_user.id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    order_ids = [r['order_id'] for r in results if r['order_id']]
+    if order_ids:
+        try:
+            # One summary per manager rather than one notification per order
+            create_notifications(
+                get_user_ids_by_role('InventoryManager'),
+                message=f"{len(order_ids)} new order(s) from {current_user.username} "
+                        f"(#{order_ids[0]}-#{order_ids[-1]})",
+                notification_type="OrderCreated",
+                related_entity_type="order" if len(order_ids) == 1 else None,
+                related_entity_id=order_ids[0] if len(order_ids) == 1 else None
+            )
+        except Exception as e:
+            app.logger.warning('Batch order notifications failed: %s', e)
+    return jsonify(_batch_summary(results))
+
+@app.route('/api/orders/process-batch', methods=['POST'])
+@login_required
+@role_required('Admin', 'InventoryManager')
+def process_orders_batch_api():
+    try:
+        results = process_orders_batch(_batch_payload(), current_user.id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify(_batch_summary(results))
+
+@app.route('/orders/process-batch', methods=['POST'])
+@login_required
+@role_required('Admin', 'InventoryManager')
+def process_orders_batch_form():
+    order_ids = request.form.getlist('order_ids', type=int)
+    status = request.form.get('status')
+    notes = request.form.get('notes') or None
+    if not order_ids:
+        flash('Select at least one order to process.', 'warning')
+        return redirect(url_for('orders'))
+    try:
+        results = process_orders_batch(
+            [{'order_id': order_id, 'status': status, 'notes': notes} for order_id in order_ids],
+            current_user.id)
+        summary = _batch_summary(results)
+        flash(f"{summary['succeeded']} order(s) set to {status}.", 'success')
+        for r in results:
+            if r['error']:
+                flash(f"Order #{r['order_id']}: {r['error']}", 'danger')
+    except Exception as e:
+        flash(f'Error processing orders: {str(e)}', 'danger')
+    return redirect(url_for('orders'))
+
+AUDIT_TABLES = ['products', 'orders', 'transactions', 'users']
+AUDIT_ACTIONS = ['INSERT', 'UPDATE', 'DELETE', 'ERROR', 'LOGIN', 'LOGOUT']
 
 @app.route('/audit_log')
 @login_required
 @role_required('Admin')
 def audit_log():
-    from database import get_db_connection
-    conn = get_db_connection()
-    cur = conn.cursor()
+    filters = {
+        'table_name': request.args.get('table_name') or None,
+        'action': request.args.get('action') or None,
+        'changed_by': request.args.get('changed_by') or None,
+        'start_time': request.args.get('start_time') or None,
+        'end_time': request.args.get('end_time') or None,
+    }
+    next_cursor = None
     try:
-        cur.execute("""
-            SELECT al.log_id, al.table_name, al.action, al.created_at, u.role
-            FROM audit_log al
-            LEFT JOIN users u ON al.changed_by = u.user_id
-            ORDER BY al.created_at DESC
-        """)
-        logs = cur.fetchall()
+        logs, next_cursor = get_audit_log_page(
+            limit=_page_limit(), cursor=request.args.get('cursor'), **filters)
     except Exception as e:
         flash(f'Error fetching audit logs: {str(e)}', 'danger')
         logs = []
+    filter_args = {k: v for k, v in request.args.items() if k != 'cursor' and v}
+    return render_template('audit_log.html', logs=logs, next_cursor=next_cursor,
+                           filters=filter_args, audit_tables=AUDIT_TABLES,
+                           audit_actions=AUDIT_ACTIONS)
+
+@app.cli.command('audit-log-maintenance')
+@click.option('--months-ahead', default=3, show_default=True,
+              help='Future monthly partitions to create.')
+@click.option('--retain-months', default=12, show_default=True,
+              help='Months of audit history to keep attached.')
+@click.option('--keep-detached', is_flag=True,
+              help='Detach expired partitions without dropping them.')
+def audit_log_maintenance_command(months_ahead, retain_months, keep_detached):
+    """Create upcoming audit_log partitions and retire expired ones."""
+    partitions = run_audit_log_maintenance(months_ahead, retain_months, drop=not keep_detached)
+    click.echo('Audit log partitions ready: ' + ', '.join(partitions))
+
+@app.cli.command('flush-audit-queue')
+def flush_audit_queue_command():
+    """Write every queued (async mode) audit event into audit_log."""
+    click.echo(f'Flushed {audit_flusher.drain_all()} audit events')
+
+@app.cli.command('run-background-jobs')
+@click.option('--once', is_flag=True,
+              help='Drain every queue once and exit, e.g. from cron.')
+def run_background_jobs_command(once):
+    """Run the background drainers in this process until interrupted.
+
+    For deployments that set IMS_BACKGROUND_JOBS=0 on the web workers.
+    """
+    if once:
+        for job in background_jobs():
+            click.echo(f'{job.name}: {job.drain_all()} rows')
+        return
+    start_background_jobs()
+    click.echo('Running ' + ', '.join(job.name for job in background_jobs()))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
     finally:
-        cur.close()
-        conn.close()
-    return render_template('audit_log.html', logs=logs)
+        stop_background_jobs()
+
+@app.cli.command('refresh-sales-rollup')
+@click.option('--start-date', type=click.DateTime(formats=['%Y-%m-%d']),
+              help='First day to rebuild (default: all history).')
+@click.option('--end-date', type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Last day to rebuild (default: all history).')
+def refresh_sales_rollup_command(start_date, end_date):
+    """Rebuild the daily sales rollup from the transactions ledger."""
+    rows = refresh_sales_rollup(start_date and start_date.date(), end_date and end_date.date())
+    click.echo(f'Sales rollup rebuilt: {rows} product-day rows')
+
+@app.route('/api/reports/sales')
+@login_required
+@role_required('Admin')
+@conditional_get('sales_daily_rollup', 'products', page=False)
+def sales_report_api():
+    try:
+        end_date = date.fromisoformat(request.args['end_date']) \
+            if request.args.get('end_date') else date.today()
+        start_date = date.fromisoformat(request.args['start_date']) \
+            if request.args.get('start_date') else end_date - timedelta(days=30)
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    if start_date > end_date:
+        return jsonify({'error': 'start_date must not be after end_date'}), 400
+    try:
+        report = get_sales_report(start_date, end_date)
+        return jsonify({
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'products': report,
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/orders/process/<int:order_id>', methods=['GET', 'POST'])
 @login_required
@@ -290,7 +746,7 @@ def users():
         users = cur.fetchall()
         cur.close()
         conn.close()
-        print(f"Debug: Fetched users - {users}")
+        app.logger.debug('Fetched %d users', len(users))
         if request.method == 'POST':
             username = request.form['username']
             password = request.form['password']
@@ -302,10 +758,13 @@ def users():
             cur.execute("""
                 INSERT INTO users (username, password, role, email, full_name, is_active)
                 VALUES (%s, crypt(%s, gen_salt('bf')), %s, %s, %s, %s)
+                RETURNING user_id
             """, (username, password, role, email, username, is_active))
+            new_user_id = cur.fetchone()[0]
             conn.commit()
             cur.close()
             conn.close()
+            invalidate_user(new_user_id)
             flash('User created successfully!', 'success')
             return redirect(url_for('users'))
         if not users:
@@ -313,7 +772,7 @@ def users():
         return render_template('users.html', users=users)
     except Exception as e:
         flash(f'Error loading users: {str(e)}', 'danger')
-        print(f"Debug: Error in /users route - {str(e)}")
+        app.logger.exception('Error in /users route')
         return redirect(url_for('admin_dashboard'))
 
 @app.route('/edit_user/<int:user_id>', methods=['GET', 'POST'])
@@ -331,7 +790,7 @@ def edit_user(user_id):
         if not user:
             flash('User not found!', 'danger')
             return redirect(url_for('users'))
-        print(f"Debug: Fetched user - {user}")  # Log the user data
+        app.logger.debug('Fetched user %s for editing', user_id)
         if request.method == 'POST':
             username = request.form.get('username', user['username'])
             role = request.form.get('role', user['role'])
@@ -355,79 +814,111 @@ def edit_user(user_id):
             conn.commit()
             cur.close()
             conn.close()
+            invalidate_user(user_id)
             flash('User updated successfully!', 'success')
             return redirect(url_for('users'))
         return render_template('edit_user.html', user=user)
     except Exception as e:
         flash(f'Error editing user: {str(e)}', 'danger')
-        print(f"Debug: Error in edit_user route - {str(e)}")  # Log the error
+        app.logger.exception('Error in edit_user route')
         return redirect(url_for('users'))
     
+TRANSACTION_TYPES = ['Sale', 'Purchase', 'Return', 'Adjustment']
+
+def _date_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a date in YYYY-MM-DD format') from None
+
+def _transaction_filters():
+    """Ledger filters from the query string, shared by the page and the JSON API.
+
+    Raises ValueError on a malformed date.
+    """
+    transaction_type = request.args.get('type') or None
+    if transaction_type not in TRANSACTION_TYPES:
+        transaction_type = None
+    return {
+        'product_id': request.args.get('product_id', type=int),
+        'transaction_type': transaction_type,
+        'start_date': _date_arg('start_date'),
+        'end_date': _date_arg('end_date'),
+        'performed_by': request.args.get('performed_by') or None,
+    }
+
+def _page_limit(default=50, maximum=200):
+    return max(1, min(request.args.get('limit', default=default, type=int), maximum))
+
 @app.route('/transactions')
 @login_required
 @role_required('Admin', 'InventoryManager')
 def transactions():
-    from database import get_db_connection
-    conn = get_db_connection()
-    cur = conn.cursor()
+    next_cursor = None
+    status = 200
     try:
-        cur.execute("""
-            SELECT t.transaction_id, t.product_id, p.product_name, t.transaction_type, t.quantity,
-                   t.total_amount, u.username AS performed_by, t.transaction_date, t.notes
-            FROM transactions t
-            LEFT JOIN products p ON t.product_id = p.product_id
-            LEFT JOIN users u ON t.performed_by = u.user_id
-            ORDER BY t.transaction_date DESC
-        """)
-        transactions = cur.fetchall()
+        transactions, next_cursor = get_transactions_page(
+            limit=_page_limit(), cursor=request.args.get('cursor'), **_transaction_filters())
+    except ValueError as e:
+        flash(str(e), 'danger')
+        transactions = []
+        status = 400
     except Exception as e:
         flash(f'Error fetching transactions: {str(e)}', 'danger')
         transactions = []
-    finally:
-        cur.close()
-        conn.close()
-    return render_template('transactions.html', transactions=transactions)
-    
+    # Query-string filters carried over to the "next page" link
+    filter_args = {k: v for k, v in request.args.items() if k != 'cursor' and v}
+    return render_template('transactions.html', transactions=transactions,
+                           next_cursor=next_cursor, filters=filter_args,
+                           transaction_types=TRANSACTION_TYPES), status
+
+@app.route('/api/transactions')
+@login_required
+@role_required('Admin', 'InventoryManager')
+@conditional_get('transactions', 'products', 'users', page=False)
+def get_transactions_api():
+    try:
+        rows, next_cursor = get_transactions_page(
+            limit=_page_limit(), cursor=request.args.get('cursor'), **_transaction_filters())
+        for row in rows:
+            if row['transaction_date']:
+                row['transaction_date'] = row['transaction_date'].isoformat()
+        return jsonify({'transactions': rows, 'next_cursor': next_cursor})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/reports')
 @login_required
 @role_required('Admin')
 def reports():
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        # Total users
-        cur.execute("SELECT COUNT(*) FROM users WHERE is_active = TRUE")
-        total_active_users = cur.fetchone()[0]
-        # Total products
-        cur.execute("SELECT COUNT(*) FROM products WHERE is_deleted = FALSE")
-        total_products = cur.fetchone()[0]
-        cur.close()
-        conn.close()
-        return render_template('reports.html', total_active_users=total_active_users, total_products=total_products)
+        metrics = dashboard_metrics.get()
+        return render_template('reports.html', metrics=metrics,
+                               total_active_users=metrics['active_users'],
+                               total_products=metrics['product_count'])
     except Exception as e:
         flash(f'Error loading reports: {str(e)}', 'danger')
         return redirect(url_for('admin_dashboard'))
 
 # Add this with your other route imports
-from database import get_suppliers, add_supplier_to_db
+from database import get_suppliers, get_supplier, get_supplier_stats, add_supplier_to_db, supplier_cache
 
 # --- Supplier Routes ---
 @app.route('/suppliers')
 @login_required
 @role_required('Admin', 'InventoryManager')
+@conditional_get('suppliers')
 def list_suppliers():
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT * FROM suppliers")
-        suppliers = cur.fetchall()
-        return render_template('suppliers.html', suppliers=suppliers)
+        return render_template('suppliers.html', suppliers=get_suppliers())
     except Exception as e:
         flash(str(e), 'danger')
         return redirect(url_for('index'))
-    finally:
-        cur.close()
-        conn.close()
 
 
 @app.route('/suppliers/add', methods=['GET', 'POST'])
@@ -466,10 +957,7 @@ def edit_supplier(supplier_id):
     
     # GET request handling
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT * FROM suppliers WHERE supplier_id = %s", (supplier_id,))
-        supplier = cur.fetchone()
+        supplier = get_supplier(supplier_id)
         if not supplier:
             flash('Supplier not found!', 'danger')
             return redirect(url_for('list_suppliers'))
@@ -477,9 +965,6 @@ def edit_supplier(supplier_id):
     except Exception as e:
         flash(f'Error loading supplier: {str(e)}', 'danger')
         return redirect(url_for('list_suppliers'))
-    finally:
-        cur.close()
-        conn.close()
 
 # Add this with your other routes
 @app.route('/suppliers/delete/<int:supplier_id>', methods=['POST'])
@@ -491,6 +976,7 @@ def delete_supplier(supplier_id):
         cur = conn.cursor()
         cur.execute("DELETE FROM suppliers WHERE supplier_id = %s", (supplier_id,))
         conn.commit()
+        supplier_cache.invalidate()
         flash('Supplier deleted', 'success')
     except Exception as e:
         flash(str(e), 'danger')
@@ -502,85 +988,48 @@ def delete_supplier(supplier_id):
 @app.route('/suppliers/<int:supplier_id>')
 @login_required
 @role_required('Admin', 'InventoryManager')
+@conditional_get('suppliers', 'products')
 def supplier_details(supplier_id):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Get supplier info
-        cur.execute("SELECT * FROM suppliers WHERE supplier_id = %s", (supplier_id,))
-        supplier = cur.fetchone()
-        
+        supplier = get_supplier(supplier_id)
         if not supplier:
             flash('Supplier not found!', 'danger')
             return redirect(url_for('list_suppliers'))
-        
-        # Get associated products
-        cur.execute("""
-            SELECT product_id, product_name, quantity 
-            FROM products 
-            WHERE supplier_id = %s AND is_deleted = FALSE
-            ORDER BY product_name
-        """, (supplier_id,))
-        products = cur.fetchall()
-        
         return render_template(
             'supplier_details.html',
             supplier=supplier,
-            products=products
+            products=get_supplier_products(supplier_id)
         )
-        
     except Exception as e:
         flash(f'Error loading supplier details: {str(e)}', 'danger')
         return redirect(url_for('list_suppliers'))
-    finally:
-        cur.close()
-        conn.close()
 
 @app.route('/suppliers/reports')
 @login_required
 @role_required('Admin', 'InventoryManager')
 def supplier_reports():
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Get supplier performance metrics
-        cur.execute("""
-            SELECT 
-                s.supplier_id,
-                s.supplier_name,
-                COUNT(p.product_id) AS product_count,
-                SUM(p.quantity) AS total_stock,
-                AVG(p.price) AS avg_price
-            FROM suppliers s
-            LEFT JOIN products p ON s.supplier_id = p.supplier_id
-            WHERE p.is_deleted = FALSE OR p.product_id IS NULL
-            GROUP BY s.supplier_id
-            ORDER BY product_count DESC
-        """)
-        supplier_stats = cur.fetchall()
-        
-        return render_template('supplier_reports.html', 
-                            supplier_stats=supplier_stats)
-        
+        return render_template('supplier_reports.html',
+                               supplier_stats=get_supplier_stats())
     except Exception as e:
         flash(f'Error generating reports: {str(e)}', 'danger')
         return redirect(url_for('list_suppliers'))
-    finally:
-        cur.close()
-        conn.close()
 
 @app.route('/low_stock')
 @login_required
 @role_required('Admin', 'InventoryManager')
+@conditional_get('products', 'suppliers')
 def low_stock():
     from database import get_db_connection
     conn = get_db_connection()
     cur = conn.cursor()
     low_stock_data = []
     try:
-        cur.execute("SELECT * FROM vw_low_stock")
+        cur.execute("""
+            SELECT product_id, product_name, quantity, min_stocks, supplier_name
+            FROM vw_low_stock
+            ORDER BY quantity - min_stocks, product_id
+        """)
         low_stock_data = cur.fetchall()
     except Exception as e:
         flash(f'Error fetching low stock data: {str(e)}', 'danger')
@@ -592,16 +1041,28 @@ from datetime import datetime
 
 @app.context_processor
 def utility_processor():
-    def notifications_unread_count():
-        if not current_user.is_authenticated:
-            return 0
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM notifications WHERE user_id = %s AND is_read = FALSE", (current_user.id,))
-        count = cur.fetchone()[0]
-        conn.close()
-        return count
-    return dict(notifications_unread_count=notifications_unread_count)
+    return dict(notification_summary=notification_summary,
+                notifications_unread_count=notifications_unread_count)
+
+def notification_summary():
+    """The navbar's unread count and latest notifications, loaded once per request.
+
+    None for anonymous users, or if loading failed; notifications.js then
+    fetches them from the API instead.
+    """
+    if not current_user.is_authenticated:
+        return None
+    if '_notification_summary' not in g:
+        try:
+            g._notification_summary = get_notification_summary(current_user.id)
+        except Exception:
+            app.logger.exception('Could not load notifications for the navbar')
+            g._notification_summary = None
+    return g._notification_summary
+
+def notifications_unread_count():
+    summary = notification_summary()
+    return summary['unread_count'] if summary else 0
 
 # Time ago filter (add to Flask app)
 @app.template_filter('time_ago')
@@ -647,6 +1108,27 @@ def get_unread_count_api():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/notifications/stream')
+@login_required
+def notifications_stream():
+    user_id = current_user.id
+    try:
+        q = notification_broker.subscribe(user_id)
+    except TooManySubscribers:
+        # notifications.js switches to polling on any non-200 answer
+        response = jsonify({'error': 'Too many open notification streams'})
+        response.headers['Retry-After'] = '60'
+        return response, 503
+    # Not wrapped in stream_with_context: the request's pooled connection is
+    # released at teardown instead of being held for the life of the stream.
+    response = Response(
+        sse_stream(q, heartbeat=SSE_HEARTBEAT_SECONDS),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    response.call_on_close(lambda: notification_broker.unsubscribe(user_id, q))
+    return response
+
 @app.route('/notifications/mark-read/<int:notification_id>', methods=['GET', 'POST'])
 @login_required
 def mark_notification_read(notification_id):
@@ -666,42 +1148,29 @@ def mark_notification_read(notification_id):
         flash(f'Error marking notification as read: {str(e)}', 'danger')
         return redirect(url_for('view_all_notifications'))
 
+@app.route('/notifications/mark-all-read', methods=['POST'])
+@login_required
+def mark_all_notifications_read():
+    try:
+        updated = mark_all_notifications_as_read(current_user.id)
+        flash(f'Marked {updated} notification(s) as read.', 'success')
+    except Exception as e:
+        flash(f'Error marking notifications as read: {str(e)}', 'danger')
+    return redirect(url_for('view_all_notifications'))
+
 @app.route('/orders/<int:order_id>')
 @login_required
 @role_required('Admin', 'InventoryManager', 'Sales')
 def view_order(order_id):
-    conn = get_db_connection()
     try:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("""
-            SELECT o.*, p.product_name, u.username AS added_by_username
-            FROM orders o
-            JOIN products p ON o.product_id = o.product_id
-            JOIN users u ON o.added_by = u.user_id
-            WHERE o.order_id = %s
-        """, (order_id,))
-        order = cur.fetchone()
-        
+        order, transactions = get_order_details(order_id)
         if not order:
             flash('Order not found!', 'danger')
             return redirect(url_for('orders'))
-            
-        cur.execute("""
-            SELECT t.*, u.username AS performed_by_username
-            FROM transactions t
-            LEFT JOIN users u ON t.performed_by = u.user_id
-            WHERE t.reference_id = %s
-            ORDER BY t.created_at DESC
-        """, (order_id,))
-        transactions = cur.fetchall()
-        
         return render_template('order_details.html', order=order, transactions=transactions)
     except Exception as e:
         flash(f'Error loading order details: {str(e)}', 'danger')
         return redirect(url_for('orders'))
-    finally:
-        cur.close()
-        conn.close()
 
 @app.route('/products/add', methods=['GET', 'POST'])
 @login_required
@@ -737,8 +1206,7 @@ def add_product():
             cur = conn.cursor()
             
             # Check supplier exists
-            cur.execute("SELECT 1 FROM suppliers WHERE supplier_id = %s", (supplier_id,))
-            if not cur.fetchone():
+            if get_supplier(supplier_id) is None:
                 flash('Invalid supplier selected', 'danger')
                 return redirect(url_for('add_product'))
             
@@ -769,10 +1237,7 @@ def add_product():
     
     # GET request - show the form
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT supplier_id, supplier_name FROM suppliers ORDER BY supplier_name")
-        suppliers = cur.fetchall()
+        suppliers = get_suppliers()
         
         if not suppliers:
             flash('No suppliers found. Please add suppliers first.', 'warning')
@@ -782,11 +1247,44 @@ def add_product():
     except Exception as e:
         flash(f'Error loading form: {str(e)}', 'danger')
         return redirect(url_for('products'))
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
+
+@app.route('/products/import', methods=['GET', 'POST'])
+@login_required
+@role_required('Admin', 'InventoryManager')
+def import_products_view():
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Choose a file to import', 'danger')
+            return redirect(url_for('import_products_view'))
+        try:
+            fmt = detect_format(upload.filename)
+            stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+            result = import_products(stream, fmt, current_user.id)
+            flash(f"Imported {result['inserted'] + result['updated']} product(s)",
+                  'success' if not result['rejected'] else 'warning')
+        except Exception as e:
+            flash(f'Error importing products: {str(e)}', 'danger')
+    return render_template('import_products.html', result=result, import_fields=IMPORT_FIELDS)
+
+@app.cli.command('import-products')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user-id', type=int, required=True, help='User recorded as adding the products.')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'json', 'jsonl']),
+              help='File format (default: from the file extension).')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per COPY batch.')
+def import_products_command(path, user_id, fmt, batch_size):
+    """Bulk-import products from a CSV/JSON file."""
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        result = import_products(stream, fmt or detect_format(path), user_id, batch_size=batch_size)
+    click.echo(f"{result['inserted']} inserted, {result['updated']} updated, "
+               f"{result['restored']} restored, {result['rejected']} rejected, "
+               f"quantity ignored for {result['quantity_ignored']}")
+    for error in result['errors']:
+        click.echo(f"  row {error['row']}: {error['error']}", err=True)
+    for warning in result['warnings']:
+        click.echo(f"  row {warning['row']}: {warning['warning']}", err=True)
 
 DEFAULT_ROLE='Sales'
 @app.route('/register', methods=['GET', 'POST'])
@@ -827,21 +1325,19 @@ def register():
             """, (username, password, role, email, full_name))
             user_id = cur.fetchone()[0]
             
-            # Find admin user dynamically
-            cur.execute("SELECT user_id FROM users WHERE role = 'Admin' LIMIT 1")
-            admin_row = cur.fetchone()
-            admin_id = admin_row[0] if admin_row else 1  # Fallback to 1 if no admin found
-            
-            conn.commit()
-            
-            create_notification(
-                user_id=admin_id,
+            # Every active admin can approve the registration
+            admin_ids = get_user_ids_by_role('Admin', conn=conn) or [1]  # Fallback to 1 if no admin found
+            create_notifications(
+                admin_ids,
                 message=f"New {role} registration awaiting approval: {username}",
                 notification_type="SystemAlert",
                 related_entity_type="user",
-                related_entity_id=user_id
+                related_entity_id=user_id,
+                conn=conn
             )
             
+            conn.commit()
+            
             flash('Registration successful! Your account is pending admin approval.', 'success')
             return redirect(url_for('login'))
             
@@ -879,14 +1375,16 @@ def approve_user(user_id):
         conn = get_db_connection()
         cur = conn.cursor()
         cur.execute("UPDATE users SET is_active = TRUE WHERE user_id = %s", (user_id,))
-        conn.commit()
         
         # Notify the user their account was approved
-        create_notification(
-            user_id=user_id,
+        create_notifications(
+            [user_id],
             message="Your account has been approved! You can now login.",
-            notification_type="SystemAlert"
+            notification_type="SystemAlert",
+            conn=conn
         )
+        conn.commit()
+        invalidate_user(user_id)
         
         flash('User approved successfully', 'success')
     except Exception as e:
@@ -913,7 +1411,7 @@ def view_user(user_id):
             WHERE user_id = %s
         """, (user_id,))
         user = cur.fetchone()
-        print(f"DEBUG: Found user: {user}")
+        app.logger.debug('view_user %s found: %s', user_id, user is not None)
         if not user:
             flash('User not found', 'danger')
             return redirect(url_for('users'))
@@ -927,6 +1425,63 @@ def view_user(user_id):
         if 'cur' in locals(): cur.close()
         if 'conn' in locals(): conn.close()
 
+@app.route('/api/admin/pool-stats')
+@login_required
+@role_required('Admin')
+def pool_stats_api():
+    stats = get_pool().stats()
+    stats['notification_streams'] = notification_broker.stats()
+    return jsonify(stats)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape target; needs ``Authorization: Bearer $IMS_METRICS_TOKEN`` if that is set."""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics_registry.render(),
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/admin/sql-stats', methods=['GET', 'DELETE'])
+@login_required
+@role_required('Admin')
+def sql_stats_api():
+    if sql_instrumentation is None:
+        return jsonify({'error': 'SQL instrumentation is disabled (IMS_SQL_INSTRUMENTATION=0)'}), 404
+    if request.method == 'DELETE':
+        sql_instrumentation.reset()
+    return jsonify(sql_instrumentation.snapshot(limit=request.args.get('limit', 50, type=int)))
+
+@app.route('/api/admin/audit-queue')
+@login_required
+@role_required('Admin')
+def audit_queue_api():
+    try:
+        depth = get_audit_queue_depth()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'mode': AUDIT_MODE, 'queued': depth, 'flusher': audit_flusher.stats()})
+
+@app.route('/api/admin/background-jobs')
+@login_required
+@role_required('Admin')
+def background_jobs_api():
+    try:
+        pending = get_background_queue_depths()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'pending': pending, 'jobs': [job.stats() for job in background_jobs()]})
+
+@app.route('/api/admin/cache-stats')
+@login_required
+@role_required('Admin')
+def cache_stats_api():
+    return jsonify({
+        'dashboard_metrics': dashboard_metrics.stats(),
+        'users': user_cache.stats(),
+        'sales_report': sales_report_cache.stats(),
+        'suppliers': supplier_cache.stats(),
+    })
+
 @app.route('/debug-routes')
 def debug_routes():
     routes = []
@@ -938,4 +1493,7 @@ def debug_routes():
         })
     return jsonify(routes)
 if __name__ == '__main__':
+    # The reloader runs the app in a child process; only that one serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_jobs()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,83 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class BatchDrainer:
+    """Periodically drains a database queue in batches from a background thread.
+
+    ``drain(batch_size)`` processes one batch and returns the number of rows
+    it handled, e.g. flush_audit_queue() or compact_table_changes(). Full
+    batches are drained back to back; otherwise the thread sleeps
+    ``interval`` seconds, which bounds how far the queue lags behind the
+    writes that fill it. Nothing runs until start() is called.
+    """
+
+    def __init__(self, drain, name, interval=1.0, batch_size=5000):
+        self._drain = drain
+        self.interval = interval
+        self.batch_size = batch_size
+        self.name = name
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.rows_drained = 0
+        self.batches = 0
+        self.failures = 0
+        self.last_drain_at = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name=self.name,
+                                                daemon=True)
+                self._thread.start()
+
+    def stop(self, drain=False):
+        """Stop the thread; with ``drain``, empty the queue first."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 2)
+        if drain:
+            self.drain_all()
+
+    def drain_all(self):
+        """Drain until the queue is empty; returns the number of rows handled."""
+        total = 0
+        while True:
+            drained = self._drain_once()
+            total += drained
+            if drained < self.batch_size:
+                return total
+
+    def _drain_once(self):
+        drained = self._drain(self.batch_size)
+        self.rows_drained += drained
+        self.batches += 1
+        self.last_drain_at = time.time()
+        return drained
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                if self._drain_once() >= self.batch_size:
+                    continue
+            except Exception:
+                self.failures += 1
+                logger.exception('%s: batch failed; retrying in %.0fs', self.name, self.interval)
+            self._stopping.wait(self.interval)
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'running': self._thread is not None and self._thread.is_alive(),
+            'interval': self.interval,
+            'batch_size': self.batch_size,
+            'rows_drained': self.rows_drained,
+            'batches': self.batches,
+            'failures': self.failures,
+            'last_drain_at': self.last_drain_at,
+        }
@@ -0,0 +1,110 @@
+"""create_order/process_order throughput with synchronous vs asynchronous auditing.
+
+For each mode, --orders orders are created and then approved from --threads
+threads against one scratch product. In "async" mode every pooled connection
+sets ims.audit_mode = 'async', so audit rows go to the unlogged
+audit_log_queue. The time to flush that queue into audit_log is reported
+separately, because it is paid later by the background flusher rather than
+by the request.
+
+The scratch product and its orders, transactions and rollup rows are
+deleted afterwards. The audit rows they produced are kept.
+
+    python benchmarks/bench_audit_mode.py --orders 2000 --threads 16
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from db_pool import ConnectionPool  # noqa: E402
+
+
+def execute(sql, params=None, fetch=False):
+    conn = database.get_pool().connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        result = cur.fetchall() if fetch else None
+        conn.commit()
+        cur.close()
+        return result
+    finally:
+        conn.close()
+
+
+def timed(label, items, threads, handler):
+    chunks = [items[i::threads] for i in range(threads)]
+
+    def worker(chunk):
+        for item in chunk:
+            handler(item)
+
+    workers = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<15} {len(items):>7} calls  {elapsed:8.2f}s  {len(items) / elapsed:9.1f} /s")
+
+
+def run_mode(mode, args):
+    database.set_pool(ConnectionPool(lambda: database.connect(audit_mode=mode),
+                                     minconn=1, maxconn=args.threads, timeout=30))
+    product_id = execute("""
+        INSERT INTO products (product_name, category, price, quantity, min_stocks)
+        VALUES (%s, 'Benchmark', 1.00, %s, 0)
+        RETURNING product_id
+    """, (f'audit-bench-{uuid.uuid4().hex[:8]}', args.orders), fetch=True)[0][0]
+
+    print(f"{mode}:")
+    order_ids = []
+    lock = threading.Lock()
+
+    def create(_):
+        order_id, _ = database.create_order(product_id, 1, args.user_id, 'audit benchmark')
+        with lock:
+            order_ids.append(order_id)
+
+    try:
+        timed('create_order', list(range(args.orders)), args.threads, create)
+        timed('process_order', list(order_ids), args.threads,
+              lambda order_id: database.process_order(order_id, 'Approved', args.user_id))
+        queued = execute("SELECT COUNT(*) FROM audit_log_queue", fetch=True)[0][0]
+        started = time.perf_counter()
+        flushed = 0
+        while True:
+            batch = database.flush_audit_queue(args.flush_batch)
+            flushed += batch
+            if batch < args.flush_batch:
+                break
+        print(f"  queued audit rows {queued}, flushed {flushed} "
+              f"in {time.perf_counter() - started:.2f}s")
+    finally:
+        execute("DELETE FROM transactions WHERE product_id = %s", (product_id,))
+        execute("DELETE FROM sales_daily_rollup WHERE product_id = %s", (product_id,))
+        execute("DELETE FROM orders WHERE product_id = %s", (product_id,))
+        execute("DELETE FROM products WHERE product_id = %s", (product_id,))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--flush-batch', type=int, default=5000)
+    parser.add_argument('--user-id', type=int, default=1, help='user recorded on the orders')
+    args = parser.parse_args()
+
+    for mode in ('sync', 'async'):
+        run_mode(mode, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Requests/sec for a typical page render with and without the connection pool.
+
+A "request" runs --queries small queries the way a page render does (user
+lookup, the route's own query, the unread-notification badge...). In
+"unpooled" mode each query opens its own connection, as get_db_connection did
+before pooling; in "pooled" mode the request checks out one connection from
+database.get_pool() and reuses it for every query.
+
+    python benchmarks/bench_pool.py                   # against IMS_DB_* Postgres
+    python benchmarks/bench_pool.py --fake --connect-ms 3
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from app import app  # noqa: E402
+from db_pool import ConnectionPool  # noqa: E402
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        time.sleep(self.conn.query_latency)
+
+    def fetchone(self):
+        return (1,)
+
+    def fetchall(self):
+        return [(1,)]
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """Just enough of a psycopg2 connection for the pool and the benchmark."""
+
+    def __init__(self, connect_latency, query_latency):
+        time.sleep(connect_latency)
+        self.query_latency = query_latency
+        self.closed = 0
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return 0
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+def run(label, requests, threads, handler):
+    per_thread = requests // threads
+
+    def worker():
+        for _ in range(per_thread):
+            handler()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+    total = per_thread * threads
+    print(f"{label:<10} {total:>7} requests  {elapsed:8.2f}s  {total / elapsed:10.1f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--queries', type=int, default=4, help='queries per request')
+    parser.add_argument('--fake', action='store_true', help='use an in-process fake connection factory')
+    parser.add_argument('--connect-ms', type=float, default=3.0, help='fake connect latency')
+    parser.add_argument('--query-ms', type=float, default=0.2, help='fake query latency')
+    args = parser.parse_args()
+
+    if args.fake:
+        def connect():
+            return FakeConnection(args.connect_ms / 1000, args.query_ms / 1000)
+    else:
+        connect = database.connect
+
+    def query(conn):
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.fetchone()
+        cur.close()
+
+    def unpooled_request():
+        for _ in range(args.queries):
+            conn = connect()
+            query(conn)
+            conn.close()
+
+    database.set_pool(ConnectionPool(connect, minconn=1, maxconn=args.threads))
+
+    def pooled_request():
+        with app.app_context():
+            for _ in range(args.queries):
+                conn = database.get_db_connection()
+                query(conn)
+                conn.close()
+
+    run('unpooled', args.requests, args.threads, unpooled_request)
+    run('pooled', args.requests, args.threads, pooled_request)
+    print(database.get_pool().stats())
+
+
+if __name__ == '__main__':
+    main()
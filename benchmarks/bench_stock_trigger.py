@@ -0,0 +1,143 @@
+"""Cost of the transactions stock/audit trigger, per-row (legacy) vs statement-level.
+
+Inserts --rows stock movements for one scratch product, both as single-row
+INSERTs (how update_stock and process_order write them) and as one bulk
+INSERT ... SELECT (how imports and batches write them). The "legacy" run
+swaps in the old FOR EACH ROW trigger, which re-read the product three times
+and raised a NOTICE per audit row. The "current" run uses the trigger
+installed by ims_sql.sql.
+
+Everything, the trigger swap included, happens inside one transaction that
+is rolled back, so the database is left unchanged. The swap takes an
+exclusive lock on transactions, so run this against a development database.
+
+    python benchmarks/bench_stock_trigger.py --rows 5000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+LEGACY_TRIGGER = """
+CREATE FUNCTION bench_legacy_log_audit_event(
+    p_table_name VARCHAR, p_action VARCHAR, p_record_id INTEGER,
+    p_changed_by INTEGER, p_old_values JSONB, p_new_values JSONB
+) RETURNS VOID AS $$
+BEGIN
+    RAISE NOTICE 'Attempting to log: table=%, action=%, record_id=%, changed_by=%',
+        p_table_name, p_action, p_record_id, p_changed_by;
+    INSERT INTO audit_log (table_name, record_id, action, changed_by, old_values, new_values)
+    VALUES (p_table_name, p_record_id, p_action, p_changed_by, p_old_values, p_new_values);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION bench_legacy_stock_update() RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.transaction_type = 'Sale' THEN
+        UPDATE products SET quantity = quantity - NEW.quantity, updated_at = CURRENT_TIMESTAMP
+        WHERE product_id = NEW.product_id;
+    ELSE
+        UPDATE products SET quantity = quantity + NEW.quantity, updated_at = CURRENT_TIMESTAMP
+        WHERE product_id = NEW.product_id;
+    END IF;
+    PERFORM bench_legacy_log_audit_event(
+        'products', 'UPDATE', NEW.product_id, NEW.performed_by,
+        jsonb_build_object('quantity',
+            CASE WHEN NEW.transaction_type = 'Sale'
+                 THEN (SELECT quantity FROM products WHERE product_id = NEW.product_id) + NEW.quantity
+                 ELSE (SELECT quantity FROM products WHERE product_id = NEW.product_id) - NEW.quantity
+            END),
+        jsonb_build_object('quantity', (SELECT quantity FROM products WHERE product_id = NEW.product_id))
+    );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER stock_update_trigger ON transactions;
+CREATE TRIGGER stock_update_trigger AFTER INSERT ON transactions
+FOR EACH ROW EXECUTE FUNCTION bench_legacy_stock_update();
+"""
+
+INSERT_ONE = """
+    INSERT INTO transactions (product_id, transaction_type, quantity, unit_price,
+                              total_amount, performed_by, notes)
+    VALUES (%s, %s, 1, 1.00, 1.00, NULL, 'trigger benchmark')
+"""
+
+INSERT_BULK = """
+    INSERT INTO transactions (product_id, transaction_type, quantity, unit_price,
+                              total_amount, performed_by, notes)
+    SELECT %s, CASE WHEN n %% 2 = 0 THEN 'Sale' ELSE 'Purchase' END, 1, 1.00, 1.00,
+           NULL, 'trigger benchmark'
+    FROM generate_series(1, %s) n
+"""
+
+
+class NoticeCounter:
+    """Stands in for conn.notices, which only keeps the last 50 messages."""
+
+    def __init__(self):
+        self.count = 0
+
+    def append(self, message):
+        self.count += 1
+
+
+def measure(cur, conn, product_id, rows, bulk):
+    cur.execute("SELECT COUNT(*) FROM audit_log")
+    audit_before = cur.fetchone()[0]
+    conn.notices = NoticeCounter()
+    started = time.perf_counter()
+    if bulk:
+        cur.execute(INSERT_BULK, (product_id, rows))
+    else:
+        for n in range(rows):
+            cur.execute(INSERT_ONE, (product_id, 'Sale' if n % 2 == 0 else 'Purchase'))
+    elapsed = time.perf_counter() - started
+    cur.execute("SELECT COUNT(*) FROM audit_log")
+    return elapsed, cur.fetchone()[0] - audit_before, conn.notices.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000)
+    args = parser.parse_args()
+
+    conn = database.connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            INSERT INTO products (product_name, category, price, quantity, min_stocks)
+            VALUES ('trigger-benchmark', 'Benchmark', 1.00, %s, 0)
+            RETURNING product_id
+        """, (args.rows * 2,))
+        product_id = cur.fetchone()[0]
+
+        results = []
+        for variant in ('current', 'legacy'):
+            if variant == 'legacy':
+                cur.execute(LEGACY_TRIGGER)
+            for bulk in (False, True):
+                cur.execute("SAVEPOINT bench")
+                elapsed, audit_rows, notices = measure(cur, conn, product_id, args.rows, bulk)
+                cur.execute("ROLLBACK TO SAVEPOINT bench")
+                results.append((variant, 'bulk' if bulk else 'single-row',
+                                elapsed, audit_rows, notices))
+    finally:
+        conn.rollback()
+        cur.close()
+        conn.close()
+
+    print(f"{'trigger':<8} {'inserts':<11} {'rows':>7} {'total s':>9} {'us/row':>9} "
+          f"{'audit rows':>11} {'notices':>8}")
+    for variant, mode, elapsed, audit_rows, notices in results:
+        print(f"{variant:<8} {mode:<11} {args.rows:>7} {elapsed:9.3f} "
+              f"{elapsed / args.rows * 1e6:9.1f} {audit_rows:>11} {notices:>8}")
+
+
+if __name__ == '__main__':
+    main()
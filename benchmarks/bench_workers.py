@@ -0,0 +1,98 @@
+"""Throughput of the app under gunicorn at different worker/thread counts.
+
+For every --configs entry (WORKERSxTHREADS), starts gunicorn with
+gunicorn.conf.py and that many workers and threads, and gives each worker a
+pool of THREADS connections. It then runs benchmarks/load_test.py against
+the server and stops it. Needs a database seeded by benchmarks/seed.py
+(IMS_DB_*), and gunicorn installed.
+
+    python benchmarks/bench_workers.py --configs 1x1,1x8,4x4,8x4,16x2 --users 64 --duration 60
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_until_up(url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=2):
+                return
+        except urllib.error.HTTPError:
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'{url} did not come up within {timeout}s')
+
+
+def run_config(workers, threads, args):
+    bind = f'127.0.0.1:{args.port}'
+    env = dict(os.environ, IMS_WORKERS=str(workers), IMS_THREADS=str(threads), IMS_BIND=bind,
+               IMS_DB_POOL_MAX=str(threads), IMS_ACCESS_LOG='')
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                               'wsgi:app'], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        wait_until_up(f'http://{bind}/login', timeout=30)
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            output = f.name
+        subprocess.run([sys.executable, os.path.join(ROOT, 'benchmarks', 'load_test.py'),
+                        '--base-url', f'http://{bind}', '--users', str(args.users),
+                        '--mix', args.mix, '--duration', str(args.duration),
+                        '--warmup', str(args.warmup), '--output', output],
+                       check=True, stdout=subprocess.DEVNULL)
+        with open(output) as f:
+            report = json.load(f)
+        os.unlink(output)
+        return report
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--configs', default='1x1,1x8,2x4,4x4,8x4',
+                        help='comma-separated WORKERSxTHREADS settings')
+    parser.add_argument('--users', type=int, default=32)
+    parser.add_argument('--mix', default='sales=6,manager=3,admin=1')
+    parser.add_argument('--duration', type=float, default=40)
+    parser.add_argument('--warmup', type=float, default=10)
+    parser.add_argument('--port', type=int, default=8200)
+    parser.add_argument('--output', help='write all results as JSON')
+    args = parser.parse_args()
+
+    configs = [tuple(int(n) for n in c.lower().split('x')) for c in args.configs.split(',')]
+    print(f"{os.cpu_count()} CPUs, {args.users} virtual users, {args.mix}")
+    print(f"{'workers':>7} {'threads':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'errors':>7}")
+    results = []
+    for workers, threads in configs:
+        report = run_config(workers, threads, args)
+        total = report['total'] or {}
+        results.append({'workers': workers, 'threads': threads, 'total': total,
+                        'endpoints': report['endpoints'], 'meta': report['meta']})
+        print(f"{workers:>7} {threads:>7} {total.get('rps', 0):>9.1f} "
+              f"{total.get('p50_ms', 0):>8.1f} {total.get('p95_ms', 0):>8.1f} "
+              f"{total.get('p99_ms', 0):>8.1f} {total.get('errors', 0):>7}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'cpus': os.cpu_count(), 'users': args.users, 'mix': args.mix,
+                       'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Compare two benchmarks/load_test.py reports endpoint by endpoint.
+
+Prints p50/p95/p99 and throughput for both runs with the relative change,
+and exits with status 1 if any endpoint's p95 grew by more than --threshold
+percent (endpoints with fewer than --min-requests samples in either run are
+shown but not judged), so it can gate a CI job.
+
+    python benchmarks/compare_results.py baseline.json candidate.json --threshold 15
+"""
+import argparse
+import json
+import sys
+
+
+def change(old, new):
+    if not old:
+        return None
+    return (new - old) / old * 100
+
+
+def cell(old, new):
+    delta = change(old, new)
+    return f"{old:.1f} -> {new:.1f}" + ('' if delta is None else f" ({delta:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='p95 growth, in percent, that counts as a regression')
+    parser.add_argument('--min-requests', type=int, default=50)
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"baseline  {baseline['meta'].get('commit')}  {baseline['meta'].get('started_at')}")
+    print(f"candidate {candidate['meta'].get('commit')}  {candidate['meta'].get('started_at')}")
+    print()
+    print(f"{'endpoint':<36} {'p50 ms':<24} {'p95 ms':<24} {'p99 ms':<24} {'req/s':<24}")
+
+    regressions = []
+    names = sorted(set(baseline['endpoints']) | set(candidate['endpoints']))
+    for name in names:
+        old = baseline['endpoints'].get(name)
+        new = candidate['endpoints'].get(name)
+        if old is None or new is None:
+            print(f"{name:<36} only in {'candidate' if old is None else 'baseline'}")
+            continue
+        p95_change = change(old['p95_ms'], new['p95_ms'])
+        judged = min(old['requests'], new['requests']) >= args.min_requests
+        flag = ''
+        if judged and p95_change is not None and p95_change > args.threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:<36} {cell(old['p50_ms'], new['p50_ms']):<24} "
+              f"{cell(old['p95_ms'], new['p95_ms']):<24} {cell(old['p99_ms'], new['p99_ms']):<24} "
+              f"{cell(old['rps'], new['rps']):<24}{flag}")
+
+    if regressions:
+        print(f"\n{len(regressions)} endpoint(s) regressed by more than {args.threshold:.0f}% at p95")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
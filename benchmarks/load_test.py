@@ -0,0 +1,399 @@
+"""Closed-loop load test of the IMS web app with role-based virtual users.
+
+Each virtual user logs in as one of the users created by benchmarks/seed.py.
+It then repeatedly picks an action from its role's weighted mix (see
+SCENARIOS), waits an exponentially distributed think time, and repeats until
+--duration runs out. Latencies recorded during the first --warmup seconds are
+discarded. Requests are timed without following redirects, so a form POST is
+measured on its own, not together with the page it redirects to. Form routes
+report failures by redirecting back to the form, so each action also checks
+where it was redirected.
+
+Pending orders for process_order, and in-stock products for create_order,
+are read from the database named by IMS_DB_*. Run this on a host that can
+reach both the app and its database.
+
+Results go to --output as JSON, per endpoint: requests, errors, throughput,
+and p50/p95/p99/mean/max latency. The git commit is recorded too, so that
+runs can be diffed with benchmarks/compare_results.py.
+
+    python benchmarks/load_test.py --base-url http://127.0.0.1:8000 \\
+        --users 30 --mix sales=6,manager=3,admin=1 --duration 120 --output run.json
+"""
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+CSRF_TOKEN = re.compile(r'id="csrf-token"[^>]*>([^<]+)<')
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Response:
+    def __init__(self, status, location, body):
+        self.status = status
+        self.location = location
+        self.body = body
+
+
+class Results:
+    """Latencies per endpoint, shared by every virtual user."""
+
+    def __init__(self, record_after):
+        self.record_after = record_after
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.error_samples = {}
+
+    def add(self, name, seconds, ok, detail=None):
+        if time.monotonic() < self.record_after:
+            return
+        with self._lock:
+            self.latencies.setdefault(name, []).append(seconds)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+                samples = self.error_samples.setdefault(name, [])
+                if detail and len(samples) < 5:
+                    samples.append(detail)
+
+
+class VirtualUser:
+    def __init__(self, base_url, results, rng):
+        self.base_url = base_url.rstrip('/')
+        self.results = results
+        self.rng = rng
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect())
+        self.csrf_token = None
+
+    def request(self, name, path, data=None, expect=200, expect_location=None):
+        """Send one request, record its latency under ``name`` and return a Response.
+
+        ``data`` makes it a form POST, with the session's CSRF token added.
+        """
+        body = None
+        if data is not None:
+            body = urllib.parse.urlencode(dict(data, csrf_token=self.csrf_token or '')).encode()
+        req = urllib.request.Request(self.base_url + path, data=body)
+        started = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=60) as resp:
+                response = Response(resp.status, None, resp.read())
+        except urllib.error.HTTPError as e:
+            response = Response(e.code, e.headers.get('Location'), e.read())
+        except (urllib.error.URLError, OSError) as e:
+            self.results.add(name, time.perf_counter() - started, False, str(e))
+            return None
+        elapsed = time.perf_counter() - started
+        ok = response.status == expect
+        if ok and expect_location is not None:
+            ok = urllib.parse.urlparse(response.location or '').path == expect_location
+        self.results.add(name, elapsed, ok,
+                         None if ok else f'{response.status} {response.location or ""}'.strip())
+        return response
+
+    def login(self, username, password):
+        page = self.request('GET /login', '/login')
+        if page is None:
+            return False
+        match = CSRF_TOKEN.search(page.body.decode('utf-8', 'replace'))
+        if not match:
+            raise RuntimeError('No CSRF token on /login; is this the IMS app?')
+        self.csrf_token = match.group(1).strip()
+        response = self.request('POST /login', '/login',
+                                data={'username': username, 'password': password},
+                                expect=302, expect_location='/')
+        return response is not None and response.status == 302
+
+
+class Fixtures:
+    """Ids the scenarios need, read from the database and refreshed as they run out."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+        self.product_ids = self._query("""
+            SELECT product_id FROM products
+            WHERE is_deleted = FALSE AND quantity - reserved_quantity > 50
+            ORDER BY random() LIMIT 5000
+        """)
+        if not self.product_ids:
+            raise RuntimeError('No products with stock; seed the database first')
+
+    @staticmethod
+    def _query(sql):
+        conn = database.get_pool().connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(sql)
+            rows = [row[0] for row in cur.fetchall()]
+            cur.close()
+            return rows
+        finally:
+            conn.close()
+
+    def pending_order(self):
+        with self._lock:
+            if not self._pending:
+                self._pending = self._query("""
+                    SELECT order_id FROM orders WHERE status = 'Pending'
+                    ORDER BY order_id DESC LIMIT 2000
+                """)
+                random.shuffle(self._pending)
+            return self._pending.pop() if self._pending else None
+
+
+# -- actions ---------------------------------------------------------------
+def browse_products(user, fixtures):
+    sort = user.rng.choice(['name', 'category', 'price', 'quantity'])
+    user.request('GET /products', f'/products?sort={sort}&page={user.rng.randint(1, 20)}')
+
+
+def search_products(user, fixtures):
+    user.request('GET /products?q', f'/products?q=Product+{user.rng.randint(0, 99):02d}')
+
+
+def typeahead(user, fixtures):
+    user.request('GET /api/products/search',
+                 f'/api/products/search?q=Product+{user.rng.randint(0, 999):03d}')
+
+
+def create_order(user, fixtures):
+    user.request('GET /orders/create', '/orders/create')
+    user.request('POST /orders/create', '/orders/create',
+                 data={'product_id': user.rng.choice(fixtures.product_ids),
+                       'quantity': user.rng.randint(1, 3), 'notes': 'load test'},
+                 expect=302, expect_location='/orders')
+
+
+def list_orders(user, fixtures):
+    user.request('GET /orders', '/orders')
+
+
+def process_order(user, fixtures):
+    order_id = fixtures.pending_order()
+    if order_id is None:
+        return
+    user.request('POST /orders/process/<id>', f'/orders/process/{order_id}',
+                 data={'status': user.rng.choice(['Approved', 'Approved', 'Cancelled']),
+                       'notes': 'load test'},
+                 expect=302, expect_location='/orders')
+
+
+def notifications(user, fixtures):
+    user.request('GET /api/notifications', '/api/notifications?limit=5')
+
+
+def unread_count(user, fixtures):
+    user.request('GET /api/notifications/unread-count', '/api/notifications/unread-count')
+
+
+def notifications_page(user, fixtures):
+    user.request('GET /notifications', '/notifications')
+
+
+def inventory_dashboard(user, fixtures):
+    user.request('GET /inventory/dashboard', '/inventory/dashboard')
+
+
+def admin_dashboard(user, fixtures):
+    user.request('GET /admin/dashboard', '/admin/dashboard')
+
+
+def low_stock(user, fixtures):
+    user.request('GET /low_stock', '/low_stock')
+
+
+def supplier_reports(user, fixtures):
+    user.request('GET /suppliers/reports', '/suppliers/reports')
+
+
+def reports(user, fixtures):
+    user.request('GET /reports', '/reports')
+
+
+def sales_report(user, fixtures):
+    user.request('GET /api/reports/sales', '/api/reports/sales')
+
+
+def audit_log(user, fixtures):
+    user.request('GET /audit_log', '/audit_log')
+
+
+def transactions(user, fixtures):
+    user.request('GET /transactions', '/transactions')
+
+
+def users_page(user, fixtures):
+    user.request('GET /users', '/users')
+
+
+# Weighted action mix per role
+SCENARIOS = {
+    'sales': [
+        (browse_products, 15), (search_products, 10), (typeahead, 20), (create_order, 15),
+        (list_orders, 2), (notifications, 20), (unread_count, 15), (notifications_page, 3),
+    ],
+    'manager': [
+        (inventory_dashboard, 10), (browse_products, 10), (low_stock, 10), (process_order, 15),
+        (supplier_reports, 5), (list_orders, 2), (notifications, 25), (unread_count, 20),
+        (notifications_page, 3),
+    ],
+    'admin': [
+        (admin_dashboard, 10), (reports, 10), (sales_report, 10), (audit_log, 10),
+        (transactions, 5), (users_page, 5), (browse_products, 5), (notifications, 25),
+        (unread_count, 20),
+    ],
+}
+
+
+def run_user(role, index, args, results, fixtures, deadline, seed):
+    rng = random.Random(seed)
+    user = VirtualUser(args.base_url, results, rng)
+    # seed.py names its users <role>_<n>
+    username = f'{role}_{index % args.users_per_role + 1}'
+    if not user.login(username, args.password):
+        print(f'login failed for {username}', file=sys.stderr)
+        return
+    actions, weights = zip(*SCENARIOS[role])
+    while time.monotonic() < deadline:
+        rng.choices(actions, weights)[0](user, fixtures)
+        if args.think_ms:
+            time.sleep(max(0.0, min(rng.expovariate(1000 / args.think_ms),
+                                    deadline - time.monotonic())))
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    # Nearest rank
+    return sorted_values[max(math.ceil(q * len(sorted_values)) - 1, 0)]
+
+
+def summarize(latencies, errors, seconds):
+    values = sorted(latencies)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'rps': round(len(values) / seconds, 2),
+        'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+        'mean_ms': round(sum(values) / len(values) * 1000, 2),
+        'max_ms': round(values[-1] * 1000, 2),
+    }
+
+
+def git_commit():
+    try:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    cwd=root, capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        role, _, weight = part.partition('=')
+        if role not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f'unknown role {role!r}; expected {list(SCENARIOS)}')
+        mix[role] = int(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--users', type=int, default=20, help='concurrent virtual users')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('sales=6,manager=3,admin=1'),
+                        help='relative share of virtual users per role')
+    parser.add_argument('--duration', type=float, default=60, help='seconds, warm-up included')
+    parser.add_argument('--warmup', type=float, default=10, help='seconds not recorded')
+    parser.add_argument('--think-ms', type=float, default=0, help='mean think time; 0 = none')
+    parser.add_argument('--users-per-role', type=int, default=20,
+                        help='as passed to benchmarks/seed.py')
+    parser.add_argument('--password', default='bench123')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON report here as well as to stdout')
+    args = parser.parse_args()
+
+    # Spread the users over the roles in proportion to --mix
+    total_weight = sum(args.mix.values())
+    roles = []
+    for role, weight in args.mix.items():
+        roles += [role] * round(args.users * weight / total_weight)
+    roles = (roles + [max(args.mix, key=args.mix.get)] * args.users)[:args.users]
+
+    fixtures = Fixtures()
+    started = time.monotonic()
+    results = Results(record_after=started + args.warmup)
+    deadline = started + args.duration
+    threads = [threading.Thread(target=run_user, daemon=True,
+                                args=(role, i, args, results, fixtures, deadline, args.seed + i))
+               for i, role in enumerate(roles)]
+    started_at = datetime.now(timezone.utc)
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    measured = max(time.monotonic() - results.record_after, 1e-9)
+
+    commit, dirty = git_commit()
+    all_latencies = [v for values in results.latencies.values() for v in values]
+    report = {
+        'meta': {
+            'commit': commit,
+            'dirty': dirty,
+            'started_at': started_at.isoformat(),
+            'base_url': args.base_url,
+            'users': args.users,
+            'roles': {role: roles.count(role) for role in args.mix},
+            'duration_s': args.duration,
+            'warmup_s': args.warmup,
+            'think_ms': args.think_ms,
+            'seed': args.seed,
+            'python': platform.python_version(),
+        },
+        'total': summarize(all_latencies, sum(results.errors.values()), measured)
+        if all_latencies else None,
+        'endpoints': {
+            name: dict(summarize(values, results.errors.get(name, 0), measured),
+                       error_samples=results.error_samples.get(name, []))
+            for name, values in sorted(results.latencies.items())
+        },
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+"""Seed a benchmark database with synthetic data at a configurable scale.
+
+Reloads ims_sql.sql, which DROPS EVERY IMS TABLE, then fills it with
+suppliers, products, orders, transactions, notifications and audit rows
+generated server-side with generate_series. Point IMS_DB_NAME at a scratch
+database and pass --yes to confirm.
+
+Bulk inserts run with the user triggers on products, orders, transactions and
+notifications disabled. The tables those triggers maintain are rebuilt
+afterwards: sales_daily_rollup, supplier_stats and notification_counters. The
+generated data keeps the invariants the triggers enforce:
+  * reserved_quantity equals the quantity of Pending orders
+  * every Approved or Fulfilled order has its Sale transaction
+
+Load-test users are created for every role as <role>_<n> (e.g. sales_1,
+manager_3, admin_2), all with the --password given here. Use the same
+password for benchmarks/load_test.py.
+
+    IMS_DB_NAME=ims_bench python benchmarks/seed.py --yes --products 100000 \\
+        --transactions 2000000 --audit-rows 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+SCHEMA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ims_sql.sql')
+
+# Tables whose user triggers are disabled while bulk rows go in
+TRIGGER_TABLES = ('products', 'orders', 'transactions', 'notifications')
+
+ROLES = (('Sales', 'sales'), ('InventoryManager', 'manager'), ('Admin', 'admin'))
+
+CATEGORIES = ['Electronics', 'Accessories', 'Furniture', 'Office', 'Networking',
+              'Storage', 'Audio', 'Lighting', 'Tools', 'Cleaning']
+
+
+class Step:
+    def __init__(self, label):
+        self.label = label
+
+    def __enter__(self):
+        print(f"{self.label:<44}", end='', flush=True)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        print(f"{time.perf_counter() - self.started:8.1f}s")
+
+
+def seed(cur, args):
+    cur.execute("SELECT setseed(%s)", (args.seed,))
+
+    with Step(f"users ({args.users_per_role} per role)"):
+        # One bcrypt hash shared by every load-test user keeps this step fast
+        cur.execute("SELECT crypt(%s, gen_salt('bf'))", (args.password,))
+        password_hash = cur.fetchone()[0]
+        for role, prefix in ROLES:
+            cur.execute("""
+                INSERT INTO users (username, password, role, email, full_name)
+                SELECT %(prefix)s || '_' || n, %(hash)s, %(role)s,
+                       %(prefix)s || '_' || n || '@bench.invalid', %(role)s || ' ' || n
+                FROM generate_series(1, %(count)s) n
+            """, {'prefix': prefix, 'hash': password_hash, 'role': role,
+                  'count': args.users_per_role})
+
+    with Step(f"suppliers ({args.suppliers})"):
+        cur.execute("""
+            INSERT INTO suppliers (supplier_name, contact_info)
+            SELECT 'Supplier ' || n, 'orders@supplier' || n || '.invalid'
+            FROM generate_series(1, %s) n
+        """, (args.suppliers,))
+
+    with Step(f"products ({args.products})"):
+        # About 3% of products start below their minimum stock
+        cur.execute("""
+            INSERT INTO products (product_name, category, price, quantity, min_stocks,
+                                  supplier_id, added_by, is_deleted)
+            SELECT 'Product ' || lpad(n::TEXT, 7, '0'),
+                   (%(categories)s::TEXT[])[1 + (n %% array_length(%(categories)s::TEXT[], 1))],
+                   round((1 + random() * 999)::NUMERIC, 2),
+                   CASE WHEN random() < 0.03 THEN floor(random() * 5)::INT
+                        ELSE 20 + floor(random() * 480)::INT END,
+                   5 + floor(random() * 15)::INT,
+                   (SELECT MIN(supplier_id) FROM suppliers) + floor(random() * %(suppliers)s)::INT,
+                   (SELECT MIN(user_id) FROM users),
+                   random() < 0.01
+            FROM generate_series(1, %(count)s) n
+        """, {'categories': CATEGORIES, 'suppliers': args.suppliers, 'count': args.products})
+        # The schema's sample rows come first; pick from the seeded id range
+        cur.execute("SELECT MIN(product_id), MAX(product_id) FROM products "
+                    "WHERE product_name LIKE 'Product %'")
+        first_id, last_id = cur.fetchone()
+        products = {'first_product': first_id, 'products': last_id - first_id + 1}
+
+    with Step(f"orders ({args.orders})"):
+        # Newest orders are most likely still Pending
+        cur.execute("""
+            INSERT INTO orders (product_id, quantity_ordered, status, added_by,
+                                total_amount, notes, created_at, updated_at)
+            SELECT p.product_id, o.qty,
+                   CASE WHEN o.age_days < 2 AND random() < 0.6 THEN 'Pending'
+                        WHEN random() < 0.1 THEN 'Cancelled'
+                        WHEN random() < 0.5 THEN 'Approved'
+                        ELSE 'Fulfilled' END,
+                   u.user_id, p.price * o.qty, NULL,
+                   o.created_at, o.created_at
+            FROM (
+                SELECT r.*, now() - make_interval(secs => r.age_days * 86400) AS created_at
+                FROM (
+                    SELECT 1 + floor(random() * 5)::INT AS qty,
+                           %(first_product)s + floor(random() * %(products)s)::INT AS product_id,
+                           random() * %(days)s AS age_days,
+                           floor(random() * %(sellers)s)::INT AS seller_n
+                    FROM generate_series(1, %(count)s)
+                ) r
+            ) o
+            JOIN products p ON p.product_id = o.product_id
+            JOIN LATERAL (
+                SELECT user_id FROM users WHERE role = 'Sales'
+                ORDER BY user_id OFFSET o.seller_n LIMIT 1
+            ) u ON TRUE
+        """, dict(products, days=args.days, sellers=args.users_per_role, count=args.orders))
+        # Pending orders hold a reservation on top of the stock on hand
+        cur.execute("""
+            UPDATE products p
+            SET quantity = p.quantity + r.pending, reserved_quantity = r.pending
+            FROM (
+                SELECT product_id, SUM(quantity_ordered) AS pending
+                FROM orders WHERE status = 'Pending'
+                GROUP BY product_id
+            ) r
+            WHERE p.product_id = r.product_id
+        """)
+
+    with Step("order sales"):
+        cur.execute("""
+            INSERT INTO transactions (product_id, transaction_type, quantity, unit_price,
+                                      total_amount, performed_by, transaction_date,
+                                      reference_id, notes, created_at)
+            SELECT o.product_id, 'Sale', o.quantity_ordered, p.price, o.total_amount,
+                   o.added_by, o.updated_at::DATE, o.order_id,
+                   'Order #' || o.order_id || ' ' || o.status, o.updated_at
+            FROM orders o
+            JOIN products p ON p.product_id = o.product_id
+            WHERE o.status IN ('Approved', 'Fulfilled')
+        """)
+        order_sales = cur.rowcount
+
+    extra = max(args.transactions - order_sales, 0)
+    with Step(f"transactions ({extra} more)"):
+        batch = 500000
+        for start in range(0, extra, batch):
+            cur.execute("""
+                INSERT INTO transactions (product_id, transaction_type, quantity, unit_price,
+                                          total_amount, performed_by, transaction_date,
+                                          notes, created_at)
+                SELECT p.product_id, t.kind, t.qty, p.price, p.price * t.qty,
+                       (SELECT MIN(user_id) FROM users), t.at::DATE, 'Seeded', t.at
+                FROM (
+                    SELECT %(first_product)s + floor(random() * %(products)s)::INT
+                               AS product_id,
+                           (ARRAY['Sale', 'Sale', 'Purchase', 'Return', 'Adjustment'])
+                               [1 + floor(random() * 5)::INT] AS kind,
+                           1 + floor(random() * 10)::INT AS qty,
+                           now() - random() * make_interval(days => %(days)s) AS at
+                    FROM generate_series(1, %(count)s)
+                ) t
+                JOIN products p ON p.product_id = t.product_id
+            """, dict(products, days=args.days, count=min(batch, extra - start)))
+
+    with Step(f"notifications ({args.notifications} per user)"):
+        cur.execute("""
+            INSERT INTO notifications (user_id, message, notification_type, is_read,
+                                       related_entity_type, related_entity_id, created_at)
+            SELECT u.user_id, 'Seeded notification ' || n,
+                   (ARRAY['OrderCreated', 'OrderApproved', 'SystemAlert'])
+                       [1 + floor(random() * 3)::INT],
+                   random() < 0.8, NULL, NULL,
+                   now() - random() * make_interval(days => %s)
+            FROM users u
+            CROSS JOIN generate_series(1, %s) n
+            WHERE u.role IN ('Admin', 'InventoryManager', 'Sales')
+        """, (args.days, args.notifications))
+
+    with Step(f"audit partitions ({args.days} days)"):
+        cur.execute("""
+            SELECT create_audit_log_partition(m::DATE)
+            FROM generate_series(date_trunc('month', now() - make_interval(days => %s)),
+                                 date_trunc('month', now()), INTERVAL '1 month') m
+        """, (args.days,))
+
+    with Step(f"audit rows ({args.audit_rows})"):
+        batch = 500000
+        for start in range(0, args.audit_rows, batch):
+            cur.execute("""
+                INSERT INTO audit_log (table_name, record_id, action, changed_by,
+                                       old_values, new_values, created_at)
+                SELECT a.tbl, %(first_product)s + floor(random() * %(products)s)::INT,
+                       (ARRAY['INSERT', 'UPDATE', 'UPDATE', 'UPDATE', 'DELETE'])
+                           [1 + floor(random() * 5)::INT],
+                       (SELECT MIN(user_id) FROM users),
+                       jsonb_build_object('quantity', floor(random() * 500)::INT),
+                       jsonb_build_object('quantity', floor(random() * 500)::INT),
+                       a.at
+                FROM (
+                    SELECT (ARRAY['products', 'orders', 'transactions'])
+                               [1 + floor(random() * 3)::INT] AS tbl,
+                           now() - random() * make_interval(days => %(days)s) AS at
+                    FROM generate_series(1, %(count)s)
+                ) a
+            """, dict(products, days=args.days, count=min(batch, args.audit_rows - start)))
+
+
+def rebuild(cur):
+    with Step("sales_daily_rollup"):
+        cur.execute("SELECT refresh_sales_rollup()")
+    with Step("supplier_stats"):
+        cur.execute("SELECT rebuild_supplier_stats()")
+    with Step("notification_counters"):
+        cur.execute("SELECT rebuild_notification_counters()")
+    with Step("ANALYZE"):
+        cur.execute("ANALYZE")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--yes', action='store_true',
+                        help='confirm that the IMS tables in IMS_DB_NAME may be dropped')
+    parser.add_argument('--suppliers', type=int, default=200)
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--orders', type=int, default=200000)
+    parser.add_argument('--transactions', type=int, default=2000000,
+                        help='total transactions, including the Sales of processed orders')
+    parser.add_argument('--audit-rows', type=int, default=1000000)
+    parser.add_argument('--notifications', type=int, default=200, help='per user')
+    parser.add_argument('--users-per-role', type=int, default=20)
+    parser.add_argument('--password', default='bench123', help='password of the load-test users')
+    parser.add_argument('--days', type=int, default=365, help='history spanned by the data')
+    parser.add_argument('--seed', type=float, default=0.42, help='setseed() value, -1..1')
+    args = parser.parse_args()
+
+    dbname = database.DB_CONFIG['dbname']
+    if not args.yes:
+        parser.error(f"this drops and recreates every IMS table in database {dbname!r}; "
+                     "re-run with --yes to continue")
+
+    conn = database.connect()
+    cur = conn.cursor()
+    started = time.perf_counter()
+    try:
+        with Step(f"schema ({os.path.basename(SCHEMA)} -> {dbname})"):
+            with open(SCHEMA, encoding='utf-8') as f:
+                cur.execute(f.read())
+            conn.commit()
+
+        for table in TRIGGER_TABLES:
+            cur.execute(f"ALTER TABLE {table} DISABLE TRIGGER USER")
+        try:
+            seed(cur, args)
+        finally:
+            for table in TRIGGER_TABLES:
+                cur.execute(f"ALTER TABLE {table} ENABLE TRIGGER USER")
+        conn.commit()
+
+        rebuild(cur)
+        conn.commit()
+
+        cur.execute("""
+            SELECT (SELECT COUNT(*) FROM products), (SELECT COUNT(*) FROM orders),
+                   (SELECT COUNT(*) FROM transactions), (SELECT COUNT(*) FROM audit_log),
+                   (SELECT COUNT(*) FROM notifications), pg_size_pretty(pg_database_size(%s))
+        """, (dbname,))
+        products, orders, transactions, audit_rows, notifications, size = cur.fetchone()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+    print(f"seeded {products} products, {orders} orders, {transactions} transactions, "
+          f"{audit_rows} audit rows, {notifications} notifications "
+          f"in {time.perf_counter() - started:.0f}s; database size {size}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""Concurrency stress test for order-time stock reservations.
+
+Creates a handful of products with little stock, then fires thousands of
+create_order calls at them from many threads. With --process, orders are also
+approved, fulfilled, cancelled and moved back to Pending while new ones
+arrive. Afterwards every product is checked against its orders:
+
+  * quantity and reserved_quantity are never negative
+  * reserved_quantity equals the quantity of Pending, unsold orders
+  * quantity equals the opening stock minus what was sold and not returned
+
+Exits with status 1 if any check fails. The test products and their orders,
+transactions and rollup rows are removed afterwards unless --keep is given.
+
+    python benchmarks/stress_orders.py --orders 5000 --workers 64 --process
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from db_pool import ConnectionPool  # noqa: E402
+
+PROCESS_STATUSES = ['Approved', 'Fulfilled', 'Cancelled', 'Pending']
+
+
+def setup_products(count, stock):
+    run_id = uuid.uuid4().hex[:8]
+    conn = database.get_pool().connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO products (product_name, category, price, quantity, min_stocks)
+            SELECT 'stress-' || %s || '-' || n, 'Stress test', 9.99, %s, 0
+            FROM generate_series(1, %s) n
+            RETURNING product_id
+        """, (run_id, stock, count))
+        product_ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+    return product_ids
+
+
+def check_invariants(product_ids, stock):
+    conn = database.get_pool().connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            WITH sold AS (
+                SELECT o.order_id, o.product_id, o.status, o.quantity_ordered,
+                       COALESCE(SUM(CASE WHEN t.transaction_type = 'Sale' THEN t.quantity
+                                         ELSE -t.quantity END), 0) AS net_sold
+                FROM orders o
+                LEFT JOIN transactions t ON t.reference_id = o.order_id
+                    AND t.transaction_type IN ('Sale', 'Return')
+                WHERE o.product_id = ANY(%s)
+                GROUP BY o.order_id
+            )
+            SELECT p.product_id, p.quantity, p.reserved_quantity,
+                   COALESCE(SUM(s.quantity_ordered) FILTER (
+                       WHERE s.status = 'Pending' AND s.net_sold = 0), 0) AS expected_reserved,
+                   COALESCE(SUM(s.net_sold), 0) AS net_sold
+            FROM products p
+            LEFT JOIN sold s ON s.product_id = p.product_id
+            WHERE p.product_id = ANY(%s)
+            GROUP BY p.product_id
+            ORDER BY p.product_id
+        """, (product_ids, product_ids))
+        rows = cur.fetchall()
+        cur.close()
+    finally:
+        conn.close()
+
+    failures = []
+    for product_id, quantity, reserved, expected_reserved, net_sold in rows:
+        print(f"product {product_id}: quantity={quantity} reserved={reserved} "
+              f"sold={net_sold} available={quantity - reserved}")
+        if quantity < 0 or reserved < 0:
+            failures.append(f"product {product_id}: negative stock or reservation")
+        if reserved != expected_reserved:
+            failures.append(f"product {product_id}: reserved {reserved}, "
+                            f"Pending orders hold {expected_reserved}")
+        if quantity != stock - net_sold:
+            failures.append(f"product {product_id}: quantity {quantity}, "
+                            f"expected {stock} - {net_sold} sold")
+        if net_sold > stock:
+            failures.append(f"product {product_id}: oversold ({net_sold} > {stock})")
+    return failures
+
+
+def cleanup(product_ids):
+    conn = database.get_pool().connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM transactions WHERE product_id = ANY(%s)", (product_ids,))
+        cur.execute("DELETE FROM sales_daily_rollup WHERE product_id = ANY(%s)", (product_ids,))
+        cur.execute("DELETE FROM orders WHERE product_id = ANY(%s)", (product_ids,))
+        cur.execute("DELETE FROM products WHERE product_id = ANY(%s)", (product_ids,))
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=5)
+    parser.add_argument('--stock', type=int, default=100, help='opening stock per product')
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--max-quantity', type=int, default=3)
+    parser.add_argument('--process', action='store_true',
+                        help='also approve/cancel/re-open orders concurrently')
+    parser.add_argument('--user-id', type=int, default=1, help='user recorded on the orders')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--keep', action='store_true', help='leave the test data in place')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    database.set_pool(ConnectionPool(database.connect, minconn=1, maxconn=args.workers,
+                                     timeout=30))
+    product_ids = setup_products(args.products, args.stock)
+    created = []
+    created_lock = threading.Lock()
+    outcomes = Counter()
+    outcomes_lock = threading.Lock()
+
+    def record(outcome):
+        with outcomes_lock:
+            outcomes[outcome] += 1
+
+    def place_order(product_id, quantity):
+        try:
+            order_id, _ = database.create_order(product_id, quantity, args.user_id, 'stress test')
+        except Exception as e:
+            record('rejected: insufficient stock' if 'Insufficient stock' in str(e)
+                   else f'error: {str(e).splitlines()[0]}')
+            return
+        record('created')
+        with created_lock:
+            created.append(order_id)
+
+    def process_some(status):
+        with created_lock:
+            if not created:
+                return
+            order_id = rng.choice(created)
+        try:
+            database.process_order(order_id, status, args.user_id)
+            record(f'processed: {status}')
+        except Exception as e:
+            record('rejected: insufficient stock' if 'Insufficient stock' in str(e)
+                   else f'error: {str(e).splitlines()[0]}')
+
+    tasks = []
+    for _ in range(args.orders):
+        tasks.append((place_order, rng.choice(product_ids), rng.randint(1, args.max_quantity)))
+        if args.process and rng.random() < 0.5:
+            tasks.append((process_some, rng.choice(PROCESS_STATUSES)))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for future in [executor.submit(task[0], *task[1:]) for task in tasks]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    print(f"{len(tasks)} operations in {elapsed:.2f}s ({len(tasks) / elapsed:.0f} ops/s)")
+    for outcome, count in sorted(outcomes.items()):
+        print(f"  {outcome:<40} {count}")
+
+    failures = check_invariants(product_ids, args.stock)
+    if not args.keep:
+        cleanup(product_ids)
+    if failures:
+        print('FAILED')
+        for failure in failures:
+            print('  ' + failure)
+        sys.exit(1)
+    print('OK: no negative, oversold or leaked stock')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class FileGeneration:
+    """Cross-process invalidation marker backed by a file.
+
+    bump() atomically replaces the file, so every process sees a new
+    (inode, mtime) pair on its next stat() and knows to drop its copy. Only
+    the invalidation is shared; cached values stay per process.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def current(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def bump(self):
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        try:
+            os.write(fd, str(time.time_ns()).encode())
+        finally:
+            os.close(fd)
+        os.replace(tmp, self.path)
+
+
+class TTLCache:
+    """Small thread-safe LRU cache whose entries expire after ``ttl`` seconds.
+
+    Keeps hit/miss/eviction counters so the hit ratio can be checked in
+    production via stats(). With a ``generation`` (see FileGeneration),
+    invalidate() in any process clears the cache in all of them.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60.0, generation=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = generation
+        self._seen_generation = generation.current() if generation else None
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Bumped whenever entries are dropped, so get_or_load() does not store
+        # a value whose load overlapped the drop
+        self._epoch = 0
+
+    def _check_generation(self):
+        # Caller holds the lock
+        current = self.generation.current()
+        if current != self._seen_generation:
+            self._seen_generation = current
+            self._data.clear()
+            self._epoch += 1
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            if self.generation is not None:
+                self._check_generation()
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not _MISSING:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for ``key``, calling ``loader()`` on a miss.
+
+        ``None`` results are not cached so a missing row is re-checked next time.
+        """
+        epoch = self._epoch
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            if value is not None and epoch == self._epoch:
+                self.set(key, value)
+        return value
+
+    def invalidate(self, key=_MISSING):
+        """Drop one key, or everything when called without arguments.
+
+        A shared generation is bumped either way, so other processes drop
+        their whole copy.
+        """
+        with self._lock:
+            self.invalidations += 1
+            self._epoch += 1
+            if key is _MISSING:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+            if self.generation is not None:
+                self.generation.bump()
+                self._seen_generation = self.generation.current()
+
+    def clear(self):
+        """Drop this process's entries without touching the shared generation."""
+        with self._lock:
+            self._data.clear()
+            self._epoch += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'shared': self.generation is not None,
+            }
@@ -0,0 +1,86 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsSnapshot:
+    """Dashboard KPIs computed by one query and served from memory.
+
+    A background thread, started by the first get(), recomputes the snapshot
+    every ``refresh_interval`` seconds. get() does not return a snapshot older
+    than ``max_age`` seconds: if the refresher has fallen behind or died, the
+    request that notices refreshes it inline, while concurrent requests keep
+    serving the previous snapshot until that refresh lands.
+    """
+
+    def __init__(self, load, max_age=30.0, refresh_interval=None):
+        self._load = load
+        self.max_age = max_age
+        self.refresh_interval = refresh_interval or max_age / 2
+        self._snapshot = None
+        self._loaded_at = None
+        self._refresh_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+        self.refreshes = 0
+        self.inline_refreshes = 0
+        self.failures = 0
+
+    def age(self):
+        return None if self._loaded_at is None else time.monotonic() - self._loaded_at
+
+    def refresh(self):
+        with self._refresh_lock:
+            snapshot = self._load()
+            snapshot['generated_at'] = time.time()
+            self._snapshot, self._loaded_at = snapshot, time.monotonic()
+            self.refreshes += 1
+            return snapshot
+
+    def get(self):
+        if not self._stopping.is_set() and (self._thread is None or not self._thread.is_alive()):
+            self.start()
+        age = self.age()
+        if age is None or age > self.max_age:
+            # Another thread is already refreshing: serve what we have
+            if self._snapshot is not None and self._refresh_lock.locked():
+                return dict(self._snapshot, age=round(age, 1))
+            self.inline_refreshes += 1
+            self.refresh()
+            age = self.age()
+        return dict(self._snapshot, age=round(age, 1))
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name='dashboard-metrics',
+                                                daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                self.failures += 1
+                logger.exception('Dashboard metrics refresh failed')
+            self._stopping.wait(self.refresh_interval)
+
+    def stats(self):
+        age = self.age()
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'age': None if age is None else round(age, 1),
+            'max_age': self.max_age,
+            'refresh_interval': self.refresh_interval,
+            'refreshes': self.refreshes,
+            'inline_refreshes': self.inline_refreshes,
+            'failures': self.failures,
+        }
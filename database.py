@@ -1,25 +1,291 @@
+import json
+import os
+import threading
+from datetime import date
+
 import psycopg2
+import psycopg2.extensions
 from psycopg2.extras import RealDictCursor
+from flask import g, has_app_context
 
-def get_db_connection():
-    conn = psycopg2.connect(
-        dbname="inventory_management",
-        user="postgres",
-        password="lab@123",
-        host="localhost",
-        port="5432"
+from cache import FileGeneration, TTLCache
+from db_pool import ConnectionPool, PooledConnection
+from metrics import MetricsRegistry
+from sql_instrumentation import SQLInstrumentation
+
+DB_CONFIG = {
+    'dbname': os.environ.get('IMS_DB_NAME', 'inventory_management'),
+    'user': os.environ.get('IMS_DB_USER', 'postgres'),
+    'password': os.environ.get('IMS_DB_PASSWORD', 'lab@123'),
+    'host': os.environ.get('IMS_DB_HOST', 'localhost'),
+    'port': os.environ.get('IMS_DB_PORT', '5432'),
+}
+
+POOL_CONFIG = {
+    'minconn': int(os.environ.get('IMS_DB_POOL_MIN', 1)),
+    'maxconn': int(os.environ.get('IMS_DB_POOL_MAX', 10)),
+    'timeout': float(os.environ.get('IMS_DB_POOL_TIMEOUT', 5)),
+    'max_idle': float(os.environ.get('IMS_DB_POOL_MAX_IDLE', 300)),
+    'health_check_after': float(os.environ.get('IMS_DB_POOL_HEALTH_CHECK_AFTER', 30)),
+}
+
+# 'async' queues audit rows in audit_log_queue for app.audit_flusher to write
+# in batches (see route_audit_event() in ims_sql.sql); 'sync' writes them inline.
+AUDIT_MODE = os.environ.get('IMS_AUDIT_MODE', 'sync')
+if AUDIT_MODE not in ('sync', 'async'):
+    raise ValueError(f"IMS_AUDIT_MODE must be 'sync' or 'async', got {AUDIT_MODE!r}")
+
+# Times every statement run on a pooled connection; see sql_instrumentation.py.
+# Set IMS_SQL_INSTRUMENTATION=0 to hand out plain cursors instead.
+sql_instrumentation = None
+if os.environ.get('IMS_SQL_INSTRUMENTATION', '1') != '0':
+    sql_instrumentation = SQLInstrumentation(
+        slow_ms=float(os.environ.get('IMS_SQL_SLOW_MS', 200)),
+        n_plus_one=int(os.environ.get('IMS_SQL_N_PLUS_ONE', 10)),
     )
-    return conn
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Served at /metrics. With IMS_METRICS_DIR set, every worker process writes its
+# values there and /metrics reports the sum over all of them.
+metrics_registry = MetricsRegistry(
+    directory=os.environ.get('IMS_METRICS_DIR') or None,
+    flush_interval=float(os.environ.get('IMS_METRICS_FLUSH_INTERVAL', 5)),
+)
+ORDERS_CREATED = metrics_registry.counter(
+    'ims_orders_created_total', 'Orders created', ('channel',))
+ORDERS_PROCESSED = metrics_registry.counter(
+    'ims_orders_processed_total', 'Order status changes applied', ('status',))
+ORDER_FAILURES = metrics_registry.counter(
+    'ims_order_failures_total', 'Order creations or status changes that were rejected',
+    ('operation',))
+NOTIFICATION_FANOUT = metrics_registry.histogram(
+    'ims_notification_fanout_recipients', 'Recipients per notification broadcast',
+    ('notification_type',), buckets=(1, 2, 5, 10, 25, 50, 100, 250, 1000))
+POOL_CONNECTIONS = metrics_registry.gauge(
+    'ims_db_pool_connections', 'Pooled database connections', ('state',))
+POOL_MAX_CONNECTIONS = metrics_registry.gauge(
+    'ims_db_pool_max_connections', 'Upper bound on pooled connections')
+POOL_CHECKOUTS = metrics_registry.counter(
+    'ims_db_pool_checkouts_total', 'Connections handed out by the pool')
+POOL_WAITS = metrics_registry.counter(
+    'ims_db_pool_waits_total', 'Checkouts that had to wait for a free connection')
+POOL_WAIT_SECONDS = metrics_registry.counter(
+    'ims_db_pool_wait_seconds_total', 'Time spent waiting for a free connection')
+POOL_WAIT_SECONDS_MAX = metrics_registry.gauge(
+    'ims_db_pool_wait_seconds_max', 'Longest wait for a free connection', aggregate='max')
+POOL_EXHAUSTED = metrics_registry.counter(
+    'ims_db_pool_exhausted_total', 'Checkouts that timed out with the pool exhausted')
+
+
+def _collect_pool_metrics():
+    if _pool is None:
+        return
+    stats = _pool.stats()
+    POOL_CONNECTIONS.set(stats['idle'], state='idle')
+    POOL_CONNECTIONS.set(stats['in_use'], state='in_use')
+    POOL_MAX_CONNECTIONS.set(stats['maxconn'])
+    POOL_CHECKOUTS.set(stats['checkouts'])
+    POOL_WAITS.set(stats['waits'])
+    POOL_WAIT_SECONDS.set(stats['wait_time_total'])
+    POOL_WAIT_SECONDS_MAX.set(stats['wait_time_max'])
+    POOL_EXHAUSTED.set(stats['exhausted'])
+
+
+metrics_registry.add_collector(_collect_pool_metrics)
+
+# get_sales_report() results keyed by (start_date, end_date). Dropped whenever
+# this process records a Sale or Return; the TTL bounds how stale a report can
+# be after sales recorded by other processes.
+sales_report_cache = TTLCache(
+    maxsize=int(os.environ.get('IMS_SALES_REPORT_CACHE_SIZE', 256)),
+    ttl=float(os.environ.get('IMS_SALES_REPORT_CACHE_TTL', 60)),
+)
+SALES_TRANSACTION_TYPES = ('Sale', 'Return')
+
+# The supplier list used by the product forms and supplier pages. Changes
+# rarely, so it is cached until a supplier is added, edited or deleted. With
+# IMS_CACHE_DIR set, those invalidations reach every worker process through
+# a generation file in that directory.
+CACHE_DIR = os.environ.get('IMS_CACHE_DIR')
+supplier_cache = TTLCache(
+    maxsize=4,
+    ttl=float(os.environ.get('IMS_SUPPLIER_CACHE_TTL', 300)),
+    generation=FileGeneration(os.path.join(CACHE_DIR, 'suppliers.gen')) if CACHE_DIR else None,
+)
+
+# Caches of data read from a table in table_versions; see get_table_versions()
+VERSIONED_CACHES = {
+    'suppliers': (supplier_cache,),
+    'products': (sales_report_cache,),
+    'sales_daily_rollup': (sales_report_cache,),
+}
+_seen_table_versions = {}
+
+
+def connect(audit_mode=None):
+    """Open a new, unpooled connection (used by the pool and by listeners)."""
+    return psycopg2.connect(**DB_CONFIG,
+                            options=f"-c ims.audit_mode={audit_mode or AUDIT_MODE}")
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(connect, instrumentation=sql_instrumentation,
+                                       **POOL_CONFIG)
+    return _pool
+
+
+def set_pool(pool):
+    """Replace the process-wide pool (e.g. with one built on a fake factory)."""
+    global _pool
+    with _pool_lock:
+        old, _pool = _pool, pool
+    if old is not None and old is not pool:
+        old.closeall()
+
+
+class _RequestConnection(PooledConnection):
+    """Connection shared by everything in one app context.
+
+    Helpers keep calling close() when they are done; the connection only goes
+    back to the pool when the app context is torn down.
+    """
+
+    def close(self):
+        pass
+
+
+def get_db_connection():
+    if has_app_context():
+        conn = g.get('_db_conn')
+        if conn is None or conn.closed:
+            conn = g._db_conn = _RequestConnection(get_pool(), get_pool().getconn())
+        elif conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+            # A previous query in this request failed without a rollback.
+            conn.rollback()
+        return conn
+    return get_pool().connection()
+
+
+def release_db_connection(exc=None):
+    """Teardown hook: return the app context's connection to the pool."""
+    conn = g.pop('_db_conn', None)
+    if conn is not None:
+        conn.release()
+
+
+def get_table_versions(tables):
+    """{table: (version, changed_at)} for HTTP validators: table_versions plus
+    the changes not yet compacted into it (see compact_table_changes()).
+
+    Counting the pending changes is cheap only while the table-changes
+    compactor keeps up; /api/admin/background-jobs shows the backlog.
+
+    Drops this process's cached copies of a table's data the first time it
+    sees the table at a new version, so that a response validated against that
+    version is not built from older cached rows.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT v.table_name, v.version + c.changes, GREATEST(v.changed_at, c.changed_at)
+            FROM table_versions v
+            CROSS JOIN LATERAL (
+                SELECT COUNT(*) AS changes, MAX(changed_at) AS changed_at
+                FROM table_changes
+                WHERE table_name = v.table_name
+            ) c
+            WHERE v.table_name = ANY(%s)
+        """, (list(tables),))
+        versions = {name: (version, changed_at) for name, version, changed_at in cur.fetchall()}
+    finally:
+        cur.close()
+        conn.close()
+    for name, version in versions.items():
+        if _seen_table_versions.get(name) != version:
+            for cache in VERSIONED_CACHES.get(name, ()):
+                cache.clear()
+            _seen_table_versions[name] = version
+    return versions
+
+
+PRODUCT_COLUMNS = "product_id, product_name, category, price, quantity, supplier_id, min_stocks"
+
+# Sort keys accepted from the query string -> ORDER BY column
+PRODUCT_SORT_COLUMNS = {
+    'id': 'product_id',
+    'name': 'product_name',
+    'category': 'category',
+    'price': 'price',
+    'stock': 'quantity',
+}
+
+def _like_pattern(text):
+    """Escape LIKE wildcards in user input."""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
 
 def get_products():
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("SELECT * FROM products WHERE is_deleted = FALSE")
+    cur.execute(f"SELECT {PRODUCT_COLUMNS} FROM products WHERE is_deleted = FALSE")
     products = cur.fetchall()
     cur.close()
     conn.close()
     return products
 
+def search_products(search=None, sort='name', descending=False, limit=50, offset=0):
+    """One page of active products matching ``search`` in name or category.
+
+    Returns (rows, has_more).
+    """
+    column = PRODUCT_SORT_COLUMNS.get(sort, 'product_name')
+    direction = 'DESC' if descending else 'ASC'
+    conditions = ["is_deleted = FALSE"]
+    params = []
+    if search:
+        pattern = f"%{_like_pattern(search)}%"
+        conditions.append("(product_name ILIKE %s OR category ILIKE %s)")
+        params.extend([pattern, pattern])
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute(f"""
+            SELECT {PRODUCT_COLUMNS}
+            FROM products
+            WHERE {" AND ".join(conditions)}
+            ORDER BY {column} {direction}, product_id {direction}
+            LIMIT %s OFFSET %s
+        """, params + [limit + 1, offset])
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+    return rows[:limit], len(rows) > limit
+
+def product_typeahead(prefix, limit=10):
+    """Active products whose name starts with ``prefix`` (case-insensitive)."""
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute("""
+            SELECT product_id, product_name, price, quantity,
+                   quantity - reserved_quantity AS available
+            FROM products
+            WHERE is_deleted = FALSE AND lower(product_name) LIKE lower(%s)
+            ORDER BY lower(product_name)
+            LIMIT %s
+        """, (f"{_like_pattern(prefix)}%", limit))
+        return cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+
 def get_orders():
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
@@ -33,7 +299,33 @@ def get_orders():
     conn.close()
     return orders
 
-def get_sales_report(start_date, end_date):
+def get_order_details(order_id):
+    """(order, transactions): the order with product and creator names, or None,
+    and the ledger entries recorded against it, newest first."""
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute("""
+            SELECT o.*, p.product_name, u.username AS added_by_username
+            FROM orders o
+            JOIN products p ON p.product_id = o.product_id
+            JOIN users u ON u.user_id = o.added_by
+            WHERE o.order_id = %s
+        """, (order_id,))
+        order = cur.fetchone()
+        cur.execute("""
+            SELECT t.*, u.username AS performed_by_username
+            FROM transactions t
+            LEFT JOIN users u ON t.performed_by = u.user_id
+            WHERE t.reference_id = %s
+            ORDER BY t.created_at DESC
+        """, (order_id,))
+        return order, cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+
+def _load_sales_report(start_date, end_date):
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     cur.execute("SELECT * FROM get_sales_report(%s, %s)", (start_date, end_date))
@@ -42,6 +334,29 @@ def get_sales_report(start_date, end_date):
     conn.close()
     return report
 
+def get_sales_report(start_date, end_date):
+    """Per-product Sale totals between two dates (inclusive), cached."""
+    return sales_report_cache.get_or_load(
+        (str(start_date), str(end_date)),
+        lambda: _load_sales_report(start_date, end_date))
+
+def refresh_sales_rollup(start_date=None, end_date=None):
+    """Rebuild sales_daily_rollup from transactions; returns the rows written."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT refresh_sales_rollup(%s, %s)", (start_date, end_date))
+        rows = cur.fetchone()[0]
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        cur.close()
+        conn.close()
+    sales_report_cache.invalidate()
+    return rows
+
 def get_low_stock():
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
@@ -51,6 +366,270 @@ def get_low_stock():
     conn.close()
     return low_stock
 
+def get_dashboard_metrics():
+    """Current dashboard KPIs in one round trip (see dashboard_metrics.MetricsSnapshot)."""
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM users WHERE is_active = TRUE) AS active_users,
+                p.product_count,
+                p.stock_value,
+                (SELECT COUNT(*) FROM orders WHERE status = 'Pending') AS pending_orders,
+                (SELECT COUNT(*) FROM vw_low_stock) AS low_stock_count,
+                COALESCE(r.total_sales, 0) AS sales_today,
+                COALESCE(r.total_quantity, 0) AS units_sold_today
+            FROM (
+                SELECT COUNT(*) AS product_count,
+                       COALESCE(SUM(quantity * price), 0) AS stock_value
+                FROM products
+                WHERE is_deleted = FALSE
+            ) p
+            CROSS JOIN (
+                SELECT SUM(total_sales) AS total_sales, SUM(total_quantity) AS total_quantity
+                FROM sales_daily_rollup
+                WHERE sale_date = CURRENT_DATE
+            ) r
+        """)
+        row = cur.fetchone()
+        return {
+            'active_users': row['active_users'],
+            'product_count': row['product_count'],
+            'stock_value': float(row['stock_value']),
+            'pending_orders': row['pending_orders'],
+            'low_stock_count': row['low_stock_count'],
+            'sales_today': float(row['sales_today']),
+            'units_sold_today': int(row['units_sold_today']),
+        }
+    finally:
+        cur.close()
+        conn.close()
+
+def encode_page_cursor(sort_value, row_id):
+    """Opaque keyset cursor for the row a page ended on."""
+    if not isinstance(sort_value, str):
+        sort_value = sort_value.isoformat()
+    return f"{sort_value}|{row_id}"
+
+def decode_page_cursor(cursor):
+    """Inverse of encode_page_cursor; raises ValueError on a malformed cursor."""
+    sort_value, _, row_id = cursor.rpartition('|')
+    if not sort_value:
+        raise ValueError('Invalid page cursor')
+    return sort_value, int(row_id)
+
+# transaction_date is nullable: the ledger sorts undated rows last, as
+# -infinity, in ORDER BY, in the cursor and in the idx_transactions_* indexes
+LEDGER_SORT_DATE = "COALESCE(t.transaction_date, '-infinity'::date)"
+
+def get_transactions_page(limit=50, cursor=None, product_id=None, transaction_type=None,
+                          start_date=None, end_date=None, performed_by=None):
+    """One page of the ledger, newest first, keyed on (transaction_date, transaction_id).
+
+    Returns (rows, next_cursor); next_cursor is None on the last page. Raises
+    ValueError on a malformed cursor.
+    """
+    conditions = []
+    params = []
+    if product_id is not None:
+        conditions.append("t.product_id = %s")
+        params.append(product_id)
+    if transaction_type:
+        conditions.append("t.transaction_type = %s")
+        params.append(transaction_type)
+    if start_date:
+        conditions.append("t.transaction_date >= %s")
+        params.append(start_date)
+    if end_date:
+        conditions.append("t.transaction_date <= %s")
+        params.append(end_date)
+    if performed_by:
+        conditions.append("u.username = %s")
+        params.append(performed_by)
+    if cursor:
+        sort_date, row_id = decode_page_cursor(cursor)
+        try:
+            if sort_date != '-infinity':
+                date.fromisoformat(sort_date)
+        except ValueError:
+            raise ValueError('Invalid page cursor') from None
+        conditions.append(f"({LEDGER_SORT_DATE}, t.transaction_id) < (%s::date, %s)")
+        params.extend((sort_date, row_id))
+    where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute(f"""
+            SELECT t.transaction_id, t.product_id, p.product_name, t.transaction_type, t.quantity,
+                   t.total_amount, u.username AS performed_by, t.transaction_date, t.notes
+            FROM transactions t
+            LEFT JOIN products p ON t.product_id = p.product_id
+            LEFT JOIN users u ON t.performed_by = u.user_id
+            {where}
+            ORDER BY {LEDGER_SORT_DATE} DESC, t.transaction_id DESC
+            LIMIT %s
+        """, params + [limit + 1])
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        last_date = last['transaction_date']
+        next_cursor = encode_page_cursor(last_date.isoformat() if last_date else '-infinity',
+                                         last['transaction_id'])
+    return rows, next_cursor
+
+def get_audit_log_page(limit=50, cursor=None, table_name=None, action=None,
+                       changed_by=None, start_time=None, end_time=None):
+    """One page of the audit log, newest first, keyed on (created_at, log_id).
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    conditions = []
+    params = []
+    if table_name:
+        conditions.append("al.table_name = %s")
+        params.append(table_name)
+    if action:
+        conditions.append("al.action = %s")
+        params.append(action)
+    if changed_by:
+        conditions.append("al.changed_by = (SELECT user_id FROM users WHERE username = %s)")
+        params.append(changed_by)
+    if start_time:
+        conditions.append("al.created_at >= %s")
+        params.append(start_time)
+    if end_time:
+        conditions.append("al.created_at <= %s")
+        params.append(end_time)
+    if cursor:
+        conditions.append("(al.created_at, al.log_id) < (%s::timestamp, %s)")
+        params.extend(decode_page_cursor(cursor))
+    where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute(f"""
+            SELECT al.log_id, al.table_name, al.record_id, al.action, al.created_at,
+                   u.username AS changed_by, u.role
+            FROM audit_log al
+            LEFT JOIN users u ON al.changed_by = u.user_id
+            {where}
+            ORDER BY al.created_at DESC, al.log_id DESC
+            LIMIT %s
+        """, params + [limit + 1])
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_page_cursor(last['created_at'], last['log_id'])
+    return rows, next_cursor
+
+def run_audit_log_maintenance(months_ahead=3, retain_months=12, drop=True):
+    """Create upcoming audit_log partitions and detach expired ones.
+
+    Returns the names of the partitions that exist for the coming months.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT ensure_audit_log_partitions(%s)", (months_ahead,))
+        partitions = [row[0] for row in cur.fetchall()]
+        cur.execute("CALL purge_audit_log_partitions(%s, %s)", (retain_months, drop))
+        conn.commit()
+        return partitions
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        cur.close()
+        conn.close()
+
+def flush_audit_queue(batch_size=5000):
+    """Move up to ``batch_size`` queued audit rows into audit_log."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT flush_audit_queue(%s)", (batch_size,))
+        flushed = cur.fetchone()[0]
+        conn.commit()
+        return flushed
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        cur.close()
+        conn.close()
+
+def compact_table_changes(batch_size=5000):
+    """Fold up to ``batch_size`` logged table changes into table_versions."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT compact_table_changes(%s)", (batch_size,))
+        compacted = cur.fetchone()[0]
+        conn.commit()
+        return compacted
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        cur.close()
+        conn.close()
+
+def apply_notification_counter_deltas(batch_size=5000):
+    """Fold up to ``batch_size`` pending unread-count deltas into notification_counters."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT apply_notification_counter_deltas(%s)", (batch_size,))
+        applied = cur.fetchone()[0]
+        conn.commit()
+        return applied
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        cur.close()
+        conn.close()
+
+def get_audit_queue_depth():
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT COUNT(*) FROM audit_log_queue")
+        return cur.fetchone()[0]
+    finally:
+        cur.close()
+        conn.close()
+
+def get_background_queue_depths():
+    """Rows waiting in each queue the background jobs drain, by table."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT (SELECT COUNT(*) FROM audit_log_queue),
+                   (SELECT COUNT(*) FROM notification_counter_deltas),
+                   (SELECT COUNT(*) FROM supplier_stat_deltas),
+                   (SELECT COUNT(*) FROM table_changes)
+        """)
+        return dict(zip(('audit_log_queue', 'notification_counter_deltas',
+                         'supplier_stat_deltas', 'table_changes'), cur.fetchone()))
+    finally:
+        cur.close()
+        conn.close()
+
 def add_product(product_name, category, price, quantity, supplier_id, added_by, min_stocks=5):
     try:
         conn = get_db_connection()
@@ -70,28 +649,116 @@ def add_product(product_name, category, price, quantity, supplier_id, added_by,
 def create_order(product_id, quantity, added_by, notes=None):
     conn = get_db_connection()
     cur = conn.cursor()
-    order_id = None
-    status = None
     try:
-        cur.execute("CALL create_order(%s, %s, %s, %s, %s, %s)", (product_id, quantity, added_by, notes, order_id, status))
-        conn.commit()
-        cur.execute("SELECT %s, %s", (order_id, status))
+        # The CALL returns its INOUT parameters (order_id, status) as a row
+        cur.execute("CALL create_order(%s, %s, %s, %s, %s, %s)",
+                    (product_id, quantity, added_by, notes, None, None))
         order_id, status = cur.fetchone()
+        conn.commit()
     except Exception as e:
         conn.rollback()
+        ORDER_FAILURES.inc(operation='create')
         raise e
     finally:
         cur.close()
         conn.close()
+    ORDERS_CREATED.inc(channel='single')
     return order_id, status
 
 def process_order(order_id, status, processed_by, notes=None):
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("CALL process_order(%s, %s, %s, %s)", (order_id, status, processed_by, notes))
-    conn.commit()
-    cur.close()
-    conn.close()
+    try:
+        cur.execute("CALL process_order(%s, %s, %s, %s)", (order_id, status, processed_by, notes))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        ORDER_FAILURES.inc(operation='process')
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    ORDERS_PROCESSED.inc(status=status)
+    # Approving or cancelling an order records a Sale or Return
+    sales_report_cache.invalidate()
+
+def _batch_items(items, fields):
+    """Normalise a list of batch items to dicts holding only ``fields``."""
+    if not isinstance(items, list) or not items:
+        raise ValueError('Expected a non-empty list of items')
+    normalised = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f'Item {index} must be an object')
+        normalised.append({field: item.get(field) for field in fields})
+    return normalised
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def create_orders_batch(items, added_by):
+    """Create many orders in one round trip.
+
+    ``items`` is a list of {product_id, quantity, notes} dicts. Returns one
+    dict per item, in input order, with either order_id/status or error.
+    Valid items are committed even when others fail.
+    """
+    items = _batch_items(items, ('product_id', 'quantity', 'notes'))
+    for item in items:
+        item['product_id'] = _as_int(item['product_id'])
+        item['quantity'] = _as_int(item['quantity'])
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute("SELECT * FROM create_orders_batch(%s, %s::jsonb)",
+                    (added_by, json.dumps(items)))
+        results = sorted(cur.fetchall(), key=lambda r: r['item_index'])
+        conn.commit()
+        for r in results:
+            if r['error']:
+                ORDER_FAILURES.inc(operation='create')
+            else:
+                ORDERS_CREATED.inc(channel='batch')
+        return results
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        cur.close()
+        conn.close()
+
+def process_orders_batch(items, processed_by):
+    """Apply many order status changes in one round trip.
+
+    ``items`` is a list of {order_id, status, notes} dicts. Returns one dict
+    per item, in input order, with old/new status or error.
+    """
+    items = _batch_items(items, ('order_id', 'status', 'notes'))
+    for item in items:
+        item['order_id'] = _as_int(item['order_id'])
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute("SELECT * FROM process_orders_batch(%s, %s::jsonb)",
+                    (processed_by, json.dumps(items)))
+        results = sorted(cur.fetchall(), key=lambda r: r['item_index'])
+        conn.commit()
+        sales_report_cache.invalidate()
+        for r in results:
+            if r['error']:
+                ORDER_FAILURES.inc(operation='process')
+            else:
+                ORDERS_PROCESSED.inc(status=r['new_status'])
+        return results
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        cur.close()
+        conn.close()
 
 def user_login(username, password, ip_address=None, user_agent=None):
     conn = get_db_connection()
@@ -124,16 +791,97 @@ def update_stock(product_id, quantity_change, transaction_type, performed_by, no
     conn.commit()
     cur.close()
     conn.close()
+    if transaction_type in SALES_TRANSACTION_TYPES:
+        sales_report_cache.invalidate()
 
-def get_suppliers():
+def _load_suppliers():
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     cur.execute("SELECT * FROM suppliers ORDER BY supplier_name")
-    suppliers = cur.fetchall()
+    suppliers = [dict(row) for row in cur.fetchall()]
     cur.close()
     conn.close()
     return suppliers
 
+def get_suppliers():
+    """All suppliers ordered by name, from supplier_cache. Do not mutate the result."""
+    return supplier_cache.get_or_load('all', _load_suppliers)
+
+def get_supplier(supplier_id):
+    return next((s for s in get_suppliers() if s['supplier_id'] == supplier_id), None)
+
+def get_supplier_products(supplier_id):
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute("""
+            SELECT product_id, product_name, quantity
+            FROM products
+            WHERE supplier_id = %s AND is_deleted = FALSE
+            ORDER BY product_name
+        """, (supplier_id,))
+        return cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+
+def get_supplier_stats():
+    """Supplier report rows: supplier_stats plus the deltas not yet folded in.
+
+    Reads one row per supplier and the pending supplier_stat_deltas, never
+    the products or transactions tables.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute("""
+            SELECT
+                s.supplier_id,
+                s.supplier_name,
+                COALESCE(st.product_count, 0) AS product_count,
+                COALESCE(st.total_stock, 0) AS total_stock,
+                st.price_sum / NULLIF(st.product_count, 0) AS avg_price,
+                COALESCE(st.units_sold, 0) AS units_sold,
+                COALESCE(st.revenue, 0) AS revenue,
+                -- Units sold per unit currently on hand
+                st.units_sold::NUMERIC / NULLIF(st.total_stock, 0) AS stock_turnover
+            FROM suppliers s
+            LEFT JOIN (
+                SELECT supplier_id, SUM(product_count) AS product_count,
+                       SUM(total_stock) AS total_stock, SUM(price_sum) AS price_sum,
+                       SUM(units_sold) AS units_sold, SUM(revenue) AS revenue
+                FROM (
+                    SELECT supplier_id, product_count, total_stock, price_sum, units_sold, revenue
+                    FROM supplier_stats
+                    UNION ALL
+                    SELECT supplier_id, product_count, total_stock, price_sum, units_sold, revenue
+                    FROM supplier_stat_deltas
+                ) totals
+                GROUP BY supplier_id
+            ) st ON st.supplier_id = s.supplier_id
+            ORDER BY product_count DESC, s.supplier_name
+        """)
+        return cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+
+def apply_supplier_stat_deltas(batch_size=5000):
+    """Fold up to ``batch_size`` pending supplier_stat_deltas into supplier_stats."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT apply_supplier_stat_deltas(%s)", (batch_size,))
+        applied = cur.fetchone()[0]
+        conn.commit()
+        return applied
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        cur.close()
+        conn.close()
+
 def add_supplier_to_db(supplier_name, contact_info):
     conn = get_db_connection()
     cur = conn.cursor()
@@ -144,6 +892,7 @@ def add_supplier_to_db(supplier_name, contact_info):
     conn.commit()
     cur.close()
     conn.close()
+    supplier_cache.invalidate()
 
 def update_supplier(supplier_id, supplier_name, contact_info):
     conn = get_db_connection()
@@ -154,6 +903,7 @@ def update_supplier(supplier_id, supplier_name, contact_info):
             (supplier_name, contact_info, supplier_id)
         )
         conn.commit()
+        supplier_cache.invalidate()
     except Exception as e:
         raise e  # Re-raise the exception to handle it in the route
     finally:
@@ -171,32 +921,65 @@ def delete_supplier(supplier_id):
         
         cur.execute("DELETE FROM suppliers WHERE supplier_id = %s", (supplier_id,))
         conn.commit()
+        supplier_cache.invalidate()
     except Exception as e:
         raise e
     finally:
         cur.close()
         conn.close()
-# Add these new functions to database.py
+def create_notifications(user_ids, message, notification_type, related_entity_type=None,
+                         related_entity_id=None, conn=None):
+    """Insert the same notification for every user in user_ids in one statement.
 
-def create_notification(user_id, message, notification_type, related_entity_type=None, related_entity_id=None):
-    conn = get_db_connection()
+    Returns the new notification ids. When conn is given the rows join the
+    caller's transaction and committing is left to the caller.
+    """
+    user_ids = [int(user_id) for user_id in user_ids]
+    if not user_ids:
+        return []
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    cur = conn.cursor()
     try:
-        cur = conn.cursor()
         cur.execute("""
-            INSERT INTO notifications 
+            INSERT INTO notifications
             (user_id, message, notification_type, related_entity_type, related_entity_id)
-            VALUES (%s, %s, %s, %s, %s)
+            SELECT recipient, %s, %s, %s, %s
+            FROM unnest(%s::INTEGER[]) AS recipient
             RETURNING notification_id
-        """, (user_id, message, notification_type, related_entity_type, related_entity_id))
-        notification_id = cur.fetchone()[0]
-        conn.commit()
-        return notification_id
+        """, (message, notification_type, related_entity_type, related_entity_id, user_ids))
+        notification_ids = [row[0] for row in cur.fetchall()]
+        if own_conn:
+            conn.commit()
+        NOTIFICATION_FANOUT.observe(len(notification_ids), notification_type=notification_type)
+        return notification_ids
     except Exception as e:
-        conn.rollback()
+        if own_conn:
+            conn.rollback()
         raise e
     finally:
         cur.close()
-        conn.close()
+        if own_conn:
+            conn.close()
+
+def create_notification(user_id, message, notification_type, related_entity_type=None,
+                        related_entity_id=None, conn=None):
+    return create_notifications([user_id], message, notification_type,
+                                related_entity_type, related_entity_id, conn=conn)[0]
+
+def get_user_ids_by_role(role, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT user_id FROM users WHERE role = %s AND is_active = TRUE", (role,))
+        return [row[0] for row in cur.fetchall()]
+    finally:
+        cur.close()
+        if own_conn:
+            conn.close()
 
 def get_user_notifications(user_id, limit=5):
     conn = get_db_connection()
@@ -215,14 +998,41 @@ def get_user_notifications(user_id, limit=5):
         cur.close()
         conn.close()
 
+def get_notification_summary(user_id, limit=5):
+    """Unread count and the latest ``limit`` notifications, in one round trip.
+
+    Returns {'unread_count': int, 'notifications': [...]}, the notifications
+    shaped like get_user_notifications() rows.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute("""
+            SELECT c.unread_count, n.*
+            FROM (SELECT unread_notification_count(%(user_id)s) AS unread_count) c
+            LEFT JOIN LATERAL (
+                SELECT notification_id, message, is_read, created_at,
+                       related_entity_type, related_entity_id
+                FROM notifications
+                WHERE user_id = %(user_id)s
+                ORDER BY created_at DESC
+                LIMIT %(limit)s
+            ) n ON TRUE
+            ORDER BY n.created_at DESC
+        """, {'user_id': user_id, 'limit': limit})
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+    notifications = [{k: v for k, v in row.items() if k != 'unread_count'}
+                     for row in rows if row['notification_id'] is not None]
+    return {'unread_count': rows[0]['unread_count'], 'notifications': notifications}
+
 def get_unread_notification_count(user_id):
     conn = get_db_connection()
     try:
         cur = conn.cursor()
-        cur.execute("""
-            SELECT COUNT(*) FROM notifications
-            WHERE user_id = %s AND is_read = FALSE
-        """, (user_id,))
+        cur.execute("SELECT unread_notification_count(%s)", (user_id,))
         return cur.fetchone()[0]
     finally:
         cur.close()
@@ -246,4 +1056,24 @@ def mark_notification_as_read(notification_id, user_id):
         raise e
     finally:
         cur.close()
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+def mark_all_notifications_as_read(user_id):
+    """Mark every unread notification of a user as read; returns how many changed."""
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE notifications
+            SET is_read = TRUE
+            WHERE user_id = %s AND is_read = FALSE
+        """, (user_id,))
+        updated = cur.rowcount
+        conn.commit()
+        return updated
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        cur.close()
+        conn.close()
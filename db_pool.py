@@ -0,0 +1,259 @@
+import os
+import threading
+import time
+
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+
+class PoolExhausted(PoolError):
+    """Raised when no connection could be checked out before the timeout."""
+
+
+class PooledConnection:
+    """Proxy around a pooled connection; close() hands it back to the pool."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._checked_out_at = time.monotonic()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    @property
+    def raw(self):
+        return self._conn
+
+    @property
+    def closed(self):
+        return 1 if self._conn is None else self._conn.closed
+
+    @property
+    def held_for(self):
+        """Seconds since this connection was checked out of the pool."""
+        return time.monotonic() - self._checked_out_at
+
+    def cursor(self, *args, **kwargs):
+        instrumentation = self._pool.instrumentation
+        if instrumentation is not None:
+            kwargs['cursor_factory'] = instrumentation.cursor_factory(
+                kwargs.get('cursor_factory') or self._conn.cursor_factory)
+        return self._conn.cursor(*args, **kwargs)
+
+    def release(self, discard=False):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.putconn(conn, discard=discard, held_for=self.held_for)
+
+    def close(self):
+        self.release()
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of database connections.
+
+    ``connect`` is a zero-argument factory returning a DB-API connection
+    (``psycopg2.connect`` in production, a fake in benchmarks). Idle
+    connections older than ``max_idle`` seconds are closed down to
+    ``minconn``; connections that sat idle longer than ``health_check_after``
+    seconds are pinged before being handed out. With ``instrumentation`` (a
+    sql_instrumentation.SQLInstrumentation), cursors opened through
+    PooledConnection.cursor() are timed.
+
+    A pool inherited across fork() starts over in the child: connections
+    opened by the parent share their sockets with it, so the child never
+    uses them. It does not close them either, because closing would also
+    end the parent's session.
+    """
+
+    def __init__(self, connect, minconn=1, maxconn=10, timeout=5.0,
+                 max_idle=300.0, health_check_after=30.0, instrumentation=None):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError('Invalid pool bounds: minconn=%s maxconn=%s' % (minconn, maxconn))
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.health_check_after = health_check_after
+        self.instrumentation = instrumentation
+        self._idle = []  # (conn, released_at); most recently used last
+        self._checked_out = set()
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._pid = os.getpid()
+        self._inherited = []
+        self._stats = {
+            'connections_created': 0,
+            'connections_closed': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'hold_time_total': 0.0,
+            'exhausted': 0,
+            'health_check_failures': 0,
+            'reaped': 0,
+        }
+        for _ in range(minconn):
+            self._idle.append((self._new_connection(), time.monotonic()))
+
+    # -- internals ---------------------------------------------------------
+    def _check_fork(self):
+        if self._pid == os.getpid():
+            return
+        # Another thread may have held the lock at fork time; take a new one.
+        # The parent's connections are kept referenced so they are never
+        # garbage collected, which would close them.
+        self._cond = threading.Condition()
+        self._inherited.extend(conn for conn, _ in self._idle)
+        self._inherited.extend(self._checked_out)
+        self._idle = []
+        self._checked_out = set()
+        self._in_use = 0
+        self._pid = os.getpid()
+
+    def _new_connection(self):
+        conn = self._connect()
+        with self._cond:
+            self._stats['connections_created'] += 1
+        return conn
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self._stats['connections_closed'] += 1
+
+    def _reap_idle_locked(self, now):
+        # Oldest idle connections sit at the front of the list.
+        while (self._idle and len(self._idle) + self._in_use > self.minconn
+               and now - self._idle[0][1] > self.max_idle):
+            conn, _ = self._idle.pop(0)
+            self._close_quietly(conn)
+            self._stats['reaped'] += 1
+
+    def _is_healthy(self, conn, idle_for):
+        if conn.closed:
+            return False
+        if idle_for < self.health_check_after:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    # -- public API --------------------------------------------------------
+    def getconn(self):
+        """Check out a raw connection, waiting up to ``timeout`` seconds."""
+        self._check_fork()
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolError('Connection pool is closed')
+                now = time.monotonic()
+                self._reap_idle_locked(now)
+                while not self._idle and self._in_use + len(self._idle) >= self.maxconn:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._stats['exhausted'] += 1
+                        raise PoolExhausted(
+                            'No database connection available within %.1fs (max %d in use)'
+                            % (self.timeout, self.maxconn))
+                    if not waited:
+                        waited = True
+                        self._stats['waits'] += 1
+                    self._cond.wait(remaining)
+                    now = time.monotonic()
+                self._in_use += 1
+                if waited:
+                    wait_time = now - started
+                    self._stats['wait_time_total'] += wait_time
+                    self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait_time)
+                conn, released_at = self._idle.pop() if self._idle else (None, None)
+
+            if conn is None:
+                try:
+                    conn = self._new_connection()
+                except Exception:
+                    with self._cond:
+                        self._in_use -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(conn, now - released_at):
+                with self._cond:
+                    self._stats['health_check_failures'] += 1
+                    self._close_quietly(conn)
+                    self._in_use -= 1
+                    self._cond.notify()
+                continue
+
+            with self._cond:
+                self._stats['checkouts'] += 1
+                self._checked_out.add(conn)
+            return conn
+
+    def connection(self):
+        """Check out a connection wrapped so that close() returns it here."""
+        return PooledConnection(self, self.getconn())
+
+    def putconn(self, conn, discard=False, held_for=None):
+        """Return a connection, rolling back any transaction left open."""
+        self._check_fork()
+        if conn not in self._checked_out:
+            # Checked out in the parent before a fork (already in _inherited):
+            # not ours to reuse or close
+            return
+        if not discard and not conn.closed:
+            try:
+                status = conn.get_transaction_status()
+                if status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        with self._cond:
+            self._checked_out.discard(conn)
+            self._in_use -= 1
+            if held_for is not None:
+                self._stats['hold_time_total'] += held_for
+            if discard or conn.closed or self._closed:
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._reap_idle_locked(time.monotonic())
+            self._cond.notify()
+
+    def reap_idle(self):
+        with self._cond:
+            self._reap_idle_locked(time.monotonic())
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._close_quietly(conn)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot.update(
+                minconn=self.minconn,
+                maxconn=self.maxconn,
+                idle=len(self._idle),
+                in_use=self._in_use,
+                size=len(self._idle) + self._in_use,
+            )
+        return snapshot
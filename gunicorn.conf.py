@@ -0,0 +1,63 @@
+"""gunicorn settings for IMS: ``gunicorn -c gunicorn.conf.py wsgi:app``.
+
+Every setting can be overridden from the environment (see README,
+"Production serving"). Workers are gthread workers: each process runs
+IMS_THREADS request threads, and each open notification stream
+(/api/notifications/stream) holds one of them for as long as it stays open,
+up to IMS_SSE_MAX_STREAMS per worker. In production, route the streams to the
+gevent service in gunicorn.stream.conf.py instead.
+"""
+import glob
+import multiprocessing
+import os
+import sys
+
+bind = os.environ.get('IMS_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('IMS_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('IMS_THREADS', 8))
+# Import the app once in the master and fork it into the workers: faster
+# start-up and shared memory pages, but code changes need a full restart
+# rather than a HUP (see README).
+preload_app = os.environ.get('IMS_PRELOAD', '1') == '1'
+timeout = int(os.environ.get('IMS_WORKER_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('IMS_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('IMS_KEEPALIVE', 5))
+# Recycle workers after this many requests (0 = never), spread by the jitter
+max_requests = int(os.environ.get('IMS_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('IMS_MAX_REQUESTS_JITTER', 0))
+accesslog = os.environ.get('IMS_ACCESS_LOG') or None
+errorlog = '-'
+loglevel = os.environ.get('IMS_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    # The user and supplier caches tell the other workers about invalidations
+    # through generation files in IMS_CACHE_DIR; without it a demoted or
+    # deactivated user keeps their role in other workers until the TTL
+    # expires. The app reads it at import, which with preloading has already
+    # happened, so it must come from the environment.
+    if server.cfg.workers > 1 and not os.environ.get('IMS_CACHE_DIR'):
+        raise RuntimeError('IMS_CACHE_DIR is required with more than one worker: '
+                           'set it to a directory every worker can write to')
+    # Metric files of the previous run's workers would otherwise be summed in
+    metrics_dir = os.environ.get('IMS_METRICS_DIR')
+    if metrics_dir:
+        for path in glob.glob(os.path.join(metrics_dir, 'metrics-*.json')):
+            os.remove(path)
+
+
+def pre_fork(server, worker):
+    # Only relevant with preload_app: otherwise the master never imports wsgi
+    if 'wsgi' in sys.modules:
+        sys.modules['wsgi'].release_process_resources()
+
+
+def post_worker_init(worker):
+    # Runs after the worker has loaded the app, whether or not it was preloaded
+    sys.modules['wsgi'].init_worker()
+
+
+def worker_exit(server, worker):
+    if 'wsgi' in sys.modules:
+        sys.modules['wsgi'].shutdown_worker()
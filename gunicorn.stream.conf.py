@@ -0,0 +1,71 @@
+"""gunicorn settings for the IMS notification stream service.
+
+    gunicorn -c gunicorn.stream.conf.py wsgi:app
+
+Runs the same app on gevent workers, where an open notification stream
+(/api/notifications/stream) costs a greenlet rather than a request thread, so
+one process can hold thousands of them. Route that path, and the notification
+polling endpoints, to this service from the reverse proxy (see README,
+"Notification stream service"); everything else stays on gunicorn.conf.py's
+threaded workers. The service runs no background jobs.
+"""
+import os
+
+bind = os.environ.get('IMS_STREAM_BIND', '0.0.0.0:8001')
+workers = int(os.environ.get('IMS_STREAM_WORKERS', 1))
+worker_class = 'gevent'
+# Concurrent connections per worker: open streams plus in-flight polls
+worker_connections = int(os.environ.get('IMS_STREAM_CONNECTIONS', 1000))
+# gevent must patch the standard library before the app is imported, which
+# happens in each worker only without preloading
+preload_app = False
+timeout = int(os.environ.get('IMS_WORKER_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('IMS_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('IMS_KEEPALIVE', 5))
+accesslog = os.environ.get('IMS_ACCESS_LOG') or None
+errorlog = '-'
+loglevel = os.environ.get('IMS_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    # The stream workers serve alongside the web workers, so cache
+    # invalidations must reach them through the same IMS_CACHE_DIR
+    if not os.environ.get('IMS_CACHE_DIR'):
+        raise RuntimeError('IMS_CACHE_DIR is required: use the directory of the web service')
+    # Streams may use most of a worker's connections; the rest serve polls.
+    # IMS_SSE_MAX_STREAMS configures the threaded web workers, not this service.
+    max_streams = int(os.environ.get('IMS_STREAM_MAX_STREAMS',
+                                     worker_connections * 9 // 10))
+    os.environ['IMS_SSE_MAX_STREAMS'] = str(max_streams)
+    server.log.info('Notification streams per worker: %d', max_streams)
+
+
+def _gevent_wait_callback(conn, timeout=None):
+    # psycopg2 waits on the socket through gevent, so a query yields to the
+    # other greenlets instead of blocking the whole worker
+    from gevent.socket import wait_read, wait_write
+    from psycopg2 import OperationalError, extensions
+
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            return
+        if state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise OperationalError(f'Bad result from poll: {state!r}')
+
+
+def post_fork(server, worker):
+    from psycopg2 import extensions
+
+    extensions.set_wait_callback(_gevent_wait_callback)
+
+
+def worker_exit(server, worker):
+    import sys
+
+    if 'wsgi' in sys.modules:
+        sys.modules['wsgi'].shutdown_worker()
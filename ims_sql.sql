@@ -1,10 +1,12 @@
 -- Cleanup existing objects
-DROP TABLE IF EXISTS audit_log, transactions, orders, products, users, suppliers, notifications CASCADE;
+DROP TABLE IF EXISTS audit_log, transactions, orders, products, users, suppliers, notifications, notification_counters, notification_counter_deltas, sales_daily_rollup, audit_log_queue, audit_sync_tables, supplier_stats, supplier_stat_deltas, table_versions, table_changes CASCADE;
 DROP SEQUENCE IF EXISTS transactions_id_seq, orders_id_seq, audit_log_id_seq;
 DROP EXTENSION IF EXISTS pgcrypto CASCADE;
+DROP EXTENSION IF EXISTS pg_trgm CASCADE;
 
 -- Enable extensions
 CREATE EXTENSION IF NOT EXISTS pgcrypto;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- =============================================
 -- TABLES
@@ -35,13 +37,16 @@ CREATE TABLE products (
     category VARCHAR(50) NOT NULL,
     price DECIMAL(10,2) NOT NULL CHECK (price >= 0),
     quantity INTEGER NOT NULL CHECK (quantity >= 0),
+    -- Stock held by Pending orders; quantity - reserved_quantity is available to sell
+    reserved_quantity INTEGER NOT NULL DEFAULT 0,
     supplier_id INTEGER REFERENCES suppliers(supplier_id),
     min_stocks INTEGER CHECK (min_stocks >= 0) DEFAULT 5,
     added_by INTEGER REFERENCES users(user_id),
     is_deleted BOOLEAN DEFAULT FALSE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    CONSTRAINT unique_product_name UNIQUE (product_name)
+    CONSTRAINT unique_product_name UNIQUE (product_name),
+    CONSTRAINT reserved_within_stock CHECK (reserved_quantity >= 0 AND reserved_quantity <= quantity)
 );
 
 CREATE TABLE orders (
@@ -70,8 +75,10 @@ CREATE TABLE transactions (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Partitioned by month on created_at; see create_audit_log_partition() and
+-- purge_audit_log_partitions() for the partition lifecycle.
 CREATE TABLE audit_log (
-    log_id SERIAL PRIMARY KEY,
+    log_id SERIAL,
     table_name VARCHAR(50) NOT NULL,
     record_id INTEGER,
     action VARCHAR(10) NOT NULL CHECK (action IN ('INSERT', 'UPDATE', 'DELETE', 'ERROR', 'LOGIN', 'LOGOUT')),
@@ -81,8 +88,63 @@ CREATE TABLE audit_log (
     error_message TEXT,
     ip_address VARCHAR(45),
     user_agent TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (log_id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- Catches rows outside every monthly partition so inserts never fail
+CREATE TABLE audit_log_default PARTITION OF audit_log DEFAULT;
+
+-- Per-supplier figures for the supplier report. Product figures cover
+-- non-deleted products; units_sold and revenue are Sales net of Returns,
+-- credited to the product's supplier at the time. The triggers on products
+-- and transactions append changes to supplier_stat_deltas, and
+-- apply_supplier_stat_deltas() folds them in from a background thread, so
+-- stock updates and sales never wait on a supplier's row.
+-- database.get_supplier_stats() adds the pending deltas on top.
+CREATE TABLE supplier_stats (
+    supplier_id INTEGER PRIMARY KEY REFERENCES suppliers(supplier_id) ON DELETE CASCADE,
+    product_count INTEGER NOT NULL DEFAULT 0,
+    total_stock BIGINT NOT NULL DEFAULT 0,
+    price_sum DECIMAL(14,2) NOT NULL DEFAULT 0,
+    units_sold BIGINT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14,2) NOT NULL DEFAULT 0
+);
+
+-- Insert-only, like notification_counter_deltas
+CREATE TABLE supplier_stat_deltas (
+    delta_id BIGSERIAL PRIMARY KEY,
+    supplier_id INTEGER NOT NULL,
+    product_count INTEGER NOT NULL DEFAULT 0,
+    total_stock BIGINT NOT NULL DEFAULT 0,
+    price_sum DECIMAL(14,2) NOT NULL DEFAULT 0,
+    units_sold BIGINT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14,2) NOT NULL DEFAULT 0
+);
+
+-- Asynchronous audit mode (ims.audit_mode = 'async'): route_audit_event()
+-- parks audit rows here and flush_audit_queue() moves them into audit_log in
+-- batches. UNLOGGED means no WAL, but the table is emptied after a crash, so
+-- events not yet flushed at that point are lost.
+CREATE UNLOGGED TABLE audit_log_queue (
+    queue_id BIGSERIAL PRIMARY KEY,
+    table_name VARCHAR(50) NOT NULL,
+    record_id INTEGER,
+    action VARCHAR(10) NOT NULL,
+    changed_by INTEGER,
+    old_values JSONB,
+    new_values JSONB,
+    error_message TEXT,
+    ip_address VARCHAR(45),
+    user_agent TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Tables whose audit rows are always written synchronously, even in async mode
+CREATE TABLE audit_sync_tables (
+    table_name VARCHAR(50) PRIMARY KEY
 );
+INSERT INTO audit_sync_tables (table_name) VALUES ('users');
 
 CREATE TABLE notifications (
     notification_id SERIAL PRIMARY KEY,
@@ -96,6 +158,58 @@ CREATE TABLE notifications (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Unread notifications per user. maintain_notification_counters() appends
+-- changes to notification_counter_deltas, and apply_notification_counter_deltas()
+-- folds them in from a background thread, so notification writes never wait
+-- on a counter row lock. unread_notification_count() adds both up. No
+-- CHECK (unread_count >= 0): a negative delta goes through the INSERT side
+-- of the upsert, and concurrent folds may apply a "read" before its "insert".
+CREATE TABLE notification_counters (
+    user_id INTEGER PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+    unread_count INTEGER NOT NULL DEFAULT 0
+);
+
+-- Insert-only; no foreign key, so appending takes no lock on users
+CREATE TABLE notification_counter_deltas (
+    delta_id BIGSERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    delta INTEGER NOT NULL
+);
+
+-- Sale totals per product per day, kept in sync by maintain_sales_rollup().
+-- get_sales_report() reads this instead of scanning transactions.
+CREATE TABLE sales_daily_rollup (
+    sale_date DATE NOT NULL,
+    product_id INTEGER NOT NULL REFERENCES products(product_id),
+    total_quantity BIGINT NOT NULL DEFAULT 0,
+    total_sales DECIMAL(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (sale_date, product_id)
+);
+
+-- Change counters for the app's HTTP validators (ETag and Last-Modified, see
+-- conditional_get() in app.py). A table's version is the number of committed
+-- statements that changed it: its table_versions.version plus its rows in
+-- table_changes. Writers only append to table_changes from statement-level
+-- triggers (note_table_change(), note_table_update()), so they never wait on
+-- each other, and a change counts exactly when it becomes visible.
+-- compact_table_changes() folds the log into table_versions in the
+-- background. 'product_reservations' counts updates of reserved_quantity,
+-- which do not change the 'products' version.
+CREATE TABLE table_versions (
+    table_name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
+INSERT INTO table_versions (table_name)
+VALUES ('products'), ('product_reservations'), ('suppliers'), ('transactions'), ('users'),
+       ('sales_daily_rollup');
+
+CREATE TABLE table_changes (
+    change_id BIGSERIAL PRIMARY KEY,
+    table_name TEXT NOT NULL,
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
+
 -- =============================================
 -- FUNCTIONS
 -- =============================================
@@ -107,36 +221,474 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- Statement-level: applies all stock movements of a transactions INSERT with
+-- one UPDATE of products and audits them with one INSERT into audit_log.
+-- Each transaction still gets its own audit row; its before/after quantities
+-- are worked back from the product's final quantity and the movements that
+-- came after it in the same statement.
 CREATE OR REPLACE FUNCTION handle_transaction_stock_update()
 RETURNS TRIGGER AS $$
 BEGIN
-    IF NEW.transaction_type = 'Sale' THEN
-        UPDATE products 
-        SET quantity = quantity - NEW.quantity,
+    WITH movements AS (
+        SELECT transaction_id, product_id, performed_by,
+               CASE WHEN transaction_type = 'Sale' THEN -quantity ELSE quantity END AS delta
+        FROM new_rows
+        WHERE product_id IS NOT NULL
+        AND transaction_type IN ('Sale', 'Purchase', 'Return', 'Adjustment')
+    ),
+    updated AS (
+        UPDATE products p
+        SET quantity = p.quantity + d.delta,
             updated_at = CURRENT_TIMESTAMP
-        WHERE product_id = NEW.product_id;
-    ELSIF NEW.transaction_type IN ('Purchase', 'Return', 'Adjustment') THEN
-        UPDATE products 
-        SET quantity = quantity + NEW.quantity,
-            updated_at = CURRENT_TIMESTAMP
-        WHERE product_id = NEW.product_id;
+        FROM (
+            SELECT product_id, SUM(delta) AS delta
+            FROM movements
+            GROUP BY product_id
+        ) d
+        WHERE p.product_id = d.product_id
+        RETURNING p.product_id, p.quantity
+    ),
+    steps AS (
+        SELECT m.transaction_id, m.product_id, m.performed_by, m.delta,
+               u.quantity - SUM(m.delta) OVER (
+                   PARTITION BY m.product_id ORDER BY m.transaction_id DESC
+               ) AS quantity_before
+        FROM movements m
+        JOIN updated u ON u.product_id = m.product_id
+    )
+    INSERT INTO audit_log (table_name, record_id, action, changed_by, old_values, new_values)
+    SELECT 'products', product_id, 'UPDATE', performed_by,
+           jsonb_build_object('quantity', quantity_before),
+           jsonb_build_object('quantity', quantity_before + delta)
+    FROM steps
+    ORDER BY transaction_id;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Pushes notification changes to the app's LISTEN connection, which relays
+-- them to browsers over Server-Sent Events. The payload stays well under
+-- pg_notify's 8000 byte limit.
+CREATE OR REPLACE FUNCTION notify_notification_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM pg_notify('ims_notifications', json_build_object(
+            'event', 'created',
+            'user_id', NEW.user_id,
+            'notification_id', NEW.notification_id,
+            'notification_type', NEW.notification_type,
+            'message', left(NEW.message, 500),
+            'related_entity_type', NEW.related_entity_type,
+            'related_entity_id', NEW.related_entity_id,
+            'created_at', NEW.created_at
+        )::TEXT);
+    ELSIF NEW.is_read IS DISTINCT FROM OLD.is_read THEN
+        -- Identical payloads are folded into one per transaction
+        PERFORM pg_notify('ims_notifications', json_build_object(
+            'event', 'read',
+            'user_id', NEW.user_id
+        )::TEXT);
     END IF;
-    
-    PERFORM log_audit_event(
-        'products', 
-        'UPDATE', 
-        NEW.product_id, 
-        NEW.performed_by,
-        jsonb_build_object('quantity', 
-            CASE WHEN NEW.transaction_type = 'Sale' 
-                 THEN (SELECT quantity FROM products WHERE product_id = NEW.product_id) + NEW.quantity
-                 ELSE (SELECT quantity FROM products WHERE product_id = NEW.product_id) - NEW.quantity
-            END),
-        jsonb_build_object('quantity', (SELECT quantity FROM products WHERE product_id = NEW.product_id)),
-        NULL, NULL, NULL
-    );
-    
-    RETURN NEW;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement-level: appends one delta per affected user however many rows the
+-- statement touched (e.g. a fan-out insert or "mark all as read"). Plain
+-- inserts, so concurrent orders notifying the same managers do not contend.
+CREATE OR REPLACE FUNCTION maintain_notification_counters()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO notification_counter_deltas (user_id, delta)
+        SELECT user_id, COUNT(*) FROM new_rows
+        WHERE is_read IS NOT TRUE
+        GROUP BY user_id;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO notification_counter_deltas (user_id, delta)
+        SELECT user_id, SUM(delta) FROM (
+            SELECT user_id, 1 AS delta FROM new_rows WHERE is_read IS NOT TRUE
+            UNION ALL
+            SELECT user_id, -1 FROM old_rows WHERE is_read IS NOT TRUE
+        ) d
+        GROUP BY user_id
+        HAVING SUM(delta) <> 0;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO notification_counter_deltas (user_id, delta)
+        SELECT user_id, -COUNT(*) FROM old_rows
+        WHERE is_read IS NOT TRUE
+        GROUP BY user_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Folds up to p_batch deltas into notification_counters; returns how many it
+-- consumed. Upserts go in user_id order so concurrent runs cannot deadlock.
+-- Deltas of users deleted meanwhile are dropped.
+CREATE OR REPLACE FUNCTION apply_notification_counter_deltas(p_batch INTEGER DEFAULT 5000)
+RETURNS INTEGER AS $$
+DECLARE
+    v_rows INTEGER;
+BEGIN
+    WITH batch AS (
+        DELETE FROM notification_counter_deltas
+        WHERE delta_id IN (
+            SELECT delta_id FROM notification_counter_deltas
+            ORDER BY delta_id
+            LIMIT p_batch
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING user_id, delta
+    ), per_user AS (
+        SELECT user_id, SUM(delta) AS delta, COUNT(*) AS consumed
+        FROM batch
+        GROUP BY user_id
+    ), applied AS (
+        INSERT INTO notification_counters AS c (user_id, unread_count)
+        SELECT p.user_id, p.delta
+        FROM per_user p
+        JOIN users u ON u.user_id = p.user_id
+        WHERE p.delta <> 0
+        ORDER BY p.user_id
+        ON CONFLICT (user_id) DO UPDATE SET unread_count = c.unread_count + EXCLUDED.unread_count
+    )
+    SELECT COALESCE(SUM(consumed), 0) INTO v_rows FROM per_user;
+    RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION unread_notification_count(p_user_id INTEGER)
+RETURNS INTEGER AS $$
+    SELECT (COALESCE((SELECT unread_count FROM notification_counters WHERE user_id = p_user_id), 0)
+          + COALESCE((SELECT SUM(delta) FROM notification_counter_deltas WHERE user_id = p_user_id), 0))::INTEGER;
+$$ LANGUAGE sql STABLE;
+
+-- Statement-level on INSERT, DELETE and TRUNCATE of a versioned table
+CREATE OR REPLACE FUNCTION note_table_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO table_changes (table_name) VALUES (TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement-level on UPDATE of a versioned table; statements that matched no
+-- rows are not counted. On products, a statement that only moved
+-- reserved_quantity (an order reserving or releasing stock) counts as
+-- 'product_reservations' instead of 'products'.
+CREATE OR REPLACE FUNCTION note_table_update()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'products' THEN
+        INSERT INTO table_changes (table_name)
+        SELECT 'products'
+        WHERE EXISTS (
+            SELECT 1 FROM new_rows n JOIN old_rows o USING (product_id)
+            WHERE to_jsonb(n) - 'reserved_quantity' - 'updated_at'
+                  IS DISTINCT FROM to_jsonb(o) - 'reserved_quantity' - 'updated_at'
+        )
+        UNION ALL
+        SELECT 'product_reservations'
+        WHERE EXISTS (
+            SELECT 1 FROM new_rows n JOIN old_rows o USING (product_id)
+            WHERE n.reserved_quantity IS DISTINCT FROM o.reserved_quantity
+        );
+    ELSIF EXISTS (SELECT 1 FROM new_rows) THEN
+        INSERT INTO table_changes (table_name) VALUES (TG_TABLE_NAME);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Folds up to p_batch logged changes into table_versions; returns how many it
+-- consumed. Deleting the log rows and adding them to the version happen in
+-- one transaction, so readers never see a version go backwards. Upserts go in
+-- table_name order so concurrent runs cannot deadlock.
+CREATE OR REPLACE FUNCTION compact_table_changes(p_batch INTEGER DEFAULT 5000)
+RETURNS INTEGER AS $$
+DECLARE
+    v_rows INTEGER;
+BEGIN
+    WITH batch AS (
+        DELETE FROM table_changes
+        WHERE change_id IN (
+            SELECT change_id FROM table_changes
+            ORDER BY change_id
+            LIMIT p_batch
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING table_name, changed_at
+    ), per_table AS (
+        SELECT table_name, COUNT(*) AS changes, MAX(changed_at) AS changed_at
+        FROM batch
+        GROUP BY table_name
+    ), applied AS (
+        INSERT INTO table_versions AS v (table_name, version, changed_at)
+        SELECT table_name, changes, changed_at
+        FROM per_table
+        ORDER BY table_name
+        ON CONFLICT (table_name) DO UPDATE
+        SET version = v.version + EXCLUDED.version,
+            changed_at = GREATEST(v.changed_at, EXCLUDED.changed_at)
+    )
+    SELECT COALESCE(SUM(changes), 0) INTO v_rows FROM per_table;
+    RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Recomputes every counter from notifications (backfill / repair). Blocks
+-- notification writes until it commits.
+CREATE OR REPLACE FUNCTION rebuild_notification_counters()
+RETURNS VOID AS $$
+BEGIN
+    LOCK TABLE notifications IN SHARE MODE;
+    DELETE FROM notification_counter_deltas;
+    DELETE FROM notification_counters;
+    INSERT INTO notification_counters (user_id, unread_count)
+    SELECT user_id, COUNT(*) FILTER (WHERE is_read IS NOT TRUE)
+    FROM notifications
+    GROUP BY user_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement-level: folds the Sale rows of each transactions statement into
+-- one upsert per (day, product).
+CREATE OR REPLACE FUNCTION maintain_sales_rollup()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO sales_daily_rollup AS r (sale_date, product_id, total_quantity, total_sales)
+        SELECT transaction_date, product_id, SUM(quantity), SUM(COALESCE(total_amount, 0))
+        FROM new_rows
+        WHERE transaction_type = 'Sale' AND transaction_date IS NOT NULL AND product_id IS NOT NULL
+        GROUP BY transaction_date, product_id
+        ORDER BY transaction_date, product_id
+        ON CONFLICT (sale_date, product_id) DO UPDATE
+        SET total_quantity = r.total_quantity + EXCLUDED.total_quantity,
+            total_sales = r.total_sales + EXCLUDED.total_sales;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO sales_daily_rollup AS r (sale_date, product_id, total_quantity, total_sales)
+        SELECT transaction_date, product_id, SUM(quantity), SUM(amount)
+        FROM (
+            SELECT transaction_date, product_id, quantity, COALESCE(total_amount, 0) AS amount
+            FROM new_rows WHERE transaction_type = 'Sale'
+            UNION ALL
+            SELECT transaction_date, product_id, -quantity, -COALESCE(total_amount, 0)
+            FROM old_rows WHERE transaction_type = 'Sale'
+        ) d
+        WHERE transaction_date IS NOT NULL AND product_id IS NOT NULL
+        GROUP BY transaction_date, product_id
+        HAVING SUM(quantity) <> 0 OR SUM(amount) <> 0
+        ORDER BY transaction_date, product_id
+        ON CONFLICT (sale_date, product_id) DO UPDATE
+        SET total_quantity = r.total_quantity + EXCLUDED.total_quantity,
+            total_sales = r.total_sales + EXCLUDED.total_sales;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE sales_daily_rollup r
+        SET total_quantity = r.total_quantity - d.quantity,
+            total_sales = r.total_sales - d.amount
+        FROM (
+            SELECT transaction_date, product_id, SUM(quantity) AS quantity,
+                   SUM(COALESCE(total_amount, 0)) AS amount
+            FROM old_rows
+            WHERE transaction_type = 'Sale'
+            GROUP BY transaction_date, product_id
+        ) d
+        WHERE r.sale_date = d.transaction_date AND r.product_id = d.product_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement-level on products UPDATE: alerts InventoryManagers about the
+-- products whose stock has just dropped below min_stocks. Only rows that
+-- crossed the line in this statement are considered, and the partial unique
+-- index idx_notifications_lowstock_unread keeps at most one unread LowStock
+-- notification per product and user, so a product hovering around its
+-- minimum does not flood anyone.
+CREATE OR REPLACE FUNCTION detect_low_stock()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO notifications (user_id, message, notification_type,
+                               related_entity_type, related_entity_id)
+    SELECT u.user_id,
+           format('Low stock: %s has %s left (minimum %s)', n.product_name, n.quantity, n.min_stocks),
+           'LowStock', 'product', n.product_id
+    FROM new_rows n
+    JOIN old_rows o ON o.product_id = n.product_id
+    CROSS JOIN users u
+    WHERE n.quantity < n.min_stocks AND n.is_deleted = FALSE
+    AND NOT (o.quantity < o.min_stocks AND o.is_deleted = FALSE)
+    AND u.role = 'InventoryManager' AND u.is_active = TRUE
+    ORDER BY n.product_id, u.user_id
+    ON CONFLICT (user_id, related_entity_id)
+        WHERE notification_type = 'LowStock' AND is_read = FALSE
+        DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement-level on products: appends one delta per supplier with the
+-- change in its product count, stock and price total. A soft delete
+-- (is_deleted = TRUE) removes the product's contribution like a DELETE.
+-- Updates that leave all three unchanged, e.g. stock reservations, append
+-- nothing.
+CREATE OR REPLACE FUNCTION maintain_supplier_product_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO supplier_stat_deltas (supplier_id, product_count, total_stock, price_sum)
+        SELECT supplier_id, COUNT(*), SUM(quantity), SUM(price)
+        FROM new_rows
+        WHERE supplier_id IS NOT NULL AND is_deleted IS NOT TRUE
+        GROUP BY supplier_id;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO supplier_stat_deltas (supplier_id, product_count, total_stock, price_sum)
+        SELECT supplier_id, SUM(products), SUM(quantity), SUM(price)
+        FROM (
+            SELECT supplier_id, 1 AS products, quantity, price
+            FROM new_rows WHERE is_deleted IS NOT TRUE
+            UNION ALL
+            SELECT supplier_id, -1, -quantity, -price
+            FROM old_rows WHERE is_deleted IS NOT TRUE
+        ) d
+        WHERE supplier_id IS NOT NULL
+        GROUP BY supplier_id
+        HAVING SUM(products) <> 0 OR SUM(quantity) <> 0 OR SUM(price) <> 0;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO supplier_stat_deltas (supplier_id, product_count, total_stock, price_sum)
+        SELECT supplier_id, -COUNT(*), -SUM(quantity), -SUM(price)
+        FROM old_rows
+        WHERE supplier_id IS NOT NULL AND is_deleted IS NOT TRUE
+        GROUP BY supplier_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement-level on transactions INSERT: appends the statement's Sales
+-- (less Returns) per supplier as units_sold and revenue deltas.
+CREATE OR REPLACE FUNCTION maintain_supplier_sales_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO supplier_stat_deltas (supplier_id, units_sold, revenue)
+    SELECT p.supplier_id,
+           SUM(CASE WHEN t.transaction_type = 'Sale' THEN t.quantity ELSE -t.quantity END),
+           SUM(CASE WHEN t.transaction_type = 'Sale' THEN 1 ELSE -1 END * COALESCE(t.total_amount, 0))
+    FROM new_rows t
+    JOIN products p ON p.product_id = t.product_id
+    WHERE t.transaction_type IN ('Sale', 'Return') AND p.supplier_id IS NOT NULL
+    GROUP BY p.supplier_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Folds up to p_batch deltas into supplier_stats; returns how many it
+-- consumed. Same scheme as apply_notification_counter_deltas(): upserts in
+-- supplier_id order, deltas of suppliers deleted meanwhile are dropped.
+CREATE OR REPLACE FUNCTION apply_supplier_stat_deltas(p_batch INTEGER DEFAULT 5000)
+RETURNS INTEGER AS $$
+DECLARE
+    v_rows INTEGER;
+BEGIN
+    WITH batch AS (
+        DELETE FROM supplier_stat_deltas
+        WHERE delta_id IN (
+            SELECT delta_id FROM supplier_stat_deltas
+            ORDER BY delta_id
+            LIMIT p_batch
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING supplier_id, product_count, total_stock, price_sum, units_sold, revenue
+    ), per_supplier AS (
+        SELECT supplier_id, SUM(product_count) AS product_count, SUM(total_stock) AS total_stock,
+               SUM(price_sum) AS price_sum, SUM(units_sold) AS units_sold,
+               SUM(revenue) AS revenue, COUNT(*) AS consumed
+        FROM batch
+        GROUP BY supplier_id
+    ), applied AS (
+        INSERT INTO supplier_stats AS st (supplier_id, product_count, total_stock, price_sum,
+                                          units_sold, revenue)
+        SELECT p.supplier_id, p.product_count, p.total_stock, p.price_sum, p.units_sold, p.revenue
+        FROM per_supplier p
+        JOIN suppliers s ON s.supplier_id = p.supplier_id
+        ORDER BY p.supplier_id
+        ON CONFLICT (supplier_id) DO UPDATE
+        SET product_count = st.product_count + EXCLUDED.product_count,
+            total_stock = st.total_stock + EXCLUDED.total_stock,
+            price_sum = st.price_sum + EXCLUDED.price_sum,
+            units_sold = st.units_sold + EXCLUDED.units_sold,
+            revenue = st.revenue + EXCLUDED.revenue
+    )
+    SELECT COALESCE(SUM(consumed), 0) INTO v_rows FROM per_supplier;
+    RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Recomputes supplier_stats from products and transactions (backfill /
+-- repair). Blocks product and transaction writes until it commits, and
+-- locks the delta table before supplier_stats, in the order
+-- apply_supplier_stat_deltas() uses them.
+CREATE OR REPLACE FUNCTION rebuild_supplier_stats()
+RETURNS VOID AS $$
+BEGIN
+    LOCK TABLE products, transactions IN SHARE MODE;
+    LOCK TABLE supplier_stat_deltas, supplier_stats IN EXCLUSIVE MODE;
+    DELETE FROM supplier_stat_deltas;
+    DELETE FROM supplier_stats;
+    INSERT INTO supplier_stats (supplier_id, product_count, total_stock, price_sum, units_sold, revenue)
+    SELECT s.supplier_id,
+           COALESCE(p.product_count, 0), COALESCE(p.total_stock, 0), COALESCE(p.price_sum, 0),
+           COALESCE(t.units_sold, 0), COALESCE(t.revenue, 0)
+    FROM suppliers s
+    LEFT JOIN (
+        SELECT supplier_id, COUNT(*) AS product_count, SUM(quantity) AS total_stock,
+               SUM(price) AS price_sum
+        FROM products
+        WHERE is_deleted = FALSE
+        GROUP BY supplier_id
+    ) p ON p.supplier_id = s.supplier_id
+    LEFT JOIN (
+        SELECT pr.supplier_id,
+               SUM(CASE WHEN tr.transaction_type = 'Sale' THEN tr.quantity ELSE -tr.quantity END) AS units_sold,
+               SUM(CASE WHEN tr.transaction_type = 'Sale' THEN 1 ELSE -1 END
+                   * COALESCE(tr.total_amount, 0)) AS revenue
+        FROM transactions tr
+        JOIN products pr ON pr.product_id = tr.product_id
+        WHERE tr.transaction_type IN ('Sale', 'Return')
+        GROUP BY pr.supplier_id
+    ) t ON t.supplier_id = s.supplier_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Recomputes the rollup from transactions for [p_start_date, p_end_date]
+-- (everything when both are NULL). Used for backfill and repair; blocks
+-- concurrent sales for the duration so no insert is counted twice.
+CREATE OR REPLACE FUNCTION refresh_sales_rollup(
+    p_start_date DATE DEFAULT NULL,
+    p_end_date DATE DEFAULT NULL
+)
+RETURNS INTEGER AS $$
+DECLARE
+    v_rows INTEGER;
+BEGIN
+    LOCK TABLE sales_daily_rollup IN EXCLUSIVE MODE;
+    DELETE FROM sales_daily_rollup
+    WHERE (p_start_date IS NULL OR sale_date >= p_start_date)
+    AND (p_end_date IS NULL OR sale_date <= p_end_date);
+    INSERT INTO sales_daily_rollup (sale_date, product_id, total_quantity, total_sales)
+    SELECT transaction_date, product_id, SUM(quantity), SUM(COALESCE(total_amount, 0))
+    FROM transactions
+    WHERE transaction_type = 'Sale'
+    AND transaction_date IS NOT NULL AND product_id IS NOT NULL
+    AND (p_start_date IS NULL OR transaction_date >= p_start_date)
+    AND (p_end_date IS NULL OR transaction_date <= p_end_date)
+    GROUP BY transaction_date, product_id;
+    GET DIAGNOSTICS v_rows = ROW_COUNT;
+    RETURN v_rows;
 END;
 $$ LANGUAGE plpgsql;
 
@@ -152,7 +704,6 @@ CREATE OR REPLACE FUNCTION log_audit_event(
     p_user_agent TEXT DEFAULT NULL
 ) RETURNS VOID AS $$
 BEGIN
-    RAISE NOTICE 'Attempting to log: table=%, action=%, record_id=%, changed_by=%', p_table_name, p_action, p_record_id, p_changed_by;
     INSERT INTO audit_log (
         table_name, record_id, action, changed_by,
         old_values, new_values, error_message,
@@ -168,6 +719,98 @@ EXCEPTION WHEN OTHERS THEN
 END;
 $$ LANGUAGE plpgsql;
 
+-- BEFORE INSERT on audit_log: in async mode, queue the row instead of
+-- writing it, unless its table is listed in audit_sync_tables.
+CREATE OR REPLACE FUNCTION route_audit_event()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF current_setting('ims.audit_mode', true) = 'async'
+       AND NOT EXISTS (SELECT 1 FROM audit_sync_tables WHERE table_name = NEW.table_name) THEN
+        INSERT INTO audit_log_queue (
+            table_name, record_id, action, changed_by,
+            old_values, new_values, error_message,
+            ip_address, user_agent, created_at
+        ) VALUES (
+            NEW.table_name, NEW.record_id, NEW.action, NEW.changed_by,
+            NEW.old_values, NEW.new_values, NEW.error_message,
+            NEW.ip_address, NEW.user_agent, NEW.created_at
+        );
+        RETURN NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Moves up to p_batch queued audit rows into audit_log with one INSERT,
+-- oldest first, keeping their original created_at. SKIP LOCKED lets several
+-- flushers (one per app process) run at once without waiting on each other.
+CREATE OR REPLACE FUNCTION flush_audit_queue(p_batch INTEGER DEFAULT 5000)
+RETURNS INTEGER AS $$
+DECLARE
+    v_rows INTEGER;
+BEGIN
+    PERFORM set_config('ims.audit_mode', 'sync', true);
+    WITH batch AS (
+        DELETE FROM audit_log_queue
+        WHERE queue_id IN (
+            SELECT queue_id FROM audit_log_queue
+            ORDER BY queue_id
+            LIMIT p_batch
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING *
+    )
+    INSERT INTO audit_log (
+        table_name, record_id, action, changed_by,
+        old_values, new_values, error_message,
+        ip_address, user_agent, created_at
+    )
+    -- A user deleted since the event was queued is recorded as NULL, as
+    -- ON DELETE SET NULL would have done
+    SELECT b.table_name, b.record_id, b.action, u.user_id,
+           b.old_values, b.new_values, b.error_message,
+           b.ip_address, b.user_agent, b.created_at
+    FROM batch b
+    LEFT JOIN users u ON u.user_id = b.changed_by
+    ORDER BY b.queue_id;
+    GET DIAGNOSTICS v_rows = ROW_COUNT;
+    RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION create_audit_log_partition(p_month DATE)
+RETURNS TEXT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_start DATE := date_trunc('month', p_month)::DATE;
+    v_end DATE := (date_trunc('month', p_month) + INTERVAL '1 month')::DATE;
+    v_name TEXT := 'audit_log_' || to_char(p_month, 'YYYY_MM');
+BEGIN
+    IF to_regclass(v_name) IS NULL THEN
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF audit_log FOR VALUES FROM (%L) TO (%L)',
+            v_name, v_start, v_end
+        );
+    END IF;
+    RETURN v_name;
+END;
+$$;
+
+-- Creates the current month's partition and p_months_ahead future ones.
+-- Run ahead of time: a month whose rows already landed in audit_log_default
+-- cannot be given its own partition afterwards.
+CREATE OR REPLACE FUNCTION ensure_audit_log_partitions(p_months_ahead INTEGER DEFAULT 3)
+RETURNS SETOF TEXT
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    FOR i IN 0..p_months_ahead LOOP
+        RETURN NEXT create_audit_log_partition((CURRENT_DATE + make_interval(months => i))::DATE);
+    END LOOP;
+END;
+$$;
+
 CREATE OR REPLACE FUNCTION get_sales_report(
     p_start_date DATE DEFAULT CURRENT_DATE - INTERVAL '30 days',
     p_end_date DATE DEFAULT CURRENT_DATE
@@ -183,19 +826,24 @@ LANGUAGE plpgsql
 AS $$
 BEGIN
     RETURN QUERY
+    WITH sales AS (
+        SELECT r.product_id,
+               SUM(r.total_sales) AS total_sales,
+               SUM(r.total_quantity) AS total_quantity
+        FROM sales_daily_rollup r
+        WHERE r.sale_date BETWEEN p_start_date AND p_end_date
+        GROUP BY r.product_id
+    )
     SELECT 
         p.product_id,
         p.product_name,
         p.category,
-        COALESCE(SUM(t.total_amount), 0) AS total_sales,
-        COALESCE(SUM(t.quantity), 0) AS total_quantity
+        COALESCE(s.total_sales, 0)::DECIMAL(10,2) AS total_sales,
+        COALESCE(s.total_quantity, 0)::BIGINT AS total_quantity
     FROM products p
-    LEFT JOIN transactions t ON p.product_id = t.product_id
-        AND t.transaction_type = 'Sale'
-        AND t.transaction_date BETWEEN p_start_date AND p_end_date
+    LEFT JOIN sales s ON s.product_id = p.product_id
     WHERE p.is_deleted = FALSE
-    GROUP BY p.product_id, p.product_name, p.category
-    ORDER BY total_sales DESC;
+    ORDER BY 4 DESC;
 END;
 $$;
 
@@ -257,7 +905,10 @@ BEGIN
     END IF;
     
     IF p_transaction_type = 'Sale' THEN
-        SELECT quantity INTO v_current_stock FROM products WHERE product_id = p_product_id;
+        -- Stock reserved by Pending orders cannot be sold directly
+        SELECT quantity - reserved_quantity INTO v_current_stock
+        FROM products WHERE product_id = p_product_id
+        FOR UPDATE;
         IF v_current_stock < p_quantity_change THEN
             RAISE EXCEPTION 'Insufficient stock. Available: %, Requested: %', v_current_stock, p_quantity_change;
         END IF;
@@ -458,15 +1109,27 @@ BEGIN
     IF p_status IS NULL THEN
         p_status := 'Pending';
     END IF;
-    SELECT quantity, price INTO v_current_stock, v_price
-    FROM products 
-    WHERE product_id = p_product_id AND is_deleted = FALSE;
-    
-    IF v_price IS NULL THEN
-        RAISE EXCEPTION 'Product not found';
+    IF p_quantity IS NULL OR p_quantity <= 0 THEN
+        RAISE EXCEPTION 'Quantity must be positive';
     END IF;
-    
-    IF v_current_stock < p_quantity THEN
+
+    -- Check and reserve in one statement: the row lock taken by the UPDATE
+    -- serialises concurrent orders for the same product, and each one sees
+    -- the reservations committed before it.
+    UPDATE products
+    SET reserved_quantity = reserved_quantity + p_quantity
+    WHERE product_id = p_product_id
+    AND is_deleted = FALSE
+    AND quantity - reserved_quantity >= p_quantity
+    RETURNING price INTO v_price;
+
+    IF v_price IS NULL THEN
+        SELECT quantity - reserved_quantity INTO v_current_stock
+        FROM products
+        WHERE product_id = p_product_id AND is_deleted = FALSE;
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'Product not found';
+        END IF;
         RAISE EXCEPTION 'Insufficient stock (Available: %)', v_current_stock;
     END IF;
     
@@ -502,6 +1165,9 @@ EXCEPTION
 END;
 $$;
 
+-- A Pending order holds a reservation for its quantity until it is sold
+-- (Approved/Fulfilled) or Cancelled. An order moved back to Pending without
+-- having been sold takes its reservation again.
 CREATE OR REPLACE PROCEDURE process_order(
     p_order_id INTEGER,
     p_status VARCHAR(20),
@@ -515,12 +1181,16 @@ DECLARE
     v_quantity INTEGER;
     v_price DECIMAL(10,2);
     v_current_status VARCHAR(20);
+    v_sold_quantity INTEGER;
     v_has_sale_transaction BOOLEAN;
+    v_holds_reservation BOOLEAN;
+    v_available INTEGER;
 BEGIN
     SELECT product_id, quantity_ordered, total_amount/quantity_ordered, status
     INTO v_product_id, v_quantity, v_price, v_current_status
     FROM orders 
-    WHERE order_id = p_order_id;
+    WHERE order_id = p_order_id
+    FOR UPDATE;
     
     IF v_product_id IS NULL THEN
         RAISE EXCEPTION 'Order not found';
@@ -530,11 +1200,28 @@ BEGIN
         RAISE EXCEPTION 'Invalid status: %', p_status;
     END IF;
     
-    SELECT EXISTS (
-        SELECT 1 FROM transactions 
-        WHERE reference_id = p_order_id 
-        AND transaction_type = 'Sale'
-    ) INTO v_has_sale_transaction;
+    -- Sold and not yet returned
+    SELECT COALESCE(SUM(CASE WHEN transaction_type = 'Sale' THEN quantity ELSE -quantity END), 0)
+    INTO v_sold_quantity
+    FROM transactions 
+    WHERE reference_id = p_order_id 
+    AND transaction_type IN ('Sale', 'Return');
+    v_has_sale_transaction := v_sold_quantity > 0;
+    v_holds_reservation := v_current_status = 'Pending' AND NOT v_has_sale_transaction;
+
+    SELECT quantity - reserved_quantity INTO v_available
+    FROM products
+    WHERE product_id = v_product_id
+    FOR UPDATE;
+
+    IF p_status IN ('Approved', 'Fulfilled') AND NOT v_has_sale_transaction
+       AND NOT v_holds_reservation AND v_available < v_quantity THEN
+        RAISE EXCEPTION 'Insufficient stock (Available: %)', v_available;
+    END IF;
+    IF p_status = 'Pending' AND NOT v_has_sale_transaction
+       AND NOT v_holds_reservation AND v_available < v_quantity THEN
+        RAISE EXCEPTION 'Insufficient stock to reserve (Available: %)', v_available;
+    END IF;
     
     PERFORM log_audit_event(
         'orders', 'UPDATE', p_order_id, p_processed_by,
@@ -546,6 +1233,18 @@ BEGIN
     SET status = p_status,
         updated_at = CURRENT_TIMESTAMP
     WHERE order_id = p_order_id;
+
+    -- Leaving Pending releases the reservation (before the Sale below takes
+    -- the stock); returning to Pending reserves it again.
+    IF v_holds_reservation AND p_status <> 'Pending' THEN
+        UPDATE products
+        SET reserved_quantity = reserved_quantity - v_quantity
+        WHERE product_id = v_product_id;
+    ELSIF p_status = 'Pending' AND NOT v_has_sale_transaction AND NOT v_holds_reservation THEN
+        UPDATE products
+        SET reserved_quantity = reserved_quantity + v_quantity
+        WHERE product_id = v_product_id;
+    END IF;
     
     IF p_status IN ('Approved', 'Fulfilled') AND NOT v_has_sale_transaction THEN
         INSERT INTO transactions(
@@ -599,13 +1298,365 @@ EXCEPTION
 END;
 $$;
 
+-- Creates many orders in one call. p_items is a JSON array of
+-- {"product_id", "quantity", "notes"} objects. Every referenced product row is
+-- locked once, in product_id order, so concurrent batches cannot deadlock.
+-- Items are validated in array order against the available (unreserved)
+-- stock left by earlier items of the same batch. Valid ones are written with
+-- one INSERT into orders, one reservation UPDATE of products and one INSERT
+-- into audit_log. Returns one row per item: the new order_id, or an error.
+CREATE OR REPLACE FUNCTION create_orders_batch(
+    p_added_by INTEGER,
+    p_items JSONB
+)
+RETURNS TABLE (
+    item_index INTEGER,
+    order_id INTEGER,
+    status VARCHAR,
+    error TEXT
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_item RECORD;
+    v_remaining JSONB := '{}';
+    v_available INTEGER;
+    v_idx INTEGER[] := '{}';
+    v_product_ids INTEGER[] := '{}';
+    v_quantities INTEGER[] := '{}';
+    v_totals DECIMAL(10,2)[] := '{}';
+    v_notes TEXT[] := '{}';
+BEGIN
+    PERFORM 1 FROM products
+    WHERE product_id IN (
+        SELECT (e->>'product_id')::INTEGER FROM jsonb_array_elements(p_items) e
+    )
+    ORDER BY product_id
+    FOR UPDATE;
+
+    FOR v_item IN
+        SELECT (t.ord - 1)::INTEGER AS idx,
+               (t.elem->>'product_id')::INTEGER AS product_id,
+               (t.elem->>'quantity')::INTEGER AS quantity,
+               t.elem->>'notes' AS notes,
+               p.price,
+               p.quantity - p.reserved_quantity AS stock
+        FROM jsonb_array_elements(p_items) WITH ORDINALITY AS t(elem, ord)
+        LEFT JOIN products p ON p.product_id = (t.elem->>'product_id')::INTEGER
+            AND p.is_deleted = FALSE
+        ORDER BY t.ord
+    LOOP
+        item_index := v_item.idx;
+        order_id := NULL;
+        status := NULL;
+        IF v_item.quantity IS NULL OR v_item.quantity <= 0 THEN
+            error := 'Quantity must be positive';
+            RETURN NEXT;
+            CONTINUE;
+        END IF;
+        IF v_item.price IS NULL THEN
+            error := 'Product not found';
+            RETURN NEXT;
+            CONTINUE;
+        END IF;
+        v_available := COALESCE((v_remaining->>v_item.product_id::TEXT)::INTEGER, v_item.stock);
+        IF v_available < v_item.quantity THEN
+            error := format('Insufficient stock (Available: %s)', v_available);
+            RETURN NEXT;
+            CONTINUE;
+        END IF;
+        v_remaining := jsonb_set(v_remaining, ARRAY[v_item.product_id::TEXT],
+                                 to_jsonb(v_available - v_item.quantity));
+        v_idx := v_idx || v_item.idx;
+        v_product_ids := v_product_ids || v_item.product_id;
+        v_quantities := v_quantities || v_item.quantity;
+        v_totals := v_totals || (v_item.price * v_item.quantity)::DECIMAL(10,2);
+        v_notes := v_notes || v_item.notes;
+    END LOOP;
+
+    -- Ids are drawn up front so each new order can be matched to its item
+    RETURN QUERY
+    WITH allocated AS (
+        SELECT nextval(pg_get_serial_sequence('orders', 'order_id'))::INTEGER AS order_id,
+               u.idx, u.product_id, u.quantity, u.total, u.notes
+        FROM unnest(v_idx, v_product_ids, v_quantities, v_totals, v_notes)
+            AS u(idx, product_id, quantity, total, notes)
+    ),
+    inserted AS (
+        INSERT INTO orders (order_id, product_id, quantity_ordered, added_by,
+                            total_amount, notes, status)
+        SELECT order_id, product_id, quantity, p_added_by, total, notes, 'Pending'
+        FROM allocated
+        RETURNING order_id, status
+    ),
+    reserved AS (
+        UPDATE products p
+        SET reserved_quantity = p.reserved_quantity + r.quantity
+        FROM (
+            SELECT a.product_id, SUM(a.quantity) AS quantity
+            FROM allocated a
+            GROUP BY a.product_id
+        ) r
+        WHERE p.product_id = r.product_id
+    ),
+    audited AS (
+        INSERT INTO audit_log (table_name, record_id, action, changed_by, new_values)
+        SELECT 'orders', a.order_id, 'INSERT', p_added_by,
+               jsonb_build_object(
+                   'product_id', a.product_id,
+                   'quantity_ordered', a.quantity,
+                   'status', 'Pending',
+                   'total_amount', a.total,
+                   'notes', a.notes
+               )
+        FROM allocated a
+    )
+    SELECT a.idx, i.order_id, i.status, NULL::TEXT
+    FROM allocated a
+    JOIN inserted i ON i.order_id = a.order_id;
+END;
+$$;
+
+-- Applies many status changes in one call. p_items is a JSON array of
+-- {"order_id", "status", "notes"} objects with process_order's semantics,
+-- including taking and releasing Pending orders' stock reservations.
+-- The affected orders rows are locked in order_id order, then their products
+-- in product_id order. Status updates, Sale/Return transactions and audit
+-- rows are each written with one statement. Returns one row per item with
+-- the old and new status, or an error.
+CREATE OR REPLACE FUNCTION process_orders_batch(
+    p_processed_by INTEGER,
+    p_items JSONB
+)
+RETURNS TABLE (
+    item_index INTEGER,
+    order_id INTEGER,
+    old_status VARCHAR,
+    new_status VARCHAR,
+    error TEXT
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_item RECORD;
+    v_seen INTEGER[] := '{}';
+    v_remaining JSONB := '{}';
+    v_available INTEGER;
+    v_movement VARCHAR(20);
+    v_held BOOLEAN;
+    v_reserve INTEGER;
+    v_delta INTEGER;
+    v_idx INTEGER[] := '{}';
+    v_order_ids INTEGER[] := '{}';
+    v_old_statuses VARCHAR[] := '{}';
+    v_statuses VARCHAR[] := '{}';
+    v_notes TEXT[] := '{}';
+    v_movements VARCHAR[] := '{}';
+    v_reserves INTEGER[] := '{}';
+BEGIN
+    PERFORM 1 FROM orders
+    WHERE order_id IN (SELECT (e->>'order_id')::INTEGER FROM jsonb_array_elements(p_items) e)
+    ORDER BY order_id
+    FOR UPDATE;
+
+    PERFORM 1 FROM products
+    WHERE product_id IN (
+        SELECT o.product_id FROM orders o
+        WHERE o.order_id IN (SELECT (e->>'order_id')::INTEGER FROM jsonb_array_elements(p_items) e)
+    )
+    ORDER BY product_id
+    FOR UPDATE;
+
+    FOR v_item IN
+        SELECT (t.ord - 1)::INTEGER AS idx,
+               (t.elem->>'order_id')::INTEGER AS order_id,
+               t.elem->>'status' AS status,
+               t.elem->>'notes' AS notes,
+               o.product_id,
+               o.quantity_ordered,
+               o.status AS current_status,
+               p.quantity - p.reserved_quantity AS stock,
+               COALESCE((
+                   SELECT SUM(CASE WHEN tr.transaction_type = 'Sale' THEN tr.quantity
+                                   ELSE -tr.quantity END)
+                   FROM transactions tr
+                   WHERE tr.reference_id = o.order_id
+                   AND tr.transaction_type IN ('Sale', 'Return')
+               ), 0) > 0 AS has_sale
+        FROM jsonb_array_elements(p_items) WITH ORDINALITY AS t(elem, ord)
+        LEFT JOIN orders o ON o.order_id = (t.elem->>'order_id')::INTEGER
+        LEFT JOIN products p ON p.product_id = o.product_id
+        ORDER BY t.ord
+    LOOP
+        item_index := v_item.idx;
+        order_id := v_item.order_id;
+        old_status := v_item.current_status;
+        new_status := NULL;
+        IF v_item.product_id IS NULL THEN
+            error := 'Order not found';
+            RETURN NEXT;
+            CONTINUE;
+        END IF;
+        IF v_item.status IS NULL OR v_item.status NOT IN ('Pending', 'Approved', 'Cancelled', 'Fulfilled') THEN
+            error := format('Invalid status: %s', v_item.status);
+            RETURN NEXT;
+            CONTINUE;
+        END IF;
+        IF v_item.order_id = ANY(v_seen) THEN
+            error := 'Order appears more than once in the batch';
+            RETURN NEXT;
+            CONTINUE;
+        END IF;
+        v_seen := v_seen || v_item.order_id;
+
+        v_held := v_item.current_status = 'Pending' AND NOT v_item.has_sale;
+        v_movement := CASE
+            WHEN v_item.status IN ('Approved', 'Fulfilled') AND NOT v_item.has_sale THEN 'Sale'
+            WHEN v_item.status = 'Cancelled' AND v_item.has_sale THEN 'Return'
+        END;
+        v_reserve := CASE
+            WHEN v_held AND v_item.status <> 'Pending' THEN -v_item.quantity_ordered
+            WHEN v_item.status = 'Pending' AND NOT v_item.has_sale AND NOT v_held
+                THEN v_item.quantity_ordered
+            ELSE 0
+        END;
+        -- Change in available stock: a released reservation frees stock, a
+        -- new one holds it; a Sale takes stock and a Return gives it back.
+        v_delta := -v_reserve + CASE v_movement
+            WHEN 'Sale' THEN -v_item.quantity_ordered
+            WHEN 'Return' THEN v_item.quantity_ordered
+            ELSE 0
+        END;
+        v_available := COALESCE((v_remaining->>v_item.product_id::TEXT)::INTEGER, v_item.stock);
+        IF v_available + v_delta < 0 THEN
+            error := format('Insufficient stock (Available: %s)', v_available);
+            RETURN NEXT;
+            CONTINUE;
+        END IF;
+        IF v_delta <> 0 THEN
+            v_remaining := jsonb_set(v_remaining, ARRAY[v_item.product_id::TEXT],
+                                     to_jsonb(v_available + v_delta));
+        END IF;
+
+        v_idx := v_idx || v_item.idx;
+        v_order_ids := v_order_ids || v_item.order_id;
+        v_old_statuses := v_old_statuses || v_item.current_status;
+        v_statuses := v_statuses || v_item.status::VARCHAR;
+        v_notes := v_notes || v_item.notes;
+        v_movements := v_movements || v_movement;
+        v_reserves := v_reserves || v_reserve;
+    END LOOP;
+
+    INSERT INTO audit_log (table_name, record_id, action, changed_by, old_values, new_values)
+    SELECT 'orders', u.order_id, 'UPDATE', p_processed_by,
+           jsonb_build_object('status', u.old_status),
+           jsonb_build_object('status', u.status, 'notes', u.notes)
+    FROM unnest(v_order_ids, v_old_statuses, v_statuses, v_notes) AS u(order_id, old_status, status, notes);
+
+    UPDATE orders o
+    SET status = u.status,
+        updated_at = CURRENT_TIMESTAMP
+    FROM unnest(v_order_ids, v_statuses) AS u(order_id, status)
+    WHERE o.order_id = u.order_id;
+
+    -- Released reservations go first so each Sale can take that stock;
+    -- new reservations go last, after Returns have put stock back.
+    UPDATE products p
+    SET reserved_quantity = p.reserved_quantity + r.delta
+    FROM (
+        SELECT o.product_id, SUM(u.reserve) AS delta
+        FROM unnest(v_order_ids, v_reserves) AS u(order_id, reserve)
+        JOIN orders o ON o.order_id = u.order_id
+        WHERE u.reserve < 0
+        GROUP BY o.product_id
+    ) r
+    WHERE p.product_id = r.product_id;
+
+    WITH movements AS (
+        INSERT INTO transactions (product_id, transaction_type, quantity, unit_price,
+                                  total_amount, performed_by, reference_id, notes)
+        SELECT o.product_id, u.movement, o.quantity_ordered,
+               o.total_amount / o.quantity_ordered, o.total_amount, p_processed_by,
+               o.order_id,
+               CASE WHEN u.movement = 'Return'
+                    THEN COALESCE(u.notes, 'Stock restored due to order cancellation')
+                    ELSE u.notes END
+        FROM unnest(v_order_ids, v_notes, v_movements) AS u(order_id, notes, movement)
+        JOIN orders o ON o.order_id = u.order_id
+        WHERE u.movement IS NOT NULL
+        ORDER BY o.product_id, o.order_id
+        RETURNING transaction_id, product_id, transaction_type, quantity, total_amount
+    )
+    INSERT INTO audit_log (table_name, record_id, action, changed_by, new_values)
+    SELECT 'transactions', m.transaction_id, 'INSERT', p_processed_by,
+           jsonb_build_object(
+               'product_id', m.product_id,
+               'transaction_type', m.transaction_type,
+               'quantity', m.quantity,
+               'total_amount', m.total_amount
+           )
+    FROM movements m;
+
+    UPDATE products p
+    SET reserved_quantity = p.reserved_quantity + r.delta
+    FROM (
+        SELECT o.product_id, SUM(u.reserve) AS delta
+        FROM unnest(v_order_ids, v_reserves) AS u(order_id, reserve)
+        JOIN orders o ON o.order_id = u.order_id
+        WHERE u.reserve > 0
+        GROUP BY o.product_id
+    ) r
+    WHERE p.product_id = r.product_id;
+
+    RETURN QUERY
+    SELECT u.idx, u.order_id, u.old_status, u.status, NULL::TEXT
+    FROM unnest(v_idx, v_order_ids, v_old_statuses, v_statuses)
+        AS u(idx, order_id, old_status, status);
+END;
+$$;
+
+-- Detaches monthly audit_log partitions that ended more than p_retain_months
+-- ago. Detached partitions are dropped unless p_drop is FALSE, in which case
+-- they stay behind as standalone tables for archiving.
+CREATE OR REPLACE PROCEDURE purge_audit_log_partitions(
+    p_retain_months INTEGER DEFAULT 12,
+    p_drop BOOLEAN DEFAULT TRUE
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_cutoff DATE := (date_trunc('month', CURRENT_DATE) - make_interval(months => p_retain_months))::DATE;
+    v_partition TEXT;
+BEGIN
+    FOR v_partition IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'audit_log'::regclass
+        AND c.relname ~ '^audit_log_[0-9]{4}_[0-9]{2}$'
+        AND to_date(substr(c.relname, 11), 'YYYY_MM') < v_cutoff
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('ALTER TABLE audit_log DETACH PARTITION %I', v_partition);
+        IF p_drop THEN
+            EXECUTE format('DROP TABLE %I', v_partition);
+        END IF;
+        RAISE NOTICE 'Detached audit log partition %', v_partition;
+    END LOOP;
+END;
+$$;
+
 -- =============================================
 -- VIEWS
 -- =============================================
+-- The WHERE clause matches idx_products_low_stock, so the listing only
+-- touches products that are actually low
 CREATE OR REPLACE VIEW vw_low_stock AS
 SELECT p.product_id, p.product_name, p.quantity, p.min_stocks, s.supplier_name
 FROM products p
-JOIN suppliers s ON p.supplier_id = s.supplier_id
+LEFT JOIN suppliers s ON p.supplier_id = s.supplier_id
 WHERE p.quantity < p.min_stocks AND p.is_deleted = FALSE;
 
 CREATE OR REPLACE VIEW vw_sales_report AS
@@ -631,22 +1682,178 @@ CREATE TRIGGER update_orders_timestamp BEFORE UPDATE ON orders FOR EACH ROW EXEC
 DROP TRIGGER IF EXISTS stock_update_trigger ON transactions;
 CREATE TRIGGER stock_update_trigger 
 AFTER INSERT ON transactions 
-FOR EACH ROW 
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
 EXECUTE FUNCTION handle_transaction_stock_update();
 
+CREATE TRIGGER sales_rollup_insert
+AFTER INSERT ON transactions
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION maintain_sales_rollup();
+
+CREATE TRIGGER sales_rollup_update
+AFTER UPDATE ON transactions
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION maintain_sales_rollup();
+
+CREATE TRIGGER sales_rollup_delete
+AFTER DELETE ON transactions
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION maintain_sales_rollup();
+
+CREATE TRIGGER low_stock_alert
+AFTER UPDATE ON products
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION detect_low_stock();
+
+CREATE TRIGGER supplier_stats_products_insert
+AFTER INSERT ON products
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION maintain_supplier_product_stats();
+
+CREATE TRIGGER supplier_stats_products_update
+AFTER UPDATE ON products
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION maintain_supplier_product_stats();
+
+CREATE TRIGGER supplier_stats_products_delete
+AFTER DELETE ON products
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION maintain_supplier_product_stats();
+
+CREATE TRIGGER supplier_stats_sales
+AFTER INSERT ON transactions
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION maintain_supplier_sales_stats();
+
+-- The WHEN clause is checked without calling the function, so sync mode
+-- pays no per-row trigger cost
+CREATE TRIGGER audit_log_route
+BEFORE INSERT ON audit_log
+FOR EACH ROW
+WHEN (current_setting('ims.audit_mode', true) = 'async')
+EXECUTE FUNCTION route_audit_event();
+
+CREATE TRIGGER notification_change_notify
+AFTER INSERT OR UPDATE OF is_read ON notifications
+FOR EACH ROW
+EXECUTE FUNCTION notify_notification_change();
+
+-- Transition tables require one trigger per event
+CREATE TRIGGER notification_counters_insert
+AFTER INSERT ON notifications
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION maintain_notification_counters();
+
+CREATE TRIGGER notification_counters_update
+AFTER UPDATE ON notifications
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION maintain_notification_counters();
+
+CREATE TRIGGER notification_counters_delete
+AFTER DELETE ON notifications
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION maintain_notification_counters();
+
+-- Version tracking (see table_versions)
+DO $$
+DECLARE
+    v_table TEXT;
+BEGIN
+    FOREACH v_table IN ARRAY ARRAY['products', 'suppliers', 'transactions', 'users',
+                                   'sales_daily_rollup'] LOOP
+        EXECUTE format('CREATE TRIGGER %I AFTER INSERT OR DELETE OR TRUNCATE ON %I '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION note_table_change()',
+                       v_table || '_note_change', v_table);
+        EXECUTE format('CREATE TRIGGER %I AFTER UPDATE ON %I '
+                       'REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION note_table_update()',
+                       v_table || '_note_update', v_table);
+    END LOOP;
+END
+$$;
+
 -- =============================================
 -- INDEXES
 -- =============================================
 CREATE INDEX idx_notifications_user ON notifications(user_id);
 CREATE INDEX idx_notifications_unread ON notifications(user_id) WHERE is_read = FALSE;
+CREATE INDEX idx_notification_counter_deltas_user ON notification_counter_deltas(user_id);
+CREATE INDEX idx_table_changes_table ON table_changes(table_name);
+
+-- Keyset pagination of the transactions ledger: (transaction_date, transaction_id) DESC
+-- with NULL dates last (database.LEDGER_SORT_DATE), optionally narrowed by product,
+-- type or performer
+CREATE INDEX idx_transactions_date_id ON transactions(COALESCE(transaction_date, '-infinity'::date) DESC, transaction_id DESC);
+CREATE INDEX idx_transactions_product_date ON transactions(product_id, COALESCE(transaction_date, '-infinity'::date) DESC, transaction_id DESC);
+CREATE INDEX idx_transactions_type_date ON transactions(transaction_type, COALESCE(transaction_date, '-infinity'::date) DESC, transaction_id DESC);
+CREATE INDEX idx_transactions_performer_date ON transactions(performed_by, COALESCE(transaction_date, '-infinity'::date) DESC, transaction_id DESC);
+
+-- Pending-order count for the dashboard metrics
+CREATE INDEX idx_orders_pending ON orders(order_id) WHERE status = 'Pending';
+
+-- Looking up an order's Sale/Return transactions when processing it
+CREATE INDEX idx_transactions_reference ON transactions(reference_id) WHERE reference_id IS NOT NULL;
+
+-- Product catalogue: substring search (ILIKE) on name/category via trigrams,
+-- name prefix lookups for the order form typeahead, and the sortable columns
+CREATE INDEX idx_products_name_trgm ON products USING gin (product_name gin_trgm_ops) WHERE is_deleted = FALSE;
+CREATE INDEX idx_products_category_trgm ON products USING gin (category gin_trgm_ops) WHERE is_deleted = FALSE;
+CREATE INDEX idx_products_name_prefix ON products (lower(product_name) text_pattern_ops) WHERE is_deleted = FALSE;
+CREATE INDEX idx_products_active_name ON products (product_name, product_id) WHERE is_deleted = FALSE;
+CREATE INDEX idx_products_active_category ON products (category, product_id) WHERE is_deleted = FALSE;
+CREATE INDEX idx_products_active_price ON products (price, product_id) WHERE is_deleted = FALSE;
+CREATE INDEX idx_products_active_quantity ON products (quantity, product_id) WHERE is_deleted = FALSE;
+-- A supplier's products by name (supplier details page)
+CREATE INDEX idx_products_supplier_name ON products (supplier_id, product_name) WHERE is_deleted = FALSE;
+-- Low-stock listing (vw_low_stock), most short first; its size follows the
+-- number of low products, not the catalogue
+CREATE INDEX idx_products_low_stock ON products ((quantity - min_stocks), product_id)
+    WHERE quantity < min_stocks AND is_deleted = FALSE;
+-- At most one unread LowStock alert per product per user (see detect_low_stock())
+CREATE UNIQUE INDEX idx_notifications_lowstock_unread ON notifications (user_id, related_entity_id)
+    WHERE notification_type = 'LowStock' AND is_read = FALSE;
+
+-- Audit log page: newest first, optionally filtered by table, action or user
+CREATE INDEX idx_audit_log_created ON audit_log(created_at DESC, log_id DESC);
+CREATE INDEX idx_audit_log_table_created ON audit_log(table_name, created_at DESC, log_id DESC);
+CREATE INDEX idx_audit_log_action_created ON audit_log(action, created_at DESC, log_id DESC);
+CREATE INDEX idx_audit_log_changed_by_created ON audit_log(changed_by, created_at DESC, log_id DESC);
+
+-- =============================================
+-- PARTITIONS
+-- =============================================
+SELECT ensure_audit_log_partitions(3);
 
 -- =============================================
 -- ROLES
 -- =============================================
-CREATE ROLE ims_admin NOLOGIN;
-CREATE ROLE ims_manager NOLOGIN;
-CREATE ROLE ims_sales NOLOGIN;
-CREATE ROLE ims_anon NOLOGIN;
+-- Roles are cluster-wide and survive the DROPs above; create them only once
+-- so that this script can be re-run (benchmarks/seed.py does so).
+DO $$
+DECLARE
+    r TEXT;
+BEGIN
+    FOREACH r IN ARRAY ARRAY['ims_admin', 'ims_manager', 'ims_sales', 'ims_anon'] LOOP
+        IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = r) THEN
+            EXECUTE format('CREATE ROLE %I NOLOGIN', r);
+        END IF;
+    END LOOP;
+    IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'ims_web') THEN
+        CREATE ROLE ims_web LOGIN PASSWORD 'securepassword123';
+    END IF;
+END $$;
 
 GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA public TO ims_admin;
 GRANT ALL PRIVILEGES ON ALL SEQUENCES IN SCHEMA public TO ims_admin;
@@ -659,7 +1866,6 @@ GRANT SELECT, INSERT, UPDATE ON orders TO ims_sales;
 
 GRANT SELECT ON users TO ims_anon;
 
-CREATE ROLE ims_web LOGIN PASSWORD 'securepassword123';
 GRANT ims_anon TO ims_web;
 
 -- =============================================
@@ -0,0 +1,299 @@
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = registry._lock
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _describe(self):
+        return {'kind': self.kind, 'help': self.help, 'labelnames': list(self.labelnames)}
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        """Mirror a running total kept elsewhere (e.g. ConnectionPool.stats())."""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Gauge(_Metric):
+    """A value that goes up and down.
+
+    Across processes, gauges of exited processes are ignored and the rest are
+    combined with ``aggregate``: 'sum' (connections, in-flight requests) or
+    'max' (worst wait seen).
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, registry, name, help, labelnames=(), aggregate='sum'):
+        if aggregate not in ('sum', 'max'):
+            raise ValueError(f"aggregate must be 'sum' or 'max', got {aggregate!r}")
+        super().__init__(registry, name, help, labelnames)
+        self.aggregate = aggregate
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def _describe(self):
+        return dict(super()._describe(), aggregate=self.aggregate)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # Per-bucket counts (cumulated when rendered), then sum and count
+            slots = self._values.get(key)
+            if slots is None:
+                slots = self._values[key] = [0] * (len(self.buckets) + 3)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    slots[i] += 1
+                    break
+            else:
+                slots[len(self.buckets)] += 1
+            slots[-2] += value
+            slots[-1] += 1
+
+    def _describe(self):
+        return dict(super()._describe(), buckets=list(self.buckets))
+
+
+class MetricsRegistry:
+    """In-process counters, gauges and histograms in the Prometheus text format.
+
+    Updates take one lock and touch a dict, so they are cheap enough for
+    every request. With ``directory`` set (one per deployment, shared by all
+    worker processes), a background thread writes this process's values to
+    ``metrics-<pid>.json`` there every ``flush_interval`` seconds, and render()
+    adds up the files of every process. A scrape therefore sees the other
+    workers as of their last flush. Counters and histograms of exited workers
+    keep counting towards the totals, as Prometheus expects. Their gauges are
+    dropped. Empty the directory when the service is restarted.
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+        self._thread = None
+        self._stopping = threading.Event()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._start_flusher()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    # -- definitions -------------------------------------------------------
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(self, name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=(), aggregate='sum'):
+        return self._register(Gauge(self, name, help, labelnames, aggregate))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, help, labelnames, buckets))
+
+    def add_collector(self, collect):
+        """Call ``collect()`` before every render or flush, to refresh mirrored values."""
+        self._collectors.append(collect)
+
+    # -- processes ---------------------------------------------------------
+    def _after_fork(self):
+        # A forked worker starts from zero; the parent's values are the parent's
+        self._lock = threading.Lock()
+        for metric in self._metrics.values():
+            metric._lock = self._lock
+            metric._values = {}
+        self._thread = None
+        self._stopping = threading.Event()
+        if self.directory:
+            self._start_flusher()
+
+    def _start_flusher(self):
+        self._thread = threading.Thread(target=self._run, name='metrics-flusher', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopping.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Writing metrics to %s failed', self.directory)
+
+    def stop(self):
+        self._stopping.set()
+
+    def _collect(self):
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception:
+                logger.exception('Metrics collector %r failed', collect)
+
+    def _state(self):
+        with self._lock:
+            return {
+                name: dict(metric._describe(),
+                           values=[[list(key), value if not isinstance(value, list) else list(value)]
+                                   for key, value in metric._values.items()])
+                for name, metric in self._metrics.items()
+            }
+
+    def flush(self):
+        """Write this process's values to the shared directory."""
+        self._collect()
+        state = self._state()
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.metrics-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'pid': os.getpid(), 'metrics': state}, f)
+        os.replace(tmp, os.path.join(self.directory, f'metrics-{os.getpid()}.json'))
+
+    def _load_all(self):
+        processes = []
+        for entry in os.listdir(self.directory):
+            if not (entry.startswith('metrics-') and entry.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.directory, entry)) as f:
+                    processes.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # being replaced, or truncated by a crash
+        return processes
+
+    # -- exposition --------------------------------------------------------
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        if self.directory:
+            self.flush()
+            merged = _merge(self._load_all())
+        else:
+            self._collect()
+            merged = self._state()
+        lines = []
+        for name, metric in sorted(merged.items()):
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['kind']}")
+            labelnames = metric['labelnames']
+            for key, value in sorted(metric['values'], key=lambda item: item[0]):
+                labels = list(zip(labelnames, key))
+                if metric['kind'] != 'histogram':
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric['buckets'] + ['+Inf'], value):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else _number(bound)
+                    lines.append(f'{name}_bucket{_labels(labels + [("le", le)])} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(value[-2])}')
+                lines.append(f'{name}_count{_labels(labels)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(processes):
+    merged = {}
+    for process in processes:
+        alive = None
+        for name, metric in process['metrics'].items():
+            if metric['kind'] == 'gauge':
+                if alive is None:
+                    alive = _pid_alive(process['pid'])
+                if not alive:
+                    continue
+            target = merged.get(name)
+            if target is None:
+                target = merged[name] = dict(metric, values={})
+            values = target['values']
+            for key, value in metric['values']:
+                key = tuple(key)
+                current = values.get(key)
+                if current is None:
+                    values[key] = value
+                elif metric['kind'] == 'histogram':
+                    values[key] = [a + b for a, b in zip(current, value)]
+                elif metric.get('aggregate') == 'max':
+                    values[key] = max(current, value)
+                else:
+                    values[key] = current + value
+    for metric in merged.values():
+        metric['values'] = list(metric['values'].items())
+    return merged
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if isinstance(value, float):
+        if math.isnan(value):
+            return 'NaN'
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
@@ -0,0 +1,165 @@
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from collections import defaultdict
+
+from psycopg2 import extensions
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'ims_notifications'
+
+
+class TooManySubscribers(Exception):
+    """subscribe() was called with max_subscribers streams already open."""
+
+
+class NotificationBroker:
+    """Relays Postgres NOTIFY events on CHANNEL to per-user subscriber queues.
+
+    One background thread per process holds a dedicated LISTEN connection
+    (opened with ``connect``, outside the request pool) and is started by the
+    first subscribe(). Each subscriber gets a bounded queue; if a slow client
+    lets it fill up, its backlog is replaced by one ``resync`` event telling
+    it to refetch. With ``max_subscribers`` set, subscribe() raises
+    TooManySubscribers once that many queues are open.
+    """
+
+    def __init__(self, connect, channel=CHANNEL, queue_size=100, poll_interval=5.0,
+                 max_subscribers=None):
+        self._connect = connect
+        self.channel = channel
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self.max_subscribers = max_subscribers
+        self._subscriber_count = 0
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+        self.events_received = 0
+        self.events_delivered = 0
+        self.events_dropped = 0
+        self.subscribers_rejected = 0
+
+    def subscribe(self, user_id):
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            if self.max_subscribers is not None and self._subscriber_count >= self.max_subscribers:
+                self.subscribers_rejected += 1
+                raise TooManySubscribers(f'{self._subscriber_count} notification streams open')
+            self._subscribers[user_id].add(q)
+            self._subscriber_count += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name='notification-listener',
+                                                daemon=True)
+                self._thread.start()
+        return q
+
+    def unsubscribe(self, user_id, q):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None and q in subscribers:
+                subscribers.discard(q)
+                self._subscriber_count -= 1
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return self._subscriber_count
+
+    def stop(self):
+        self._stopping.set()
+
+    def publish(self, event):
+        """Deliver an event dict to the queues subscribed to event['user_id'].
+
+        ``user_id`` None broadcasts to every subscriber.
+        """
+        user_id = event.get('user_id')
+        with self._lock:
+            if user_id is None:
+                targets = [q for qs in self._subscribers.values() for q in qs]
+            else:
+                targets = list(self._subscribers.get(user_id, ()))
+        for q in targets:
+            try:
+                q.put_nowait(event)
+                self.events_delivered += 1
+            except queue.Full:
+                # Replace the backlog with a single resync marker.
+                while True:
+                    try:
+                        q.get_nowait()
+                        self.events_dropped += 1
+                    except queue.Empty:
+                        break
+                q.put_nowait({'event': 'resync', 'user_id': user_id})
+
+    def _run(self):
+        backoff = 1.0
+        while not self._stopping.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cur = conn.cursor()
+                cur.execute(f"LISTEN {self.channel}")
+                cur.close()
+                backoff = 1.0
+                # Anything sent while we were disconnected is lost; make clients refetch.
+                self.publish({'event': 'resync', 'user_id': None})
+                while not self._stopping.is_set():
+                    if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self.events_received += 1
+                        try:
+                            self.publish(json.loads(notify.payload))
+                        except ValueError:
+                            logger.warning('Ignoring malformed notification payload: %r',
+                                           notify.payload)
+            except Exception:
+                logger.exception('Notification listener failed; reconnecting in %.0fs', backoff)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def stats(self):
+        return {
+            'listening': self._thread is not None and self._thread.is_alive(),
+            'subscribers': self.subscriber_count(),
+            'max_subscribers': self.max_subscribers,
+            'subscribers_rejected': self.subscribers_rejected,
+            'events_received': self.events_received,
+            'events_delivered': self.events_delivered,
+            'events_dropped': self.events_dropped,
+        }
+
+
+def sse_stream(q, heartbeat=20.0):
+    """Generator yielding Server-Sent Events from a subscriber queue.
+
+    The caller subscribes, so it can refuse the stream before it starts, and
+    unsubscribes when the response is closed.
+    """
+    yield 'retry: 5000\n\n'
+    while True:
+        try:
+            event = q.get(timeout=heartbeat)
+        except queue.Empty:
+            yield ': keepalive\n\n'
+            continue
+        yield f"event: {event.get('event', 'message')}\ndata: {json.dumps(event)}\n\n"
@@ -0,0 +1,312 @@
+import csv
+import io
+import json
+from decimal import Decimal
+
+from database import get_db_connection
+
+# Columns accepted in an import file. A row names its supplier either by
+# supplier_id or by supplier_name; min_stocks defaults to 5.
+IMPORT_FIELDS = ('product_name', 'category', 'price', 'quantity',
+                 'supplier_id', 'supplier_name', 'min_stocks')
+MAX_REPORTED_ERRORS = 1000
+# Bounds of the INTEGER and DECIMAL(10,2) columns rows are COPYed into; a
+# value outside them would fail the COPY and with it the whole import
+INT_MAX = 2 ** 31 - 1
+MAX_AMOUNT = Decimal('100000000')
+
+STAGING_COLUMNS = ('row_no', 'product_name', 'category', 'price', 'quantity',
+                   'supplier_id', 'supplier_name', 'min_stocks')
+
+
+def detect_format(filename):
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if name.endswith('.json'):
+        return 'json'
+    raise ValueError('Unsupported file type; upload a .csv, .json or .jsonl file')
+
+
+def read_rows(stream, fmt):
+    """Yield (row_no, dict) from a text stream in csv, json (array) or jsonl format."""
+    if fmt == 'csv':
+        # Row 1 is the header
+        for row_no, row in enumerate(csv.DictReader(stream), start=2):
+            yield row_no, row
+    elif fmt == 'jsonl':
+        for row_no, line in enumerate(stream, start=1):
+            if line.strip():
+                try:
+                    yield row_no, json.loads(line)
+                except ValueError as e:
+                    yield row_no, ValueError(f'Invalid JSON: {e}')
+    elif fmt == 'json':
+        data = json.load(stream)
+        if not isinstance(data, list):
+            raise ValueError('JSON import must be an array of product objects')
+        for row_no, row in enumerate(data, start=1):
+            yield row_no, row
+    else:
+        raise ValueError(f'Unsupported import format: {fmt}')
+
+
+def _text(row, field, max_length=None, required=False):
+    value = row.get(field)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f'{field} is required')
+    if '\x00' in value:
+        raise ValueError(f'{field} contains a NUL character')
+    if max_length and len(value) > max_length:
+        raise ValueError(f'{field} is longer than {max_length} characters')
+    return value or None
+
+
+def _number(row, field, cast, default=None, minimum=0, maximum=INT_MAX):
+    value = row.get(field)
+    if value is None or str(value).strip() == '':
+        if default is None:
+            raise ValueError(f'{field} is required')
+        return default
+    try:
+        number = cast(str(value).strip())
+        if isinstance(number, Decimal) and not number.is_finite():
+            raise ValueError
+        out_of_range = number < minimum or number > maximum
+    except (ValueError, ArithmeticError):
+        raise ValueError(f'{field} must be a number, got {value!r}')
+    if out_of_range:
+        raise ValueError(f'{field} must be between {minimum} and {maximum}')
+    return number
+
+
+def validate_row(row):
+    """Return the staging tuple for one input row or raise ValueError."""
+    if isinstance(row, Exception):
+        raise row
+    if not isinstance(row, dict):
+        raise ValueError('Row must be an object')
+    supplier_id = row.get('supplier_id')
+    supplier_name = _text(row, 'supplier_name', 100)
+    if supplier_id in (None, ''):
+        supplier_id = None
+        if not supplier_name:
+            raise ValueError('supplier_id or supplier_name is required')
+    else:
+        supplier_id = _number(row, 'supplier_id', int, minimum=1)
+    price = _number(row, 'price', Decimal, maximum=MAX_AMOUNT).quantize(Decimal('0.01'))
+    if price >= MAX_AMOUNT:
+        raise ValueError(f'price must be less than {MAX_AMOUNT}')
+    quantity = _number(row, 'quantity', int)
+    # The opening-stock transaction records price * quantity as total_amount
+    if price * quantity >= MAX_AMOUNT:
+        raise ValueError(f'price * quantity must be less than {MAX_AMOUNT}')
+    return (
+        _text(row, 'product_name', 100, required=True),
+        _text(row, 'category', 50, required=True),
+        price,
+        quantity,
+        supplier_id,
+        supplier_name,
+        _number(row, 'min_stocks', int, default=5),
+    )
+
+
+def _copy_batch(cur, batch):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for record in batch:
+        writer.writerow(['' if value is None else value for value in record])
+    buffer.seek(0)
+    cur.copy_expert(
+        f"COPY product_import_staging ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+        buffer)
+
+
+def import_products(stream, fmt, added_by, batch_size=5000):
+    """Bulk-load products from a text stream in one transaction.
+
+    Rows are validated in batches and COPYed into a temporary staging table.
+    Suppliers are resolved with one lookup, and everything is then merged
+    into products by product_name. New products get an opening-stock
+    Purchase transaction, so stock moves and audit rows go through the usual
+    trigger path. Invalid rows are skipped and reported; they never abort
+    the rest of the import. The quantity of an existing product is left
+    alone, and each such row with a quantity is reported as a warning. A
+    soft-deleted product with the same name is restored with the stock it
+    had when it was deleted; it is counted as restored, not updated, and
+    reported as a warning.
+
+    Returns a dict with inserted/updated/restored/rejected counts, per-row
+    errors and warnings.
+    """
+    errors = []
+    rejected = 0
+    warnings = []
+
+    def reject(row_no, message):
+        nonlocal rejected
+        rejected += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'row': row_no, 'error': message})
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            CREATE TEMP TABLE product_import_staging (
+                row_no INTEGER PRIMARY KEY,
+                product_name VARCHAR(100) NOT NULL,
+                category VARCHAR(50) NOT NULL,
+                price DECIMAL(10,2) NOT NULL,
+                quantity INTEGER NOT NULL,
+                supplier_id INTEGER,
+                supplier_name VARCHAR(100),
+                min_stocks INTEGER NOT NULL
+            ) ON COMMIT DROP
+        """)
+
+        batch = []
+        for row_no, row in read_rows(stream, fmt):
+            try:
+                batch.append((row_no,) + validate_row(row))
+            except (ValueError, ArithmeticError) as e:
+                reject(row_no, str(e))
+            if len(batch) >= batch_size:
+                _copy_batch(cur, batch)
+                batch = []
+        if batch:
+            _copy_batch(cur, batch)
+
+        # One lookup resolves every supplier named in the file
+        cur.execute("""
+            UPDATE product_import_staging st
+            SET supplier_id = s.supplier_id
+            FROM suppliers s
+            WHERE st.supplier_id IS NULL AND lower(s.supplier_name) = lower(st.supplier_name)
+        """)
+        cur.execute("""
+            DELETE FROM product_import_staging st
+            WHERE st.supplier_id IS NULL
+            OR NOT EXISTS (SELECT 1 FROM suppliers s WHERE s.supplier_id = st.supplier_id)
+            RETURNING row_no, COALESCE(supplier_id::TEXT, supplier_name)
+        """)
+        for row_no, supplier in sorted(cur.fetchall()):
+            reject(row_no, f'Unknown supplier: {supplier}')
+        # The last occurrence of a product name in the file wins
+        cur.execute("""
+            DELETE FROM product_import_staging a
+            WHERE EXISTS (
+                SELECT 1 FROM product_import_staging b
+                WHERE b.product_name = a.product_name AND b.row_no > a.row_no
+            )
+            RETURNING a.row_no
+        """)
+        for (row_no,) in sorted(cur.fetchall()):
+            reject(row_no, 'Duplicate product_name; a later row in the file is used instead')
+
+        cur.execute("""
+            CREATE TEMP TABLE product_import_merged (
+                product_id INTEGER PRIMARY KEY,
+                product_name VARCHAR(100) NOT NULL,
+                inserted BOOLEAN NOT NULL,
+                restored BOOLEAN NOT NULL
+            ) ON COMMIT DROP
+        """)
+        # The deleted CTE reads products as they were before the upsert
+        cur.execute("""
+            WITH deleted AS (
+                SELECT p.product_id
+                FROM products p
+                JOIN product_import_staging st USING (product_name)
+                WHERE p.is_deleted
+            ),
+            merged AS (
+                INSERT INTO products (product_name, category, price, quantity,
+                                      supplier_id, min_stocks, added_by)
+                SELECT product_name, category, price, 0, supplier_id, min_stocks, %s
+                FROM product_import_staging
+                ON CONFLICT (product_name) DO UPDATE
+                SET category = EXCLUDED.category,
+                    price = EXCLUDED.price,
+                    supplier_id = EXCLUDED.supplier_id,
+                    min_stocks = EXCLUDED.min_stocks,
+                    is_deleted = FALSE
+                RETURNING product_id, product_name, (xmax = 0) AS inserted,
+                          product_id IN (SELECT product_id FROM deleted) AS restored
+            )
+            INSERT INTO product_import_merged SELECT * FROM merged
+        """, (added_by,))
+
+        cur.execute("""
+            INSERT INTO audit_log (table_name, record_id, action, changed_by, new_values)
+            SELECT 'products', m.product_id,
+                   CASE WHEN m.inserted THEN 'INSERT' ELSE 'UPDATE' END, %s,
+                   jsonb_build_object('name', st.product_name, 'category', st.category,
+                                      'price', st.price, 'supplier_id', st.supplier_id,
+                                      'min_stocks', st.min_stocks, 'source', 'bulk import')
+            FROM product_import_merged m
+            JOIN product_import_staging st USING (product_name)
+        """, (added_by,))
+
+        # Opening stock for new products goes through the transactions ledger
+        cur.execute("""
+            INSERT INTO transactions (product_id, transaction_type, quantity, unit_price,
+                                      total_amount, performed_by, notes)
+            SELECT m.product_id, 'Purchase', st.quantity, st.price,
+                   st.price * st.quantity, %s, 'Opening stock (bulk import)'
+            FROM product_import_merged m
+            JOIN product_import_staging st USING (product_name)
+            WHERE m.inserted AND st.quantity > 0
+            ORDER BY m.product_id
+        """, (added_by,))
+
+        # Stock of existing products only changes through orders and transactions
+        cur.execute("""
+            SELECT st.row_no, st.quantity, m.restored, p.quantity
+            FROM product_import_merged m
+            JOIN product_import_staging st USING (product_name)
+            JOIN products p USING (product_id)
+            WHERE m.restored OR (NOT m.inserted AND st.quantity > 0)
+            ORDER BY st.row_no
+        """)
+        for row_no, quantity, restored, stock in cur.fetchmany(MAX_REPORTED_ERRORS):
+            if restored:
+                warning = f'Deleted product restored with its previous stock of {stock}'
+                if quantity > 0:
+                    warning += f'; quantity {quantity} ignored'
+            else:
+                warning = f'Product exists; quantity {quantity} ignored, stock unchanged'
+            warnings.append({'row': row_no, 'warning': warning})
+
+        cur.execute("""
+            SELECT COUNT(*) FILTER (WHERE m.inserted),
+                   COUNT(*) FILTER (WHERE NOT m.inserted AND NOT m.restored),
+                   COUNT(*) FILTER (WHERE m.restored),
+                   COUNT(*) FILTER (WHERE NOT m.inserted AND st.quantity > 0)
+            FROM product_import_merged m
+            JOIN product_import_staging st USING (product_name)
+        """)
+        inserted, updated, restored, quantity_ignored = cur.fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+    errors.sort(key=lambda e: e['row'])
+    return {
+        'inserted': inserted,
+        'updated': updated,
+        'restored': restored,
+        'rejected': rejected,
+        'errors': errors,
+        'errors_truncated': rejected > len(errors),
+        'quantity_ignored': quantity_ignored,
+        'warnings': warnings,
+    }
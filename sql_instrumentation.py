@@ -0,0 +1,251 @@
+import contextvars
+import logging
+import re
+import threading
+import time
+
+import psycopg2.extensions
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in milliseconds, of the latency histogram buckets
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s)(?:\s*,\s*(?:\?|%s|%\(\w+\)s))+\s*\)")
+_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s")
+_ROW_LIST = re.compile(r"(\([^()]*\))(?:\s*,\s*\([^()]*\))+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """Collapse a statement to its shape.
+
+    Literals and parameters become ``?``, and IN lists and multi-row VALUES
+    lists are cut to their first element, so statements that differ only in
+    their arguments share a fingerprint.
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(?, ...)', sql)
+    sql = _ROW_LIST.sub(r'\1, ...', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class Histogram:
+    """Latency histogram over BUCKETS_MS, plus count, sum and max."""
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (None past the last bound)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS_MS, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return None
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total_ms': round(self.total, 2),
+            'mean_ms': round(self.total / self.count, 2) if self.count else None,
+            'max_ms': round(self.max, 2),
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'buckets': dict(zip([f'le_{b}' for b in BUCKETS_MS] + ['inf'], self.counts)),
+        }
+
+
+class RequestStats:
+    """What one request did against the database."""
+
+    __slots__ = ('route', 'queries', 'db_time', 'slowest_sql', 'slowest_ms', 'fingerprints')
+
+    def __init__(self, route):
+        self.route = route
+        self.queries = 0
+        self.db_time = 0.0
+        self.slowest_sql = None
+        self.slowest_ms = 0.0
+        self.fingerprints = {}
+
+
+_current = contextvars.ContextVar('ims_sql_request_stats', default=None)
+
+
+def current_request_stats():
+    """RequestStats of the request being handled in this context, if any."""
+    return _current.get()
+
+
+class SQLInstrumentation:
+    """Times every statement run through an instrumented cursor.
+
+    Statements are aggregated per fingerprint, requests per route; both keep a
+    latency histogram. Statements slower than ``slow_ms`` are logged, and so is
+    a request that runs one fingerprint ``n_plus_one`` times or more, which is
+    usually a query issued once per row of an earlier result. At most
+    ``max_statements`` fingerprints are tracked; later ones are counted under
+    ``<other>``.
+    """
+
+    def __init__(self, slow_ms=200.0, n_plus_one=10, max_statements=500):
+        self.slow_ms = slow_ms
+        self.n_plus_one = n_plus_one
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self._factories = {}
+        self._statements = {}
+        self._routes = {}
+        self.started_at = time.time()
+
+    # -- cursors -----------------------------------------------------------
+    def cursor_factory(self, base=None):
+        """Subclass of ``base`` (default: the plain psycopg2 cursor) that reports here."""
+        base = base or psycopg2.extensions.cursor
+        factory = self._factories.get(base)
+        if factory is None:
+            factory = self._factories[base] = _instrumented(base, self)
+        return factory
+
+    # -- requests ----------------------------------------------------------
+    def begin_request(self, route):
+        return _current.set(RequestStats(route))
+
+    def end_request(self, token):
+        """Stop collecting for the current request and return its stats."""
+        stats = _current.get()
+        _current.reset(token)
+        if stats is None:
+            return None
+        with self._lock:
+            route = self._routes.get(stats.route)
+            if route is None:
+                route = self._routes[stats.route] = {
+                    'requests': 0, 'queries': 0, 'db_time': Histogram(), 'max_queries': 0}
+            route['requests'] += 1
+            route['queries'] += stats.queries
+            route['max_queries'] = max(route['max_queries'], stats.queries)
+            route['db_time'].observe(stats.db_time)
+        for sql, count in stats.fingerprints.items():
+            if count >= self.n_plus_one:
+                logger.warning('Possible N+1 in %s: %d executions of %s',
+                               stats.route, count, sql[:300])
+        return stats
+
+    # -- statements --------------------------------------------------------
+    def record(self, sql, ms):
+        try:
+            key = fingerprint(sql)
+        except Exception:
+            key = '<unparsed>'
+        with self._lock:
+            histogram = self._statements.get(key)
+            if histogram is None:
+                if len(self._statements) >= self.max_statements:
+                    key = '<other>'
+                    histogram = self._statements.get(key)
+                if histogram is None:
+                    histogram = self._statements[key] = Histogram()
+            histogram.observe(ms)
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += ms
+            stats.fingerprints[key] = stats.fingerprints.get(key, 0) + 1
+            if ms > stats.slowest_ms:
+                stats.slowest_ms, stats.slowest_sql = ms, key
+        if ms >= self.slow_ms:
+            logger.warning('Slow query (%.1f ms) in %s: %s', ms,
+                           stats.route if stats is not None else 'background', key[:500])
+
+    def snapshot(self, limit=50):
+        with self._lock:
+            statements = [(sql, h.to_dict()) for sql, h in self._statements.items()]
+            routes = [(route, dict(r, db_time=r['db_time'].to_dict()))
+                      for route, r in self._routes.items()]
+        statements.sort(key=lambda item: item[1]['total_ms'], reverse=True)
+        routes.sort(key=lambda item: item[1]['db_time']['total_ms'], reverse=True)
+        return {
+            'since': self.started_at,
+            'slow_ms': self.slow_ms,
+            'n_plus_one': self.n_plus_one,
+            'routes': [dict(r, route=route) for route, r in routes[:limit]],
+            'statements': [dict(h, sql=sql) for sql, h in statements[:limit]],
+        }
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._routes.clear()
+            self.started_at = time.time()
+
+
+def _query_text(cursor, query):
+    if hasattr(query, 'as_string'):  # psycopg2.sql.Composable
+        query = query.as_string(cursor)
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    return query
+
+
+def _instrumented(base, instrumentation):
+    class InstrumentedCursor(base):
+        def execute(self, query, vars=None):
+            started = time.perf_counter()
+            try:
+                return super().execute(query, vars)
+            finally:
+                instrumentation.record(_query_text(self, query),
+                                       (time.perf_counter() - started) * 1000)
+
+        def executemany(self, query, vars_list):
+            started = time.perf_counter()
+            try:
+                return super().executemany(query, vars_list)
+            finally:
+                instrumentation.record(_query_text(self, query),
+                                       (time.perf_counter() - started) * 1000)
+
+        def callproc(self, procname, vars=None):
+            started = time.perf_counter()
+            try:
+                return super().callproc(procname, vars)
+            finally:
+                instrumentation.record(f'CALL {procname}', (time.perf_counter() - started) * 1000)
+
+        def copy_expert(self, sql, file, size=8192):
+            started = time.perf_counter()
+            try:
+                return super().copy_expert(sql, file, size)
+            finally:
+                instrumentation.record(_query_text(self, sql),
+                                       (time.perf_counter() - started) * 1000)
+
+    InstrumentedCursor.__name__ = f'Instrumented{base.__name__}'
+    return InstrumentedCursor
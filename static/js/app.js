@@ -1,9 +1,33 @@
-// Search functionality for products
-document.getElementById('searchProducts')?.addEventListener('input', function() {
-    const searchTerm = this.value.toLowerCase();
-    document.querySelectorAll('#productsTable tbody tr').forEach(row => {
-        row.style.display = row.textContent.toLowerCase().includes(searchTerm) ? '' : 'none';
-    });
+// Product typeahead for the order form
+let productSearchTimer = null;
+
+document.getElementById('productSearch')?.addEventListener('input', function() {
+    const query = this.value.trim();
+    const options = document.getElementById('productOptions');
+    const match = Array.from(options.options).find(option => option.value === this.value);
+    document.getElementById('productId').value = match ? match.dataset.productId : '';
+    document.getElementById('productStock').textContent = match ? `Available: ${match.dataset.available} (in stock: ${match.dataset.quantity})` : '';
+
+    clearTimeout(productSearchTimer);
+    if (match || query.length === 0) {
+        return;
+    }
+    productSearchTimer = setTimeout(() => {
+        fetch(`/api/products/search?q=${encodeURIComponent(query)}&limit=10`)
+            .then(res => res.json())
+            .then(products => {
+                options.innerHTML = '';
+                products.forEach(product => {
+                    const option = document.createElement('option');
+                    option.value = product.product_name;
+                    option.dataset.productId = product.product_id;
+                    option.dataset.quantity = product.quantity;
+                    option.dataset.available = product.available;
+                    options.appendChild(option);
+                });
+            })
+            .catch(error => console.error('Error searching products:', error));
+    }, 200);
 });
 
 // Search and filter functionality for orders
@@ -9,62 +9,72 @@ function formatTimeAgo(dateString) {
     return `${Math.floor(diff / 86400)}d ago`;
 }
 
+function renderNotificationBadge(count) {
+    const badge = document.getElementById('notificationBadge');
+    if (count > 0) {
+        badge.textContent = count;
+        badge.style.display = 'block';
+    } else {
+        badge.style.display = 'none';
+    }
+}
+
 function updateNotificationBadge() {
     fetch('/api/notifications/unread-count')
         .then(res => res.json())
-        .then(data => {
-            const badge = document.getElementById('notificationBadge');
-            if (data.count > 0) {
-                badge.textContent = data.count;
-                badge.style.display = 'block';
-            } else {
-                badge.style.display = 'none';
-            }
-        })
+        .then(data => renderNotificationBadge(data.count))
         .catch(error => console.error('Error fetching unread count:', error));
 }
 
+// True once the dropdown's list may be out of date; opening it then refetches
+let notificationListStale = true;
+
+function renderNotificationList(notifications) {
+    const container = document.getElementById('notificationList');
+    container.innerHTML = '';
+
+    if (notifications.length === 0) {
+        container.innerHTML = '<div class="px-3 py-2 text-muted">No notifications</div>';
+        return;
+    }
+
+    notifications.forEach(notif => {
+        const item = document.createElement('div');
+        item.className = `dropdown-item ${notif.is_read ? '' : 'fw-bold'}`;
+        item.style.cursor = 'pointer';
+        item.innerHTML = `
+            <div class="d-flex justify-content-between">
+                <span>${notif.message}</span>
+                <small class="text-muted">${formatTimeAgo(notif.created_at)}</small>
+            </div>
+        `;
+
+        item.addEventListener('click', (e) => {
+            e.preventDefault();
+            const form = document.createElement('form');
+            form.method = 'POST';
+            form.action = `/notifications/mark-read/${notif.notification_id}`;
+
+            const csrfInput = document.createElement('input');
+            csrfInput.type = 'hidden';
+            csrfInput.name = 'csrf_token';
+            csrfInput.value = document.getElementById('csrf-token').textContent;
+            form.appendChild(csrfInput);
+
+            document.body.appendChild(form);
+            form.submit();
+        });
+
+        container.appendChild(item);
+    });
+}
+
 function loadNotificationList() {
     fetch('/api/notifications?limit=5')
         .then(res => res.json())
         .then(notifications => {
-            const container = document.getElementById('notificationList');
-            container.innerHTML = '';
-
-            if (notifications.length === 0) {
-                container.innerHTML = '<div class="px-3 py-2 text-muted">No notifications</div>';
-                return;
-            }
-
-            notifications.forEach(notif => {
-                const item = document.createElement('div');
-                item.className = `dropdown-item ${notif.is_read ? '' : 'fw-bold'}`;
-                item.style.cursor = 'pointer';
-                item.innerHTML = `
-                    <div class="d-flex justify-content-between">
-                        <span>${notif.message}</span>
-                        <small class="text-muted">${formatTimeAgo(notif.created_at)}</small>
-                    </div>
-                `;
-
-                item.addEventListener('click', (e) => {
-                    e.preventDefault();
-                    const form = document.createElement('form');
-                    form.method = 'POST';
-                    form.action = `/notifications/mark-read/${notif.notification_id}`;
-
-                    const csrfInput = document.createElement('input');
-                    csrfInput.type = 'hidden';
-                    csrfInput.name = 'csrf_token';
-                    csrfInput.value = document.getElementById('csrf-token').textContent;
-                    form.appendChild(csrfInput);
-
-                    document.body.appendChild(form);
-                    form.submit();
-                });
-
-                container.appendChild(item);
-            });
+            renderNotificationList(notifications);
+            notificationListStale = false;
         })
         .catch(error => {
             console.error('Error loading notifications:', error);
@@ -72,13 +82,62 @@ function loadNotificationList() {
         });
 }
 
+function pollNotifications() {
+    setInterval(() => {
+        updateNotificationBadge();
+        notificationListStale = true;
+    }, 30000);
+}
+
+function subscribeToNotifications() {
+    // Server-Sent Events push a message whenever a notification is created or
+    // read, so the badge only refreshes when something actually changed.
+    const source = new EventSource('/api/notifications/stream');
+    source.addEventListener('error', () => {
+        // The browser retries dropped connections itself but gives up on a
+        // refused one, e.g. a 503 when the server has too many streams open
+        if (source.readyState === EventSource.CLOSED) {
+            pollNotifications();
+        }
+    });
+    const refresh = () => {
+        updateNotificationBadge();
+        notificationListStale = true;
+        const dropdown = document.getElementById('notificationDropdown');
+        if (dropdown.classList.contains('show')) {
+            loadNotificationList();
+        }
+    };
+    source.addEventListener('created', refresh);
+    source.addEventListener('read', refresh);
+    source.addEventListener('resync', refresh);
+    return source;
+}
+
 document.addEventListener('DOMContentLoaded', function () {
     if (document.getElementById('notificationBadge') && document.getElementById('notificationList')) {
-        updateNotificationBadge();
-        loadNotificationList();
+        // base.html inlines the first unread count and list when it can
+        const initial = document.getElementById('notificationData');
+        if (initial) {
+            const summary = JSON.parse(initial.textContent);
+            renderNotificationBadge(summary.unread_count);
+            renderNotificationList(summary.notifications);
+            notificationListStale = false;
+        } else {
+            updateNotificationBadge();
+            loadNotificationList();
+        }
 
-        setInterval(updateNotificationBadge, 30000);
+        if (window.EventSource) {
+            subscribeToNotifications();
+        } else {
+            pollNotifications();
+        }
 
-        document.getElementById('notificationDropdown').addEventListener('shown.bs.dropdown', loadNotificationList);
+        document.getElementById('notificationDropdown').addEventListener('shown.bs.dropdown', () => {
+            if (notificationListStale) {
+                loadNotificationList();
+            }
+        });
     }
 });
@@ -0,0 +1,64 @@
+import os
+import sys
+import uuid
+
+import psycopg2
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def db():
+    """Autocommit connection to the database configured by IMS_DB_*.
+
+    These tests commit rows, so they only run with IMS_TEST_DB=1, against a
+    scratch database loaded from ims_sql.sql.
+    """
+    if os.environ.get('IMS_TEST_DB') != '1':
+        pytest.skip('set IMS_TEST_DB=1 to run the database tests')
+    import database
+
+    conn = psycopg2.connect(**database.DB_CONFIG)
+    conn.autocommit = True
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def unique():
+    """Prefix that keeps names created by one test apart from every other run."""
+    return f'test-{uuid.uuid4().hex[:8]}'
+
+
+@pytest.fixture
+def make_product(db, unique):
+    """Factory for products of a supplier of their own, added by the seeded admin."""
+    cur = db.cursor()
+    cur.execute("INSERT INTO suppliers (supplier_name, contact_info) VALUES (%s, '') "
+                "RETURNING supplier_id", (f'{unique} Supplies',))
+    supplier_id = cur.fetchone()[0]
+    names = iter(range(1000))
+
+    def make(quantity=10, price='5.00', min_stocks=0):
+        cur.execute("""
+            INSERT INTO products (product_name, category, price, quantity, supplier_id,
+                                  min_stocks, added_by)
+            VALUES (%s, 'Test', %s, %s, %s, %s, 1)
+            RETURNING product_id
+        """, (f'{unique}-{next(names)}', price, quantity, supplier_id, min_stocks))
+        return cur.fetchone()[0]
+
+    make.supplier_id = supplier_id
+    return make
+
+
+@pytest.fixture
+def stock(db):
+    """Reads (quantity, reserved_quantity) of a product."""
+    def read(product_id):
+        cur = db.cursor()
+        cur.execute("SELECT quantity, reserved_quantity FROM products WHERE product_id = %s",
+                    (product_id,))
+        return cur.fetchone()
+    return read
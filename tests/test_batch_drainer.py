@@ -0,0 +1,63 @@
+import threading
+
+from batch_drainer import BatchDrainer
+
+
+class Queue:
+    """Stands in for a database queue: drain() takes up to batch_size rows."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def drain(self, batch_size):
+        self.calls.append(batch_size)
+        taken = min(self.rows, batch_size)
+        self.rows -= taken
+        return taken
+
+
+def test_nothing_runs_until_started():
+    queue = Queue(10)
+    drainer = BatchDrainer(queue.drain, 'test', interval=0.01, batch_size=4)
+    assert queue.calls == []
+    assert not drainer.stats()['running']
+
+
+def test_drain_all_repeats_full_batches():
+    queue = Queue(10)
+    drainer = BatchDrainer(queue.drain, 'test', batch_size=4)
+    assert drainer.drain_all() == 10
+    assert queue.calls == [4, 4, 4]
+    stats = drainer.stats()
+    assert stats['rows_drained'] == 10
+    assert stats['batches'] == 3
+
+
+def test_thread_drains_and_survives_failures():
+    drained = threading.Event()
+    calls = []
+
+    def drain(batch_size):
+        calls.append(batch_size)
+        if len(calls) == 1:
+            raise RuntimeError('database went away')
+        drained.set()
+        return 0
+
+    drainer = BatchDrainer(drain, 'test', interval=0.01)
+    drainer.start()
+    try:
+        assert drained.wait(5)
+    finally:
+        drainer.stop()
+    stats = drainer.stats()
+    assert stats['failures'] == 1
+    assert not stats['running']
+
+
+def test_stop_can_drain_the_rest():
+    queue = Queue(7)
+    drainer = BatchDrainer(queue.drain, 'test', interval=60, batch_size=5)
+    drainer.stop(drain=True)
+    assert queue.rows == 0
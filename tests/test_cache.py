@@ -0,0 +1,104 @@
+import pytest
+
+import cache
+from cache import FileGeneration, TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time_ns(self):
+        return int(self.now * 1e9)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, 'time', clock)
+    return clock
+
+
+def test_entries_expire_after_ttl(clock):
+    c = TTLCache(ttl=10)
+    c.set('a', 1)
+    clock.now += 9
+    assert c.get('a') == 1
+    clock.now += 2
+    assert c.get('a') is None
+    assert (c.hits, c.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    c = TTLCache(maxsize=2)
+    c.set('a', 1)
+    c.set('b', 2)
+    c.get('a')
+    c.set('c', 3)
+    assert c.get('b') is None
+    assert c.get('a') == 1
+    assert c.get('c') == 3
+    assert c.evictions == 1
+
+
+def test_get_or_load_caches_values_but_not_none():
+    c = TTLCache()
+    calls = []
+
+    def load(value):
+        calls.append(value)
+        return value
+
+    assert c.get_or_load('k', lambda: load(1)) == 1
+    assert c.get_or_load('k', lambda: load(2)) == 1
+    assert c.get_or_load('missing', lambda: load(None)) is None
+    assert c.get_or_load('missing', lambda: load(None)) is None
+    assert calls == [1, None, None]
+
+
+def test_load_overlapping_a_clear_is_not_stored():
+    c = TTLCache()
+
+    def load():
+        c.clear()  # e.g. another thread saw the data change meanwhile
+        return 'stale'
+
+    assert c.get_or_load('k', load) == 'stale'
+    assert c.get('k') is None
+
+
+def test_invalidate_one_key_or_everything():
+    c = TTLCache()
+    c.set('a', 1)
+    c.set('b', 2)
+    c.invalidate('a')
+    assert c.get('a') is None and c.get('b') == 2
+    c.invalidate()
+    assert c.get('b') is None
+
+
+def test_generation_invalidates_other_processes(tmp_path):
+    path = str(tmp_path / 'shared.gen')
+    # Two caches sharing a generation file stand in for two worker processes
+    here = TTLCache(generation=FileGeneration(path))
+    there = TTLCache(generation=FileGeneration(path))
+    here.set('k', 'old')
+    there.set('k', 'old')
+
+    here.invalidate('k')
+    assert there.get('k') is None
+
+    there.set('k', 'new')
+    assert there.get('k') == 'new'
+
+
+def test_clear_does_not_touch_the_generation(tmp_path):
+    path = str(tmp_path / 'shared.gen')
+    here = TTLCache(generation=FileGeneration(path))
+    there = TTLCache(generation=FileGeneration(path))
+    there.set('k', 1)
+    here.clear()
+    assert there.get('k') == 1
@@ -0,0 +1,112 @@
+from datetime import datetime, timezone
+
+import pytest
+from flask import flash, jsonify
+
+import app as ims
+
+calls = []
+
+
+# Registered at import, before any test request reaches the app
+@ims.app.route('/_test/conditional')
+@ims.conditional_get('products', page=False)
+def conditional_view():
+    calls.append('view')
+    return jsonify(calls=len(calls))
+
+
+@ims.app.route('/_test/conditional-flash')
+@ims.conditional_get('products', page=False)
+def conditional_flash_view():
+    flash('Saved', 'success')
+    return jsonify(ok=True)
+
+
+@ims.app.route('/_test/conditional-missing')
+@ims.conditional_get('products', page=False)
+def conditional_missing_view():
+    return jsonify(error='not found'), 404
+
+
+@pytest.fixture
+def versions(monkeypatch):
+    current = {
+        'products': (1, datetime(2026, 1, 1, tzinfo=timezone.utc)),
+        'suppliers': (7, datetime(2026, 1, 1, tzinfo=timezone.utc)),
+    }
+
+    def get_table_versions(tables):
+        return {t: current[t] for t in tables if t in current}
+
+    monkeypatch.setattr(ims, 'get_table_versions', get_table_versions)
+    calls.clear()
+    return current
+
+
+@pytest.fixture
+def client():
+    ims.app.config['TESTING'] = True
+    return ims.app.test_client()
+
+
+def test_first_get_gets_validators(client, versions):
+    response = client.get('/_test/conditional')
+    assert response.status_code == 200
+    assert response.headers['ETag'].startswith('W/"')
+    assert response.headers['Last-Modified'] == 'Thu, 01 Jan 2026 00:00:00 GMT'
+    assert response.cache_control.private and response.cache_control.no_cache
+
+
+def test_repeat_with_etag_is_answered_without_running_the_view(client, versions):
+    etag = client.get('/_test/conditional').headers['ETag']
+    response = client.get('/_test/conditional', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert calls == ['view']
+
+
+def test_if_modified_since_is_honoured_for_json_views(client, versions):
+    last_modified = client.get('/_test/conditional').headers['Last-Modified']
+    response = client.get('/_test/conditional', headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 304
+
+
+def test_new_version_of_a_watched_table_changes_the_etag(client, versions):
+    etag = client.get('/_test/conditional').headers['ETag']
+    versions['products'] = (2, versions['products'][1])
+    response = client.get('/_test/conditional', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_other_tables_do_not_matter(client, versions):
+    etag = client.get('/_test/conditional').headers['ETag']
+    versions['suppliers'] = (8, versions['suppliers'][1])
+    response = client.get('/_test/conditional', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+def test_etag_depends_on_the_url(client, versions):
+    first = client.get('/_test/conditional').headers['ETag']
+    second = client.get('/_test/conditional?page=2').headers['ETag']
+    assert first != second
+
+
+def test_flashing_or_failing_responses_get_no_validator(client, versions):
+    assert 'ETag' not in client.get('/_test/conditional-flash').headers
+    missing = client.get('/_test/conditional-missing')
+    assert missing.status_code == 404
+    assert 'ETag' not in missing.headers
+
+
+def test_version_lookup_failure_serves_the_view(client, monkeypatch):
+    def broken(tables):
+        raise RuntimeError('database unavailable')
+
+    monkeypatch.setattr(ims, 'get_table_versions', broken)
+    calls.clear()
+    response = client.get('/_test/conditional')
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
+    assert calls == ['view']
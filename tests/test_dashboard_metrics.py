@@ -0,0 +1,123 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import dashboard_metrics
+from dashboard_metrics import MetricsSnapshot
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(dashboard_metrics, 'time', SimpleNamespace(monotonic=clock, time=time.time))
+    return clock
+
+
+class Loader:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return {'product_count': self.calls}
+
+
+def inline_only(load, **kwargs):
+    """A snapshot whose refresher is stopped, so only get() refreshes it."""
+    snapshot = MetricsSnapshot(load, **kwargs)
+    snapshot.stop()
+    return snapshot
+
+
+def test_first_get_loads_inline(clock):
+    load = Loader()
+    snapshot = inline_only(load, max_age=30)
+    result = snapshot.get()
+    assert result['product_count'] == 1
+    assert result['age'] == 0
+    assert 'generated_at' in result
+    assert snapshot.stats()['inline_refreshes'] == 1
+
+
+def test_fresh_snapshot_is_served_from_memory(clock):
+    load = Loader()
+    snapshot = inline_only(load, max_age=30)
+    snapshot.get()
+    clock.now += 29
+    result = snapshot.get()
+    assert (result['product_count'], result['age']) == (1, 29)
+    assert load.calls == 1
+
+
+def test_stale_snapshot_is_refreshed_by_the_request(clock):
+    load = Loader()
+    snapshot = inline_only(load, max_age=30)
+    snapshot.get()
+    clock.now += 31
+    assert snapshot.get()['product_count'] == 2
+    assert snapshot.stats()['inline_refreshes'] == 2
+
+
+def test_stale_snapshot_is_served_while_another_refresh_runs(clock):
+    release = threading.Event()
+    started = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        if len(calls) == 2:
+            started.set()
+            release.wait(5)
+        return {'product_count': len(calls)}
+
+    snapshot = inline_only(load, max_age=30)
+    snapshot.get()
+    clock.now += 31
+    slow = threading.Thread(target=snapshot.get)
+    slow.start()
+    try:
+        assert started.wait(5)
+        result = snapshot.get()
+        assert (result['product_count'], result['age']) == (1, 31)
+    finally:
+        release.set()
+        slow.join(5)
+    assert snapshot.get()['product_count'] == 2
+
+
+def test_callers_get_a_copy(clock):
+    snapshot = inline_only(Loader(), max_age=30)
+    snapshot.get()['product_count'] = 99
+    assert snapshot.get()['product_count'] == 1
+
+
+def test_refresher_thread_survives_failures():
+    refreshed = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError('database went away')
+        refreshed.set()
+        return {'product_count': 1}
+
+    snapshot = MetricsSnapshot(load, max_age=30, refresh_interval=0.01)
+    snapshot.start()
+    try:
+        assert refreshed.wait(5)
+    finally:
+        snapshot.stop()
+    stats = snapshot.stats()
+    assert stats['failures'] == 1
+    assert stats['refreshes'] >= 1
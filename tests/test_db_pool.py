@@ -0,0 +1,212 @@
+import threading
+
+import pytest
+from psycopg2 import extensions
+
+import db_pool
+from db_pool import ConnectionPool, PoolError, PoolExhausted
+
+
+class FakeConnection:
+    """Just enough of a psycopg2 connection for ConnectionPool."""
+
+    def __init__(self):
+        self.closed = 0
+        self.rollbacks = 0
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        self.cursor_factory = None
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        if self.conn.closed:
+            raise RuntimeError('connection is closed')
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(db_pool, 'time', clock)
+    return clock
+
+
+def make_pool(**kwargs):
+    created = []
+
+    def connect():
+        conn = FakeConnection()
+        created.append(conn)
+        return conn
+
+    options = dict(minconn=0, maxconn=2, timeout=0.05)
+    options.update(kwargs)
+    return ConnectionPool(connect, **options), created
+
+
+def test_checkout_reuses_released_connection():
+    pool, created = make_pool()
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert len(created) == 1
+    assert pool.stats()['checkouts'] == 2
+
+
+def test_rolls_back_open_transaction_on_release():
+    pool, _ = make_pool()
+    conn = pool.getconn()
+    conn.status = extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+    assert conn.rollbacks == 1
+    assert pool.stats()['idle'] == 1
+
+
+def test_exhaustion_times_out():
+    pool, _ = make_pool(maxconn=1)
+    pool.getconn()
+    with pytest.raises(PoolExhausted):
+        pool.getconn()
+    stats = pool.stats()
+    assert stats['exhausted'] == 1
+    assert stats['waits'] == 1
+    assert stats['in_use'] == 1
+
+
+def test_waiter_gets_connection_released_by_another_thread():
+    pool, _ = make_pool(maxconn=1, timeout=5)
+    conn = pool.getconn()
+    timer = threading.Timer(0.05, pool.putconn, (conn,))
+    timer.start()
+    try:
+        assert pool.getconn() is conn
+    finally:
+        timer.join()
+    assert pool.stats()['waits'] == 1
+
+
+def test_idle_connections_are_reaped_down_to_minconn(clock):
+    pool, created = make_pool(minconn=1, maxconn=3, max_idle=60)
+    first, second = pool.getconn(), pool.getconn()
+    pool.putconn(first)
+    pool.putconn(second)
+    assert pool.stats()['idle'] == 2
+
+    clock.now += 61
+    pool.reap_idle()
+    stats = pool.stats()
+    assert stats['idle'] == 1
+    assert stats['reaped'] == 1
+    assert sum(conn.closed for conn in created) == 1
+
+
+def test_stale_idle_connection_is_health_checked(clock):
+    pool, created = make_pool(health_check_after=30, max_idle=600)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.closed = 1  # server went away while it sat idle
+
+    clock.now += 31
+    replacement = pool.getconn()
+    assert replacement is not conn
+    assert len(created) == 2
+    assert pool.stats()['health_check_failures'] == 1
+
+
+def test_double_close_returns_connection_once():
+    pool, _ = make_pool()
+    wrapped = pool.connection()
+    wrapped.close()
+    wrapped.close()
+    stats = pool.stats()
+    assert stats['in_use'] == 0
+    assert stats['idle'] == 1
+
+
+def test_putconn_of_foreign_connection_is_ignored():
+    pool, _ = make_pool()
+    pool.getconn()
+    stranger = FakeConnection()
+    pool.putconn(stranger)
+    stats = pool.stats()
+    assert stats['in_use'] == 1
+    assert stats['idle'] == 0
+    assert not stranger.closed
+
+
+def test_putconn_twice_does_not_corrupt_counts():
+    pool, _ = make_pool()
+    conn = pool.getconn()
+    pool.putconn(conn)
+    pool.putconn(conn)
+    stats = pool.stats()
+    assert stats['in_use'] == 0
+    assert stats['idle'] == 1
+
+
+def test_discarded_connection_is_closed():
+    pool, _ = make_pool()
+    conn = pool.getconn()
+    pool.putconn(conn, discard=True)
+    assert conn.closed
+    assert pool.stats()['idle'] == 0
+
+
+def test_pool_starts_over_after_fork(monkeypatch):
+    pool, created = make_pool(maxconn=2)
+    idle = pool.getconn()
+    busy = pool.getconn()
+    pool.putconn(idle)
+
+    monkeypatch.setattr(db_pool.os, 'getpid', lambda: -1)  # now "in the child"
+    fresh = pool.getconn()
+    assert fresh not in (idle, busy)
+    # The parent's connection comes back in the child: neither reused nor closed
+    pool.putconn(busy)
+    stats = pool.stats()
+    assert stats['in_use'] == 1
+    assert stats['idle'] == 0
+    assert not idle.closed and not busy.closed
+    assert len(created) == 3
+
+
+def test_closed_pool_refuses_checkouts():
+    pool, created = make_pool(minconn=1)
+    pool.closeall()
+    assert created[0].closed
+    with pytest.raises(PoolError):
+        pool.getconn()
+
+
+def test_invalid_bounds():
+    with pytest.raises(ValueError):
+        make_pool(minconn=3, maxconn=2)
@@ -0,0 +1,73 @@
+import pytest
+
+
+@pytest.fixture
+def managers(db):
+    cur = db.cursor()
+    cur.execute("SELECT COUNT(*) FROM users WHERE role = 'InventoryManager' AND is_active")
+    count = cur.fetchone()[0]
+    assert count, 'the seed data has an active InventoryManager'
+    return count
+
+
+def set_quantity(db, product, quantity):
+    db.cursor().execute("UPDATE products SET quantity = %s WHERE product_id = %s",
+                        (quantity, product))
+
+
+def alerts(db, product, unread_only=False):
+    cur = db.cursor()
+    cur.execute("""
+        SELECT COUNT(*) FROM notifications
+        WHERE notification_type = 'LowStock' AND related_entity_id = %s
+        AND (NOT %s OR is_read = FALSE)
+    """, (product, unread_only))
+    return cur.fetchone()[0]
+
+
+def test_crossing_below_the_minimum_alerts_every_manager(db, make_product, managers):
+    product = make_product(quantity=10, min_stocks=5)
+    set_quantity(db, product, 6)
+    assert alerts(db, product) == 0
+    set_quantity(db, product, 4)
+    assert alerts(db, product) == managers
+
+
+def test_staying_low_does_not_alert_again(db, make_product, managers):
+    product = make_product(quantity=10, min_stocks=5)
+    set_quantity(db, product, 4)
+    set_quantity(db, product, 2)
+    assert alerts(db, product) == managers
+
+
+def test_one_unread_alert_per_product_and_manager(db, make_product, managers):
+    product = make_product(quantity=10, min_stocks=5)
+    set_quantity(db, product, 4)
+    set_quantity(db, product, 8)
+    set_quantity(db, product, 4)
+    assert alerts(db, product) == managers
+
+    db.cursor().execute("UPDATE notifications SET is_read = TRUE "
+                        "WHERE notification_type = 'LowStock' AND related_entity_id = %s",
+                        (product,))
+    set_quantity(db, product, 8)
+    set_quantity(db, product, 4)
+    assert alerts(db, product, unread_only=True) == managers
+    assert alerts(db, product) == 2 * managers
+
+
+def test_deleted_products_are_not_alerted(db, make_product):
+    product = make_product(quantity=10, min_stocks=5)
+    db.cursor().execute("UPDATE products SET quantity = 1, is_deleted = TRUE "
+                        "WHERE product_id = %s", (product,))
+    assert alerts(db, product) == 0
+
+
+def test_low_stock_view_lists_products_without_a_supplier(db, make_product):
+    product = make_product(quantity=10, min_stocks=5)
+    cur = db.cursor()
+    cur.execute("UPDATE products SET quantity = 1, supplier_id = NULL WHERE product_id = %s",
+                (product,))
+    cur.execute("SELECT quantity, supplier_name FROM vw_low_stock WHERE product_id = %s",
+                (product,))
+    assert cur.fetchone() == (1, None)
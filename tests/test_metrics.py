@@ -0,0 +1,105 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from metrics import MetricsRegistry
+
+
+def define(registry):
+    return (
+        registry.counter('ims_requests_total', 'Requests', ['route']),
+        registry.gauge('ims_in_flight', 'In-flight requests'),
+        registry.gauge('ims_wait_max', 'Worst wait', aggregate='max'),
+        registry.histogram('ims_latency_seconds', 'Latency', buckets=(0.1, 1.0)),
+    )
+
+
+def write_process(directory, pid, requests, in_flight, wait, latency):
+    """Write the metrics file another worker process would have flushed."""
+    registry = MetricsRegistry()
+    counter, gauge, wait_max, histogram = define(registry)
+    counter.inc(requests, route='/')
+    gauge.set(in_flight)
+    wait_max.set(wait)
+    histogram.observe(latency)
+    with open(os.path.join(directory, f'metrics-{pid}.json'), 'w') as f:
+        json.dump({'pid': pid, 'metrics': registry._state()}, f)
+
+
+@pytest.fixture
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = MetricsRegistry(directory=str(tmp_path), flush_interval=3600)
+    yield registry
+    registry.stop()
+
+
+def test_processes_are_added_up(registry, tmp_path):
+    counter, gauge, wait_max, histogram = define(registry)
+    counter.inc(2, route='/')
+    gauge.set(3)
+    wait_max.set(0.5)
+    histogram.observe(0.05)
+    write_process(str(tmp_path), os.getppid(), requests=5, in_flight=4, wait=2.0, latency=0.5)
+
+    text = registry.render()
+    assert 'ims_requests_total{route="/"} 7' in text
+    assert 'ims_in_flight 7' in text
+    assert 'ims_wait_max 2.0' in text
+    assert 'ims_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'ims_latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'ims_latency_seconds_count 2' in text
+
+
+def test_gauges_of_exited_processes_are_dropped(registry, tmp_path, dead_pid):
+    counter, gauge, _, _ = define(registry)
+    counter.inc(route='/')
+    gauge.set(1)
+    write_process(str(tmp_path), dead_pid, requests=10, in_flight=8, wait=9.0, latency=0.5)
+
+    text = registry.render()
+    assert 'ims_requests_total{route="/"} 11' in text
+    assert 'ims_in_flight 1' in text
+    assert 'ims_latency_seconds_count 1' in text
+
+
+def test_unreadable_files_are_skipped(registry, tmp_path):
+    counter = define(registry)[0]
+    counter.inc(route='/')
+    (tmp_path / 'metrics-1.json').write_text('{"pid": 1, "metr')
+    assert 'ims_requests_total{route="/"} 1' in registry.render()
+
+
+def test_single_process_exposition_format():
+    registry = MetricsRegistry()
+    counter, _, _, histogram = define(registry)
+    counter.inc(route='/a"b')
+    histogram.observe(5)
+    text = registry.render()
+    assert '# TYPE ims_requests_total counter' in text
+    assert 'ims_requests_total{route="/a\\"b"} 1' in text
+    assert 'ims_latency_seconds_bucket{le="+Inf"} 1' in text
+    assert 'ims_latency_seconds_sum 5' in text
+
+
+def test_collectors_run_before_rendering():
+    registry = MetricsRegistry()
+    gauge = registry.gauge('ims_pool_size', 'Pool size')
+    registry.add_collector(lambda: gauge.set(4))
+    assert 'ims_pool_size 4' in registry.render()
+
+
+def test_names_are_registered_once():
+    registry = MetricsRegistry()
+    registry.counter('ims_x_total', 'X')
+    with pytest.raises(ValueError):
+        registry.gauge('ims_x_total', 'X')
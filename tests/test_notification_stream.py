@@ -0,0 +1,82 @@
+import json
+import queue
+import threading
+
+import pytest
+
+from notification_stream import NotificationBroker, TooManySubscribers, sse_stream
+
+
+@pytest.fixture
+def broker():
+    # The listener thread blocks in connect() until the test is over, so only
+    # events published by the test reach the queues
+    released = threading.Event()
+
+    def connect():
+        released.wait()
+        raise ConnectionError('test finished')
+
+    broker = NotificationBroker(connect, queue_size=3, max_subscribers=2)
+    yield broker
+    broker.stop()
+    released.set()
+
+
+def test_events_reach_only_the_addressed_user(broker):
+    alice = broker.subscribe(1)
+    bob = broker.subscribe(2)
+    broker.publish({'event': 'notification', 'user_id': 1})
+    assert alice.get_nowait()['user_id'] == 1
+    assert bob.empty()
+
+
+def test_event_without_user_is_broadcast(broker):
+    alice = broker.subscribe(1)
+    bob = broker.subscribe(2)
+    broker.publish({'event': 'resync', 'user_id': None})
+    assert alice.get_nowait()['event'] == 'resync'
+    assert bob.get_nowait()['event'] == 'resync'
+    assert broker.stats()['events_delivered'] == 2
+
+
+def test_streams_over_the_cap_are_refused(broker):
+    first = broker.subscribe(1)
+    broker.subscribe(1)
+    with pytest.raises(TooManySubscribers):
+        broker.subscribe(2)
+    assert broker.stats()['subscribers_rejected'] == 1
+
+    broker.unsubscribe(1, first)
+    broker.subscribe(2)
+    assert broker.subscriber_count() == 2
+
+
+def test_unsubscribe_twice_frees_one_slot(broker):
+    q = broker.subscribe(1)
+    broker.unsubscribe(1, q)
+    broker.unsubscribe(1, q)
+    assert broker.subscriber_count() == 0
+
+
+def test_full_queue_is_replaced_by_a_resync(broker):
+    q = broker.subscribe(1)
+    for n in range(4):
+        broker.publish({'event': 'notification', 'user_id': 1, 'n': n})
+    assert q.get_nowait() == {'event': 'resync', 'user_id': 1}
+    assert q.empty()
+    assert broker.stats()['events_dropped'] == 3
+
+
+def test_sse_stream_formats_events_and_keepalives():
+    q = queue.Queue()
+    stream = sse_stream(q, heartbeat=0.01)
+    assert next(stream) == 'retry: 5000\n\n'
+    assert next(stream) == ': keepalive\n\n'
+
+    event = {'event': 'notification', 'user_id': 1, 'count': 3}
+    q.put(event)
+    frame = next(stream)
+    assert frame.startswith('event: notification\ndata: ')
+    assert json.loads(frame.split('data: ', 1)[1]) == event
+    assert frame.endswith('\n\n')
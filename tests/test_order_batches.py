@@ -0,0 +1,63 @@
+from database import create_orders_batch, process_orders_batch
+
+
+def order_status(db, order_id):
+    cur = db.cursor()
+    cur.execute("SELECT status FROM orders WHERE order_id = %s", (order_id,))
+    return cur.fetchone()[0]
+
+
+def test_each_item_reserves_from_what_earlier_items_left(make_product, stock):
+    product = make_product(quantity=10)
+    results = create_orders_batch([
+        {'product_id': product, 'quantity': 6},
+        {'product_id': product, 'quantity': 6},
+        {'product_id': product, 'quantity': 4, 'notes': 'rest'},
+    ], added_by=1)
+    assert [r['item_index'] for r in results] == [0, 1, 2]
+    assert results[0]['status'] == 'Pending' and results[0]['error'] is None
+    assert results[1]['error'] == 'Insufficient stock (Available: 4)'
+    assert results[2]['error'] is None
+    assert stock(product) == (10, 10)
+
+
+def test_bad_items_do_not_fail_the_batch(db, make_product):
+    product = make_product(quantity=5)
+    results = create_orders_batch([
+        {'product_id': product, 'quantity': 0},
+        {'product_id': -1, 'quantity': 1},
+        {'product_id': product, 'quantity': 2},
+    ], added_by=1)
+    assert [r['error'] for r in results] == [
+        'Quantity must be positive', 'Product not found', None]
+    assert order_status(db, results[2]['order_id']) == 'Pending'
+
+
+def test_processing_sells_cancels_and_reports_per_item(make_product, stock):
+    product = make_product(quantity=10)
+    created = create_orders_batch([{'product_id': product, 'quantity': 3},
+                                   {'product_id': product, 'quantity': 2}], added_by=1)
+    sold, cancelled = (r['order_id'] for r in created)
+
+    results = process_orders_batch([
+        {'order_id': sold, 'status': 'Approved'},
+        {'order_id': cancelled, 'status': 'Cancelled'},
+        {'order_id': -1, 'status': 'Approved'},
+    ], processed_by=1)
+    assert [(r['old_status'], r['new_status']) for r in results[:2]] == [
+        ('Pending', 'Approved'), ('Pending', 'Cancelled')]
+    assert results[2]['error'] is not None
+    # The sale took 3 from stock; both reservations were released
+    assert stock(product) == (7, 0)
+
+
+def test_cancelling_a_sold_order_returns_its_stock(db, make_product, stock):
+    product = make_product(quantity=10)
+    order = create_orders_batch([{'product_id': product, 'quantity': 4}], added_by=1)[0]
+    process_orders_batch([{'order_id': order['order_id'], 'status': 'Approved'}], processed_by=1)
+    process_orders_batch([{'order_id': order['order_id'], 'status': 'Cancelled'}], processed_by=1)
+    assert stock(product) == (10, 0)
+    cur = db.cursor()
+    cur.execute("SELECT transaction_type FROM transactions WHERE reference_id = %s "
+                "ORDER BY transaction_id", (order['order_id'],))
+    assert [row[0] for row in cur.fetchall()] == ['Sale', 'Return']
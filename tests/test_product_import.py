@@ -0,0 +1,136 @@
+import io
+import json
+from decimal import Decimal
+
+import pytest
+
+from product_import import import_products, read_rows, validate_row
+
+
+def row(**values):
+    base = {'product_name': 'Widget', 'category': 'Tools', 'price': '9.99',
+            'quantity': '10', 'supplier_id': '1'}
+    base.update(values)
+    return base
+
+
+def test_valid_row_becomes_a_staging_tuple():
+    assert validate_row(row(price='9.999')) == (
+        'Widget', 'Tools', Decimal('10.00'), 10, 1, None, 5)
+
+
+def test_supplier_name_may_replace_the_id():
+    record = validate_row(row(supplier_id='', supplier_name=' Acme '))
+    assert record[4:6] == (None, 'Acme')
+
+
+@pytest.mark.parametrize('price', ['NaN', 'nan', 'Infinity', '-inf', True, False])
+def test_non_finite_and_boolean_prices_are_rejected(price):
+    with pytest.raises(ValueError, match='price must be a number'):
+        validate_row(row(price=price))
+
+
+def test_nul_character_is_rejected():
+    with pytest.raises(ValueError, match='NUL'):
+        validate_row(row(product_name='Wid\x00get'))
+
+
+@pytest.mark.parametrize('values, message', [
+    ({'quantity': str(2 ** 31)}, 'quantity must be between'),
+    ({'quantity': '-1'}, 'quantity must be between'),
+    ({'price': '99999999.995'}, 'price must be'),
+    ({'price': '1000000', 'quantity': '100'}, r'price \* quantity'),
+    ({'supplier_id': '', 'supplier_name': ''}, 'supplier_id or supplier_name'),
+    ({'category': '  '}, 'category is required'),
+    ({'product_name': 'x' * 101}, 'longer than 100'),
+])
+def test_values_the_columns_cannot_hold_are_rejected(values, message):
+    with pytest.raises(ValueError, match=message):
+        validate_row(row(**values))
+
+
+def test_row_that_is_not_an_object_is_rejected():
+    with pytest.raises(ValueError, match='object'):
+        validate_row(['Widget'])
+
+
+def test_csv_rows_are_numbered_after_the_header():
+    stream = io.StringIO('product_name,category\nA,x\nB,y\n')
+    assert [(n, r['product_name']) for n, r in read_rows(stream, 'csv')] == [(2, 'A'), (3, 'B')]
+
+
+def test_jsonl_skips_blank_lines_and_reports_bad_ones():
+    stream = io.StringIO('{"product_name": "A"}\n\nnot json\n')
+    rows = list(read_rows(stream, 'jsonl'))
+    assert rows[0] == (1, {'product_name': 'A'})
+    assert rows[1][0] == 3
+    with pytest.raises(ValueError, match='Invalid JSON'):
+        validate_row(rows[1][1])
+
+
+def test_json_must_be_an_array():
+    with pytest.raises(ValueError, match='array'):
+        list(read_rows(io.StringIO('{"product_name": "A"}'), 'json'))
+
+
+# The tests below run the import against PostgreSQL (see conftest.db)
+
+def run_import(rows):
+    stream = io.StringIO('\n'.join(json.dumps(r) for r in rows))
+    return import_products(stream, 'jsonl', added_by=1)
+
+
+@pytest.fixture
+def supplier(db, unique):
+    cur = db.cursor()
+    cur.execute("INSERT INTO suppliers (supplier_name, contact_info) VALUES (%s, '') "
+                "RETURNING supplier_id", (f'{unique} Supplies',))
+    return cur.fetchone()[0]
+
+
+def product(db, name):
+    cur = db.cursor()
+    cur.execute("SELECT price, quantity, is_deleted FROM products WHERE product_name = %s",
+                (name,))
+    return cur.fetchone()
+
+
+def test_supplier_is_found_by_name_ignoring_case(db, unique, supplier):
+    result = run_import([
+        row(product_name=f'{unique}-a', supplier_id=None, supplier_name=f'{unique} SUPPLIES'),
+        row(product_name=f'{unique}-b', supplier_id=None, supplier_name=f'{unique} Nobody'),
+    ])
+    assert (result['inserted'], result['rejected']) == (1, 1)
+    assert result['errors'] == [{'row': 2, 'error': f'Unknown supplier: {unique} Nobody'}]
+    assert product(db, f'{unique}-a') == (Decimal('9.99'), 10, False)
+
+
+def test_last_row_for_a_name_wins(db, unique, supplier):
+    result = run_import([
+        row(product_name=unique, price='1.00', supplier_id=supplier),
+        row(product_name=unique, price='2.00', supplier_id=supplier),
+    ])
+    assert (result['inserted'], result['rejected']) == (1, 1)
+    assert result['errors'][0]['row'] == 1
+    assert product(db, unique)[0] == Decimal('2.00')
+
+
+def test_quantity_of_an_existing_product_is_ignored(db, unique, supplier):
+    run_import([row(product_name=unique, quantity='10', supplier_id=supplier)])
+    result = run_import([row(product_name=unique, price='3.00', quantity='50',
+                             supplier_id=supplier)])
+    assert (result['updated'], result['quantity_ignored']) == (1, 1)
+    assert result['warnings'] == [
+        {'row': 1, 'warning': 'Product exists; quantity 50 ignored, stock unchanged'}]
+    assert product(db, unique) == (Decimal('3.00'), 10, False)
+
+
+def test_deleted_product_is_reported_as_restored(db, unique, supplier):
+    run_import([row(product_name=unique, quantity='10', supplier_id=supplier)])
+    db.cursor().execute("UPDATE products SET is_deleted = TRUE WHERE product_name = %s",
+                        (unique,))
+    result = run_import([row(product_name=unique, quantity='0', supplier_id=supplier)])
+    assert (result['inserted'], result['updated'], result['restored']) == (0, 0, 1)
+    assert result['warnings'] == [
+        {'row': 1, 'warning': 'Deleted product restored with its previous stock of 10'}]
+    assert product(db, unique) == (Decimal('9.99'), 10, False)
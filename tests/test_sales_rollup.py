@@ -0,0 +1,72 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+DAY = date(2026, 3, 2)
+NEXT_DAY = date(2026, 3, 3)
+
+
+@pytest.fixture
+def product(make_product):
+    return make_product(quantity=100, price='2.50')
+
+
+def record(db, product, kind, quantity, day=DAY):
+    cur = db.cursor()
+    cur.execute("""
+        INSERT INTO transactions (product_id, transaction_type, quantity, unit_price,
+                                  total_amount, performed_by, transaction_date)
+        VALUES (%s, %s, %s, 2.50, 2.50 * %s, 1, %s)
+        RETURNING transaction_id
+    """, (product, kind, quantity, quantity, day))
+    return cur.fetchone()[0]
+
+
+def rollup(db, product):
+    cur = db.cursor()
+    cur.execute("SELECT sale_date, total_quantity, total_sales FROM sales_daily_rollup "
+                "WHERE product_id = %s ORDER BY sale_date", (product,))
+    return cur.fetchall()
+
+
+def report(db, product, start, end):
+    cur = db.cursor()
+    cur.execute("SELECT total_quantity, total_sales FROM get_sales_report(%s, %s) "
+                "WHERE product_id = %s", (start, end, product))
+    return cur.fetchone()
+
+
+def test_sales_are_rolled_up_per_day(db, product):
+    record(db, product, 'Sale', 2)
+    record(db, product, 'Sale', 3)
+    record(db, product, 'Sale', 1, day=NEXT_DAY)
+    record(db, product, 'Purchase', 10)
+    assert rollup(db, product) == [(DAY, 5, Decimal('12.50')), (NEXT_DAY, 1, Decimal('2.50'))]
+
+
+def test_report_adds_up_the_days_in_range(db, product):
+    record(db, product, 'Sale', 2)
+    record(db, product, 'Sale', 4, day=NEXT_DAY)
+    assert report(db, product, DAY, NEXT_DAY) == (6, Decimal('15.00'))
+    assert report(db, product, NEXT_DAY, NEXT_DAY) == (4, Decimal('10.00'))
+    assert report(db, product, date(2026, 4, 1), date(2026, 4, 30)) == (0, Decimal('0.00'))
+
+
+def test_updates_and_deletes_move_the_totals(db, product):
+    sale = record(db, product, 'Sale', 2)
+    cur = db.cursor()
+    cur.execute("UPDATE transactions SET quantity = 5, total_amount = 12.50, "
+                "transaction_date = %s WHERE transaction_id = %s", (NEXT_DAY, sale))
+    assert rollup(db, product) == [(DAY, 0, Decimal('0.00')), (NEXT_DAY, 5, Decimal('12.50'))]
+    cur.execute("DELETE FROM transactions WHERE transaction_id = %s", (sale,))
+    assert rollup(db, product)[1] == (NEXT_DAY, 0, Decimal('0.00'))
+
+
+def test_refresh_repairs_a_date_range(db, product):
+    record(db, product, 'Sale', 2)
+    cur = db.cursor()
+    cur.execute("UPDATE sales_daily_rollup SET total_quantity = 999 WHERE product_id = %s",
+                (product,))
+    cur.execute("SELECT refresh_sales_rollup(%s, %s)", (DAY, DAY))
+    assert rollup(db, product) == [(DAY, 2, Decimal('5.00'))]
@@ -0,0 +1,80 @@
+import logging
+
+import pytest
+
+from sql_instrumentation import BUCKETS_MS, Histogram, SQLInstrumentation, fingerprint
+
+
+@pytest.mark.parametrize('sql, expected', [
+    ("SELECT * FROM users WHERE username = 'o''brien'",
+     'SELECT * FROM users WHERE username = ?'),
+    ('SELECT * FROM t1 WHERE a = 42 AND b = 1.5', 'SELECT * FROM t1 WHERE a = ? AND b = ?'),
+    ('SELECT * FROM t WHERE id = %s AND name = %(name)s',
+     'SELECT * FROM t WHERE id = ? AND name = ?'),
+    ('SELECT *\n  FROM t\n WHERE id = %s', 'SELECT * FROM t WHERE id = ?'),
+])
+def test_literals_and_parameters_become_placeholders(sql, expected):
+    assert fingerprint(sql) == expected
+
+
+def test_in_lists_of_any_length_share_a_fingerprint():
+    assert fingerprint('SELECT * FROM t WHERE id IN (%s, %s)') == \
+        fingerprint('SELECT * FROM t WHERE id IN (1, 2, 3, 4)') == \
+        'SELECT * FROM t WHERE id IN (?, ...)'
+
+
+def test_multi_row_values_share_a_fingerprint():
+    two = fingerprint('INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)')
+    five = fingerprint('INSERT INTO t (a, b) VALUES ' + ', '.join(['(%s, %s)'] * 5))
+    assert two == five
+
+
+def test_identifiers_with_digits_are_kept():
+    assert fingerprint('SELECT col2 FROM table1') == 'SELECT col2 FROM table1'
+
+
+def test_percentile_is_the_upper_bound_of_its_bucket():
+    histogram = Histogram()
+    for ms in [0.5] * 50 + [7] * 45 + [40] * 5:
+        histogram.observe(ms)
+    assert histogram.percentile(0.5) == 1
+    assert histogram.percentile(0.95) == 10
+    assert histogram.percentile(0.99) == 50
+
+
+def test_percentile_of_an_empty_histogram_is_none():
+    assert Histogram().percentile(0.5) is None
+
+
+def test_percentile_past_the_last_bucket_is_none():
+    histogram = Histogram()
+    histogram.observe(BUCKETS_MS[-1] + 1)
+    assert histogram.percentile(0.5) is None
+    assert histogram.to_dict()['buckets']['inf'] == 1
+
+
+def test_bucket_bounds_are_inclusive():
+    histogram = Histogram()
+    histogram.observe(5)
+    assert histogram.to_dict()['buckets']['le_5'] == 1
+
+
+def test_statements_beyond_the_limit_are_counted_as_other():
+    instrumentation = SQLInstrumentation(max_statements=2, slow_ms=1e9)
+    for table in ('a', 'b', 'c', 'd'):
+        instrumentation.record(f'SELECT * FROM {table}', 1.0)
+    statements = {s['sql']: s['count'] for s in instrumentation.snapshot()['statements']}
+    assert statements == {'SELECT * FROM a': 1, 'SELECT * FROM b': 1, '<other>': 2}
+
+
+def test_repeated_statement_in_one_request_is_logged(caplog):
+    instrumentation = SQLInstrumentation(n_plus_one=3, slow_ms=1e9)
+    token = instrumentation.begin_request('orders')
+    for order_id in range(3):
+        instrumentation.record(f'SELECT * FROM orders WHERE order_id = {order_id}', 1.0)
+    with caplog.at_level(logging.WARNING, logger='sql_instrumentation'):
+        stats = instrumentation.end_request(token)
+    assert stats.queries == 3
+    assert 'Possible N+1 in orders: 3 executions' in caplog.text
+    route = instrumentation.snapshot()['routes'][0]
+    assert (route['route'], route['requests'], route['max_queries']) == ('orders', 1, 3)
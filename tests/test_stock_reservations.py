@@ -0,0 +1,70 @@
+import threading
+
+import psycopg2
+import pytest
+
+import database
+from database import create_order, process_order, update_stock
+
+
+def test_order_reserves_stock_until_it_is_sold(make_product, stock):
+    product = make_product(quantity=10)
+    order_id, status = create_order(product, 4, added_by=1)
+    assert status == 'Pending'
+    assert stock(product) == (10, 4)
+    process_order(order_id, 'Approved', processed_by=1)
+    assert stock(product) == (6, 0)
+
+
+def test_order_cannot_reserve_more_than_is_available(make_product, stock):
+    product = make_product(quantity=5)
+    create_order(product, 3, added_by=1)
+    with pytest.raises(psycopg2.Error, match=r'Insufficient stock \(Available: 2\)'):
+        create_order(product, 3, added_by=1)
+    assert stock(product) == (5, 3)
+
+
+def test_direct_sale_cannot_take_reserved_stock(make_product, stock):
+    product = make_product(quantity=5)
+    create_order(product, 4, added_by=1)
+    with pytest.raises(psycopg2.Error, match='Available: 1, Requested: 2'):
+        update_stock(product, 2, 'Sale', performed_by=1)
+    update_stock(product, 1, 'Sale', performed_by=1)
+    assert stock(product) == (4, 4)
+
+
+def test_cancel_releases_and_pending_reserves_again(make_product, stock):
+    product = make_product(quantity=5)
+    order_id, _ = create_order(product, 5, added_by=1)
+    process_order(order_id, 'Cancelled', processed_by=1)
+    assert stock(product) == (5, 0)
+    process_order(order_id, 'Pending', processed_by=1)
+    assert stock(product) == (5, 5)
+
+
+def test_concurrent_orders_cannot_oversell(make_product, stock):
+    product = make_product(quantity=10)
+    barrier = threading.Barrier(8)
+    placed, refused = [], []
+
+    def order():
+        conn = psycopg2.connect(**database.DB_CONFIG)
+        try:
+            cur = conn.cursor()
+            barrier.wait(5)
+            cur.execute("CALL create_order(%s, 3, 1, NULL, NULL, NULL)", (product,))
+            conn.commit()
+            placed.append(1)
+        except psycopg2.Error:
+            conn.rollback()
+            refused.append(1)
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=order) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert (len(placed), len(refused)) == (3, 5)
+    assert stock(product) == (10, 9)
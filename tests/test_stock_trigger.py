@@ -0,0 +1,55 @@
+import psycopg2.errors
+import pytest
+
+
+def insert_movements(db, product, movements):
+    """Insert (transaction_type, quantity) rows for a product in one statement."""
+    cur = db.cursor()
+    args = ', '.join(cur.mogrify('(%s, %s, %s, 1)', (product, kind, quantity)).decode()
+                     for kind, quantity in movements)
+    cur.execute("INSERT INTO transactions (product_id, transaction_type, quantity, performed_by) "
+                f"VALUES {args} RETURNING transaction_id")
+    return [row[0] for row in cur.fetchall()]
+
+
+def quantity_audit(db, product):
+    cur = db.cursor()
+    cur.execute("""
+        SELECT (old_values->>'quantity')::INTEGER, (new_values->>'quantity')::INTEGER
+        FROM audit_log
+        WHERE table_name = 'products' AND record_id = %s AND old_values ? 'quantity'
+        ORDER BY log_id
+    """, (product,))
+    return cur.fetchall()
+
+
+def test_one_statement_moves_stock_by_the_net_change(db, make_product, stock):
+    product = make_product(quantity=10)
+    insert_movements(db, product, [('Sale', 3), ('Purchase', 5), ('Return', 1), ('Sale', 2)])
+    assert stock(product) == (11, 0)
+
+
+def test_each_transaction_gets_its_own_audit_step(db, make_product):
+    product = make_product(quantity=10)
+    insert_movements(db, product, [('Sale', 3), ('Purchase', 5), ('Sale', 2)])
+    assert quantity_audit(db, product) == [(10, 7), (7, 12), (12, 10)]
+
+
+def test_statement_spanning_products_updates_each_once(db, make_product, stock):
+    first, second = make_product(quantity=10), make_product(quantity=20)
+    cur = db.cursor()
+    cur.execute("""
+        INSERT INTO transactions (product_id, transaction_type, quantity, performed_by)
+        VALUES (%s, 'Sale', 4, 1), (%s, 'Adjustment', 6, 1), (%s, 'Purchase', 1, 1)
+    """, (first, second, first))
+    assert stock(first) == (7, 0)
+    assert stock(second) == (26, 0)
+    assert quantity_audit(db, first) == [(10, 6), (6, 7)]
+
+
+def test_overselling_statement_fails_as_a_whole(db, make_product, stock):
+    product = make_product(quantity=2)
+    with pytest.raises(psycopg2.errors.CheckViolation):
+        insert_movements(db, product, [('Purchase', 1), ('Sale', 5)])
+    assert stock(product) == (2, 0)
+    assert quantity_audit(db, product) == []
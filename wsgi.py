@@ -0,0 +1,92 @@
+"""Production entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+app.py registers its routes on a module-level Flask app; create_app()
+applies the production settings to it. The helpers below manage the
+per-process resources app.py sets up, so that the gunicorn hooks in
+gunicorn.conf.py can run them around fork() and at worker exit:
+  * the database pools
+  * caches and request statistics
+  * the background drainers (audit queue, counters, table changes)
+  * the metrics files
+"""
+import logging
+import os
+
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+logger = logging.getLogger(__name__)
+
+
+def create_app():
+    import app as ims
+
+    application = ims.app
+    secret_key = os.environ.get('IMS_SECRET_KEY')
+    if secret_key:
+        application.secret_key = secret_key
+    else:
+        logger.warning('IMS_SECRET_KEY is not set; sessions are signed with the built-in '
+                       'development key')
+    # Number of trusted proxies in front of the app (load balancer, nginx...)
+    proxies = int(os.environ.get('IMS_PROXY_COUNT', 0))
+    if proxies:
+        application.wsgi_app = ProxyFix(application.wsgi_app, x_for=proxies, x_proto=proxies,
+                                        x_host=proxies)
+    return application
+
+
+def release_process_resources():
+    """Stop background threads and close pooled connections in this process.
+
+    Run in the gunicorn master before it forks (with preload_app), so that no
+    worker inherits a live connection or a thread's half-held lock.
+    """
+    import app as ims
+    import database
+
+    ims.stop_background_jobs()
+    database.metrics_registry.stop()
+    database.set_pool(None)
+
+
+def init_worker():
+    """Start this worker's own copies of the per-process resources.
+
+    Runs in every worker once it has loaded the app, with or without
+    preload_app.
+    """
+    import app as ims
+    import database
+
+    # A pool inherited from the master resets itself on first use
+    # (ConnectionPool._check_fork); caches and statistics start empty.
+    ims.user_cache.clear()
+    database.sales_report_cache.clear()
+    database.supplier_cache.clear()
+    if database.sql_instrumentation is not None:
+        database.sql_instrumentation.reset()
+    # Off when a dedicated `flask run-background-jobs` process runs them
+    if os.environ.get('IMS_BACKGROUND_JOBS', '1') == '1':
+        ims.start_background_jobs()
+
+
+def shutdown_worker():
+    """Drain the audit queue, write final metrics and close connections."""
+    import app as ims
+    import database
+
+    ims.stop_background_jobs()
+    if database.AUDIT_MODE == 'async':
+        # Hand queued audit events over before the worker goes away
+        ims.audit_flusher.drain_all()
+    ims.dashboard_metrics.stop()
+    ims.notification_broker.stop()
+    if database.metrics_registry.directory:
+        database.metrics_registry.flush()
+    database.metrics_registry.stop()
+    database.set_pool(None)
+
+
+app = create_app()